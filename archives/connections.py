@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+
+def is_open(connection):
+    """
+    Returns True if the ssh and sftp sessions of the connection are still
+    usable.
+    """
+    ssh_client, sftp_client = connection
+    transport = ssh_client.get_transport()
+    return bool(transport is not None and transport.is_active() and
+                not sftp_client.sock.closed)
+
+
+def close(connection):
+    """
+    Closes the connection, ignoring errors from connections that have already
+    gone away.
+    """
+    ssh_client, sftp_client = connection
+    try:
+        sftp_client.close()
+        ssh_client.close()
+    except Exception:
+        logging.exception("Error closing ssh connection")
+
+
+class SshConnectionPool(object):
+    """
+    A pool of open ssh connections to archives, shared by everything in this
+    worker process, so that each task doesn't connect and authenticate again.
+
+    A connection is an (SSHClient, SFTPClient) pair, used by one transport at
+    a time, which runs its commands on channels of the same connection.
+    Connections are keyed by the archive and its connection details, so
+    changing the details of an archive will never reuse an old connection.
+
+    At most max_build_concurrency connections to an archive are kept, and they
+    are closed once they've been idle for ARCHIVE_SSH_MAX_IDLE seconds.
+    """
+    def __init__(self):
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get_key(self, archive):
+        return (archive.pk, archive.host, archive.username,
+                archive.ssh_credentials_id)
+
+    def _pop_expired(self):
+        """
+        Removes and returns the connections that have been idle for too long.
+        Must be called with the lock held.
+        """
+        max_idle = getattr(settings, "ARCHIVE_SSH_MAX_IDLE", 300)
+        now = time.time()
+        expired = []
+        for key, idle in self._idle.items():
+            expired.extend(
+                connection for connection, since in idle
+                if now - since > max_idle)
+            idle[:] = [x for x in idle if now - x[1] <= max_idle]
+            if not idle:
+                del self._idle[key]
+        return expired
+
+    def acquire(self, archive, factory):
+        """
+        Returns an idle connection to the archive that's still open, or a new
+        connection from factory.
+        """
+        key = self.get_key(archive)
+        while True:
+            with self._lock:
+                expired = self._pop_expired()
+                idle = self._idle.get(key)
+                connection = idle.pop()[0] if idle else None
+            for x in expired:
+                close(x)
+            if connection is None:
+                return factory()
+            if is_open(connection):
+                return connection
+            close(connection)
+
+    def release(self, archive, connection):
+        """
+        Returns the connection to the pool, or closes it if it's no longer
+        open or the pool already has enough idle connections to the archive.
+        """
+        if is_open(connection):
+            key = self.get_key(archive)
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < archive.max_build_concurrency:
+                    idle.append((connection, time.time()))
+                    return
+        close(connection)
+
+    def invalidate(self, archive_pk):
+        """
+        Closes the idle connections to the archive with archive_pk.
+        """
+        with self._lock:
+            keys = [x for x in self._idle if x[0] == archive_pk]
+            connections = [
+                x[0] for key in keys for x in self._idle.pop(key)]
+        for connection in connections:
+            close(connection)
+
+    def clear(self):
+        with self._lock:
+            connections = [x[0] for idle in self._idle.values() for x in idle]
+            self._idle.clear()
+        for connection in connections:
+            close(connection)
+
+
+connections = SshConnectionPool()
@@ -1,13 +1,17 @@
 import logging
+import posixpath
 import urlparse
 from collections import OrderedDict
 
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.utils.encoding import python_2_unicode_compatible
 
 from jenkins.models import Artifact, Build
 from credentials.models import SshKeyPair
 from projects.models import ProjectBuildDependency, Dependency
+from archives.connections import connections
 from archives.policies import CdimageArchivePolicy, DefaultPolicy
 from archives.transports import SshTransport, LocalTransport
 
@@ -32,6 +36,11 @@ class Archive(models.Model):
         max_length=64, choices=[(p, p) for p in TRANSPORTS.keys()])
     default = models.BooleanField(default=False)
     base_url = models.CharField(max_length=200, blank=True, default="")
+    # Each build is archived on its own, so archiving several builds at once
+    # uses this many connections for each of them.
+    max_build_concurrency = models.PositiveIntegerField(
+        default=4,
+        help_text="The most artifacts of each build to archive at once")
 
     def __str__(self):
         return self.name
@@ -77,7 +86,7 @@ class Archive(models.Model):
         items = OrderedDict()
         for artifact in build.artifact_set.all():
             logging.info("Adding artifact %s", artifact)
-            for dependency in build.job.dependency_set.all():
+            for dependency in Dependency.objects.for_job(build.job):
                 items.setdefault(artifact, []).append(self.add_artifact(
                     artifact, build, dependency=dependency))
         return items
@@ -121,6 +130,37 @@ class Archive(models.Model):
         """
         return self.items.filter(build=build)
 
+    def get_checksums_for_directory(self, directory, existing=None):
+        """
+        Returns a list of (filename, sha256) pairs for the project build
+        artifacts archived in the directory, with their recorded checksums.
+
+        Artifacts archived before checksums were recorded take theirs from
+        existing, the entries of the current checksum file, if it has them.
+        """
+        existing = existing or {}
+        checksums = OrderedDict()
+        items = self.items.filter(
+            archived_path__startswith=directory.rstrip("/") + "/",
+            projectbuild_dependency__isnull=False)
+        for item in items:
+            dirname, filename = posixpath.split(item.archived_path)
+            if dirname != directory:
+                continue
+            sha256 = item.sha256 or existing.get(filename)
+            if sha256:
+                checksums[filename] = sha256
+        return checksums.items()
+
+
+@receiver(post_save, sender=Archive)
+@receiver(post_delete, sender=Archive)
+def invalidate_archive_connections(sender, instance, **kwargs):
+    """
+    Close any pooled connections when the archive details change.
+    """
+    connections.invalidate(instance.pk)
+
 
 @python_2_unicode_compatible
 class ArchiveArtifact(models.Model):
@@ -130,6 +170,8 @@ class ArchiveArtifact(models.Model):
     archived_at = models.DateTimeField(blank=True, null=True)
     archived_path = models.CharField(max_length=255, blank=True, null=True)
     archived_size = models.IntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True, default="")
+    failed_at = models.DateTimeField(blank=True, null=True)
 
     build = models.ForeignKey(Build, blank=True, null=True)
     projectbuild_dependency = models.ForeignKey(
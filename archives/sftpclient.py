@@ -1,13 +1,45 @@
+import errno
+import posixpath
+
 from paramiko import SFTPClient as BaseSFTPClient
 
 
 class SFTPClient(BaseSFTPClient):
+    def makedirs(self, path):
+        """
+        Creates the remote directory and any missing parents, like
+        os.makedirs.
+        """
+        missing = []
+        while path not in ("", "/"):
+            try:
+                self.stat(path)
+                break
+            except IOError:
+                missing.append(path)
+                path = posixpath.dirname(path)
+        for path in reversed(missing):
+            try:
+                self.mkdir(path)
+            except IOError:
+                # Another upload may have created it since.
+                self.stat(path)
+
     def stream_file_to_remote(self, fileobj, remotepath):
         """
         Reads from fileobj and streams it to a remote server over ssh.
+
+        The directory for remotepath is only created if opening the file
+        fails because it's missing.
         """
         try:
-            fr = self.file(remotepath, "wb")
+            try:
+                fr = self.file(remotepath, "wb")
+            except IOError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                self.makedirs(posixpath.dirname(remotepath))
+                fr = self.file(remotepath, "wb")
             fr.set_pipelined(True)
             size = 0
             try:
@@ -1,18 +1,81 @@
 import logging
+import posixpath
 
+from django.db import transaction
 from django.utils import timezone
 
-from celery import shared_task, chain
+from celery import shared_task, group
 
 from archives.helpers import get_default_archive
-from archives.models import ArchiveArtifact
+from archives.models import Archive, ArchiveArtifact
 from jenkins.models import Build
 
 
+def get_outstanding_artifacts(build_pk, archive_pk):
+    """
+    Returns the ArchiveArtifacts of the build in the archive that haven't
+    been archived, and haven't failed to be.
+    """
+    return ArchiveArtifact.objects.filter(
+        archive=archive_pk, build=build_pk, archived_at__isnull=True,
+        failed_at__isnull=True)
+
+
+def mark_archived(item, size, sha256=""):
+    """
+    Records that the ArchiveArtifact has been archived with size bytes, and
+    the SHA-256 of the content.
+
+    The task that archives the last outstanding artifact of a build in the
+    archive queues generate_checksums for the build.
+    """
+    with transaction.atomic():
+        # Lock the build, so that only one task sees the last artifact land.
+        if item.build_id:
+            Build.objects.select_for_update().get(pk=item.build_id)
+        already_archived = ArchiveArtifact.objects.filter(
+            pk=item.pk, archived_at__isnull=False).exists()
+        item.archived_at = timezone.now()
+        item.archived_size = size
+        item.sha256 = sha256
+        item.failed_at = None
+        item.save()
+        finished = item.build_id and not already_archived and not (
+            get_outstanding_artifacts(item.build_id, item.archive_id).exists())
+    if finished:
+        generate_checksums.delay(item.build_id, item.archive_id)
+
+
+def mark_failed(archiveartifact_pks):
+    """
+    Records that archiving the ArchiveArtifacts failed, so that their builds
+    can finish archiving without them.
+
+    As with mark_archived, generate_checksums is queued for a build if this
+    leaves nothing outstanding.
+    """
+    finished = set()
+    for item in ArchiveArtifact.objects.filter(pk__in=archiveartifact_pks):
+        with transaction.atomic():
+            if item.build_id:
+                Build.objects.select_for_update().get(pk=item.build_id)
+            failed = ArchiveArtifact.objects.filter(
+                pk=item.pk, archived_at__isnull=True,
+                failed_at__isnull=True).update(failed_at=timezone.now())
+            if failed and item.build_id and not get_outstanding_artifacts(
+                    item.build_id, item.archive_id).exists():
+                finished.add((item.build_id, item.archive_id))
+    for build_pk, archive_pk in finished:
+        generate_checksums.delay(build_pk, archive_pk)
+
+
 @shared_task
-def archive_artifact_from_jenkins(archiveartifact_pk):
+def archive_artifact_from_jenkins(archiveartifact_pk, link_pks=()):
     """
     Schedule the transfer of the file in the artifact to the specified archive.
+
+    Once it has been archived, linking it to the ArchiveArtifacts in link_pks
+    is queued as a single task.
     """
     item = ArchiveArtifact.objects.get(pk=archiveartifact_pk)
     logging.info("Archiving %s in archive %s", item, item.archive)
@@ -21,15 +84,36 @@ def archive_artifact_from_jenkins(archiveartifact_pk):
     artifact = item.artifact
     server = artifact.build.job.server
     transport.start()
-    logging.info("  %s -> %s", artifact.url, item.archived_path)
-    size = transport.archive_url(
-        item.artifact.url, item.archived_path,
-        username=server.username, password=server.password)
+    try:
+        logging.info("  %s -> %s", artifact.url, item.archived_path)
+        size = transport.archive_url(
+            item.artifact.url, item.archived_path,
+            username=server.username, password=server.password)
+    except Exception:
+        transport.end(failed=True)
+        raise
     transport.end()
-    item.archived_at = timezone.now()
-    item.archived_size = size
-    item.save()
+    mark_archived(item, size, transport.checksums.get(item.archived_path, ""))
     logging.info("  archived at %s", item.archived_at)
+    if link_pks:
+        link_artifacts_in_archive.delay(item.pk, list(link_pks))
+
+
+@shared_task
+def archive_artifacts(items):
+    """
+    Archives each of the (archiveartifact_pk, link_pks) pairs in items one
+    after another, with archive_artifact_from_jenkins.
+
+    If an artifact can't be archived, it's logged and marked as failed with
+    its links, and the rest of the items are still archived.
+    """
+    for archiveartifact_pk, link_pks in items:
+        try:
+            archive_artifact_from_jenkins(archiveartifact_pk, link_pks)
+        except Exception:
+            logging.exception("Could not archive %s", archiveartifact_pk)
+            mark_failed([archiveartifact_pk] + list(link_pks))
 
 
 @shared_task
@@ -38,22 +122,46 @@ def link_artifact_in_archive(source_pk, destination_pk):
     This task uses the underlying transport to link the source archiveartifact
     to the destination archiveartifact without duplicating the file.
     """
-    destination = ArchiveArtifact.objects.get(pk=destination_pk)
+    link_artifacts_in_archive(source_pk, [destination_pk])
+
+
+@shared_task
+def link_artifacts_in_archive(source_pk, destination_pks):
+    """
+    Links the source archiveartifact to each of the destination
+    archiveartifacts, with a single call to the transport.
+
+    Only the destinations that were linked are marked as archived.
+    """
     source = ArchiveArtifact.objects.get(pk=source_pk)
-    logging.info("Archiving %s in archive %s", destination, source.archive)
+    destinations = list(ArchiveArtifact.objects.filter(pk__in=destination_pks))
+    logging.info(
+        "Archiving %d links to %s in archive %s", len(destinations), source,
+        source.archive)
 
     transport = source.archive.get_transport()
     transport.start()
-    logging.info("  %s -> %s", source.archived_path, destination.archived_path)
-
-    transport.link_filename_to_filename(
-        source.archived_path, destination.archived_path)
+    try:
+        for destination in destinations:
+            logging.info(
+                "  %s -> %s", source.archived_path, destination.archived_path)
+        results = transport.link_filename_to_filenames(
+            source.archived_path,
+            [destination.archived_path for destination in destinations])
+    except Exception:
+        transport.end(failed=True)
+        mark_failed([destination.pk for destination in destinations])
+        raise
     transport.end()
-    destination.archived_at = timezone.now()
-    destination.archived_size = source.archived_size
-    destination.save()
-    logging.info("  archived at %s", destination.archived_at)
-    destination.save()
+    for destination, linked in zip(destinations, results):
+        if linked:
+            mark_archived(destination, source.archived_size, source.sha256)
+            logging.info("  archived at %s", destination.archived_at)
+        else:
+            logging.error(
+                "Could not link %s to %s", source.archived_path,
+                destination.archived_path)
+            mark_failed([destination.pk])
 
 
 # TODO Workout some sort of decorator so these functions don't have to return
@@ -63,6 +171,11 @@ def process_build_artifacts(build_pk):
     """
     This task should be triggered after we've imported the artifacts from
     Jenkins for a build.
+
+    The artifacts are shared between at most the max_build_concurrency of the
+    archive_artifacts tasks, each archiving its share one after
+    another, and the checksums are generated once every artifact has been
+    archived or has failed.
     """
     build = Build.objects.get(pk=build_pk)
     logging.info(
@@ -71,30 +184,75 @@ def process_build_artifacts(build_pk):
     if archive:
         items = archive.add_build(build)
         logging.info("Archiving %s", items)
-        for artifact, files in items.items():
-            first, rest = files[0], files[1:]
-            chain(
-                archive_artifact_from_jenkins.si(first.pk),
-                *[link_artifact_in_archive.si(first.pk, item.pk) for item in
-                  rest]).apply()
+        pairs = [
+            (files[0].pk, [item.pk for item in files[1:]])
+            for files in items.values()]
+        lanes = min(archive.max_build_concurrency, len(pairs))
+        if lanes:
+            group(
+                archive_artifacts.si(pairs[lane::lanes])
+                for lane in range(lanes)).apply_async()
     else:
         logging.info("No default archiver - build not automatically archived.")
     return build_pk
 
 
 @shared_task
-def generate_checksums(build_pk):
+def generate_checksums(build_pk, archive_pk=None):
     """
-    This task should ask the archive transport to generate checksum files
-    for each project build the specified build has caused.
+    This task should ask the archive transport to write the checksum file in
+    each directory the project builds the specified build has caused were
+    archived in.
+
+    The files are written from the checksums recorded as the artifacts were
+    archived, and list every project build artifact in the directory, keeping
+    the existing entries for artifacts archived without a recorded checksum.
+    The default archive is used unless archive_pk is provided.
+
+    No lock is held while the files are written, instead each file is written
+    again if the checksums recorded for its directory changed meanwhile, so
+    that a task writing older checksums can't have the last word.
     """
     build = Build.objects.get(pk=build_pk)
-    archive = get_default_archive()
+    if archive_pk is None:
+        archive = get_default_archive()
+    else:
+        archive = Archive.objects.get(pk=archive_pk)
+    if archive is None:
+        logging.info("No default archiver - no checksums generated.")
+        return
+    directories = set(
+        posixpath.dirname(x.archived_path) for x in
+        archive.get_archived_artifacts_for_build(build).filter(
+            projectbuild_dependency__isnull=False))
+    if not directories:
+        return
     transport = archive.get_transport()
-    archived_artifacts = archive.get_archived_artifacts_for_build(build)
     transport.start()
-    for artifact in archived_artifacts:
-        if artifact.projectbuild_dependency:
-            logging.info("Generating checksums for %s" % artifact)
-            transport.generate_checksums(artifact)
+    try:
+        # Keep the entries of artifacts archived before checksums were
+        # recorded.
+        existing = dict(
+            (directory, transport.read_checksum_file(directory))
+            for directory in directories)
+        results = {}
+        while directories:
+            checksum_files = {}
+            for directory in directories:
+                logging.info("Generating checksums for %s" % directory)
+                checksum_files[directory] = (
+                    archive.get_checksums_for_directory(
+                        directory, existing[directory]))
+            results.update(transport.write_checksum_files(checksum_files))
+            directories = [
+                directory for directory in checksum_files
+                if results[directory] and checksum_files[directory] !=
+                archive.get_checksums_for_directory(
+                    directory, existing[directory])]
+    except Exception:
+        transport.end(failed=True)
+        raise
     transport.end()
+    for directory, written in results.items():
+        if not written:
+            logging.error("Could not write checksums for %s" % directory)
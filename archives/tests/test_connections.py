@@ -0,0 +1,171 @@
+from __future__ import unicode_literals
+
+from django.test import TestCase
+from django.test.utils import override_settings
+import mock
+
+from archives.connections import SshConnectionPool, is_open
+from .factories import ArchiveFactory
+
+
+def get_connection(active=True):
+    """
+    Returns an (SSHClient, SFTPClient) pair of mocks.
+    """
+    ssh_client = mock.Mock()
+    ssh_client.get_transport.return_value.is_active.return_value = active
+    sftp_client = mock.Mock()
+    sftp_client.sock.closed = not active
+    return ssh_client, sftp_client
+
+
+class IsOpenTest(TestCase):
+
+    def test_is_open(self):
+        """
+        A connection is open if its ssh transport is active and the sftp
+        channel isn't closed.
+        """
+        self.assertTrue(is_open(get_connection()))
+        self.assertFalse(is_open(get_connection(active=False)))
+
+        ssh_client, sftp_client = get_connection()
+        sftp_client.sock.closed = True
+        self.assertFalse(is_open((ssh_client, sftp_client)))
+
+    def test_is_open_with_closed_client(self):
+        """
+        A closed SSHClient has no transport.
+        """
+        ssh_client, sftp_client = get_connection()
+        ssh_client.get_transport.return_value = None
+        self.assertFalse(is_open((ssh_client, sftp_client)))
+
+
+class SshConnectionPoolTest(TestCase):
+
+    def setUp(self):
+        self.archive = ArchiveFactory.create(max_build_concurrency=2)
+        self.pool = SshConnectionPool()
+
+    def test_acquire(self):
+        """
+        With no idle connections, acquire should create a new connection.
+        """
+        connection = get_connection()
+        factory = mock.Mock(return_value=connection)
+
+        self.assertEqual(connection, self.pool.acquire(self.archive, factory))
+        factory.assert_called_once_with()
+
+    def test_acquire_reuses_released_connections(self):
+        """
+        A released connection should be returned by the next acquire.
+        """
+        connection = get_connection()
+        self.pool.release(self.archive, connection)
+
+        factory = mock.Mock()
+        self.assertEqual(connection, self.pool.acquire(self.archive, factory))
+        self.assertFalse(factory.called)
+
+    def test_acquire_discards_closed_connections(self):
+        """
+        Idle connections that have been closed should be discarded.
+        """
+        closed = get_connection()
+        self.pool.release(self.archive, closed)
+        closed[0].get_transport.return_value.is_active.return_value = False
+        connection = get_connection()
+
+        self.assertEqual(
+            connection,
+            self.pool.acquire(self.archive, lambda: connection))
+        closed[0].close.assert_called_once_with()
+
+    def test_acquire_for_other_archive(self):
+        """
+        Connections shouldn't be shared between archives, or when the
+        details of an archive change.
+        """
+        connection = get_connection()
+        self.pool.release(self.archive, connection)
+        other = ArchiveFactory.create()
+        factory = mock.Mock(return_value=get_connection())
+
+        self.pool.acquire(other, factory)
+        self.archive.host = "other.example.com"
+        self.pool.acquire(self.archive, factory)
+
+        self.assertEqual(2, factory.call_count)
+
+    @override_settings(ARCHIVE_SSH_MAX_IDLE=60)
+    def test_acquire_evicts_idle_connections(self):
+        """
+        Connections that have been idle for longer than ARCHIVE_SSH_MAX_IDLE
+        should be closed.
+        """
+        connection = get_connection()
+        with mock.patch("archives.connections.time.time", return_value=100):
+            self.pool.release(self.archive, connection)
+        with mock.patch("archives.connections.time.time", return_value=161):
+            self.pool.acquire(self.archive, get_connection)
+
+        connection[0].close.assert_called_once_with()
+        connection[1].close.assert_called_once_with()
+
+    def test_release_closed_connection(self):
+        """
+        Connections that have been closed shouldn't be kept.
+        """
+        connection = get_connection(active=False)
+        self.pool.release(self.archive, connection)
+
+        connection[0].close.assert_called_once_with()
+        factory = mock.Mock()
+        self.pool.acquire(self.archive, factory)
+        factory.assert_called_once_with()
+
+    def test_release_keeps_max_build_concurrency(self):
+        """
+        At most max_build_concurrency idle connections to an archive are kept.
+        """
+        connections = [get_connection() for x in range(3)]
+        for connection in connections:
+            self.pool.release(self.archive, connection)
+
+        self.assertFalse(connections[1][0].close.called)
+        connections[2][0].close.assert_called_once_with()
+
+    def test_invalidate(self):
+        """
+        invalidate should close the idle connections to the archive.
+        """
+        connection = get_connection()
+        self.pool.release(self.archive, connection)
+
+        self.pool.invalidate(self.archive.pk)
+
+        connection[0].close.assert_called_once_with()
+        factory = mock.Mock()
+        self.pool.acquire(self.archive, factory)
+        factory.assert_called_once_with()
+
+
+class InvalidateArchiveConnectionsTest(TestCase):
+
+    def test_invalidated_when_archive_changes(self):
+        """
+        Saving or deleting an archive should close its pooled connections.
+        """
+        archive = ArchiveFactory.create()
+
+        with mock.patch(
+                "archives.models.connections.invalidate") as mock_invalidate:
+            archive.save()
+            archive_pk = archive.pk
+            archive.delete()
+
+        self.assertEqual(
+            [mock.call(archive_pk), mock.call(archive_pk)],
+            mock_invalidate.call_args_list)
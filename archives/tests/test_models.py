@@ -10,7 +10,7 @@ from jenkins.tests.factories import BuildFactory, ArtifactFactory
 from projects.tasks import (
     update_projectbuilds, create_projectbuilds_for_autotracking)
 from projects.tests.factories import DependencyFactory, ProjectFactory
-from projects.models import ProjectDependency
+from projects.models import ProjectDependency, ProjectBuildDependency
 from credentials.tests.factories import SshKeyPairFactory
 from .factories import ArchiveFactory
 from projects.helpers import build_project
@@ -131,6 +131,41 @@ class ArchiveTest(TestCase):
             [(artifact, build)],
             [(x.artifact, x.build) for x in archived])
 
+    def test_get_checksums_for_directory(self):
+        """
+        We can fetch the recorded checksums of the project build artifacts
+        archived directly in a directory.
+        """
+        project = ProjectFactory.create()
+        dependency = DependencyFactory.create()
+        ProjectDependency.objects.create(
+            project=project, dependency=dependency)
+        projectbuild = build_project(project, queue_build=False)
+        build = BuildFactory.create(
+            job=dependency.job, build_id=projectbuild.build_key)
+        projectbuild_dependency = ProjectBuildDependency.objects.create(
+            build=build, projectbuild=projectbuild, dependency=dependency)
+        archive = ArchiveFactory.create()
+        for path, sha256, pbd in [
+                ("/srv/a/artifact2", "def", projectbuild_dependency),
+                ("/srv/a/artifact1", "abc", projectbuild_dependency),
+                ("/srv/a/b/artifact3", "ghi", projectbuild_dependency),
+                ("/srv/a/unhashed", "", projectbuild_dependency),
+                ("/srv/a/dependency", "jkl", None)]:
+            ArchiveArtifact.objects.create(
+                archive=archive, artifact=ArtifactFactory.create(build=build),
+                build=build, archived_path=path, sha256=sha256,
+                projectbuild_dependency=pbd)
+
+        self.assertEqual(
+            [("artifact1", "abc"), ("artifact2", "def")],
+            archive.get_checksums_for_directory("/srv/a"))
+        # Artifacts without a recorded checksum keep their existing entry.
+        self.assertEqual(
+            [("artifact1", "abc"), ("artifact2", "def"), ("unhashed", "mno")],
+            archive.get_checksums_for_directory(
+                "/srv/a", {"unhashed": "mno", "artifact1": "old"}))
+
     def test_get_archived_artifact_artifact_not_in_archive(self):
         """
         If the specified build is not recorded in the archive then we should
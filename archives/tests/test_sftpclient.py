@@ -0,0 +1,82 @@
+from __future__ import unicode_literals
+
+import errno
+from io import BytesIO
+
+from django.test import TestCase
+import mock
+
+from archives.sftpclient import SFTPClient
+
+
+class SFTPClientTest(TestCase):
+
+    def get_client(self, existing):
+        """
+        Returns an SFTPClient for a remote server with the existing paths.
+        """
+        client = mock.Mock(spec=SFTPClient)
+        existing = set(existing)
+
+        def stat(path):
+            if path not in existing:
+                raise IOError(errno.ENOENT, "No such file")
+            return mock.Mock(st_size=0)
+
+        client.stat.side_effect = stat
+        client.mkdir.side_effect = existing.add
+        return client
+
+    def test_makedirs(self):
+        """
+        makedirs should create the missing directories, parents first.
+        """
+        client = self.get_client(["/var"])
+
+        SFTPClient.makedirs.im_func(client, "/var/tmp/temp")
+
+        client.assert_has_calls([
+            mock.call.stat("/var/tmp/temp"), mock.call.stat("/var/tmp"),
+            mock.call.stat("/var"), mock.call.mkdir("/var/tmp"),
+            mock.call.mkdir("/var/tmp/temp")])
+
+    def test_makedirs_existing(self):
+        """
+        If the directory exists, nothing should be created.
+        """
+        client = self.get_client(["/var/tmp"])
+
+        SFTPClient.makedirs.im_func(client, "/var/tmp")
+
+        self.assertFalse(client.mkdir.called)
+
+    def test_stream_file_to_remote_missing_directory(self):
+        """
+        If the directory for the file is missing, it should be created and the
+        upload retried.
+        """
+        client = self.get_client([])
+        remote = mock.Mock()
+        client.file.side_effect = [
+            IOError(errno.ENOENT, "No such file"), remote]
+        client.makedirs.side_effect = lambda path: None
+        client.stat.side_effect = lambda path: mock.Mock(st_size=8)
+
+        size = SFTPClient.stream_file_to_remote.im_func(
+            client, BytesIO(b"artifact"), "/var/tmp/temp.gz")
+
+        self.assertEqual(8, size)
+        client.makedirs.assert_called_once_with("/var/tmp")
+        remote.write.assert_called_once_with(b"artifact")
+
+    def test_stream_file_to_remote_other_errors(self):
+        """
+        Other errors opening the file should be raised.
+        """
+        client = self.get_client([])
+        client.file.side_effect = IOError(errno.EACCES, "Permission denied")
+
+        with self.assertRaises(IOError):
+            SFTPClient.stream_file_to_remote.im_func(
+                client, BytesIO(b"artifact"), "/var/tmp/temp.gz")
+        self.assertFalse(client.makedirs.called)
@@ -1,6 +1,7 @@
 from __future__ import unicode_literals
 
 from io import StringIO
+import hashlib
 import os
 import shutil
 import tempfile
@@ -12,7 +13,8 @@ import mock
 
 from archives.tasks import (
     archive_artifact_from_jenkins, process_build_artifacts,
-    link_artifact_in_archive, generate_checksums)
+    link_artifact_in_archive, link_artifacts_in_archive, generate_checksums,
+    mark_archived, mark_failed)
 from archives.models import Archive, ArchiveArtifact
 from archives.transports import Transport, LocalTransport
 from jenkins.tests.factories import ArtifactFactory, BuildFactory
@@ -35,16 +37,25 @@ class LoggingTransport(Transport):
     def start(self):
         self.log.append("START")
 
-    def end(self):
-        self.log.append("END")
+    def end(self, failed=False):
+        self.log.append("END FAILED" if failed else "END")
 
     def archive_url(self, url, path, username, password):
         self.log.append("%s -> %s %s:%s" % (url, path, username, password))
+        self.checksums[path] = hashlib.sha256(url).hexdigest()
         return 0
 
-    def generate_checksums(self, archived_artifact):
-        self.log.append(
-            "Checksums generated for %s" % archived_artifact)
+    def read_checksum_file(self, directory):
+        return {}
+
+    def write_checksum_files(self, checksum_files):
+        for directory, checksums in sorted(checksum_files.items()):
+            self.log.append("Checksums written to %s for %s" % (
+                directory, ", ".join(x[0] for x in checksums)))
+        return dict((directory, True) for directory in checksum_files)
+
+    def link_filename_to_filename(self, source, destination):
+        self.log.append("%s -> %s" % (source, destination))
 
 
 class LocalArchiveTestBase(TestCase):
@@ -76,13 +87,17 @@ class ArchiveArtifactFromJenkinsTaskTest(LocalArchiveTestBase):
         fakefile = StringIO(u"Artifact from Jenkins")
         with mock.patch("archives.transports.urllib2") as urllib2_mock:
             urllib2_mock.urlopen.return_value = fakefile
-            archive_artifact_from_jenkins(items[artifact][0].pk)
+            with mock.patch(
+                    "archives.tasks.generate_checksums") as checksums_task:
+                archive_artifact_from_jenkins(items[artifact][0].pk)
 
         [item] = list(archive.get_archived_artifacts_for_build(build))
 
         filename = os.path.join(self.basedir, item.archived_path)
         self.assertEqual(file(filename).read(), "Artifact from Jenkins")
         self.assertEqual(21, item.archived_size)
+        # This was the only artifact of the build to archive.
+        checksums_task.delay.assert_called_once_with(build.pk, archive.pk)
 
     def test_archive_artifact_from_jenkins_transport_lifecycle(self):
         """
@@ -107,7 +122,8 @@ class ArchiveArtifactFromJenkinsTaskTest(LocalArchiveTestBase):
         transport = LoggingTransport(archive)
         with mock.patch.object(
                 Archive, "get_transport", return_value=transport):
-            archive_artifact_from_jenkins(item.pk)
+            with mock.patch("archives.tasks.generate_checksums"):
+                archive_artifact_from_jenkins(item.pk)
 
         [item] = list(archive.get_archived_artifacts_for_build(build))
         self.assertEqual(
@@ -130,9 +146,9 @@ class GenerateChecksumsTaskTest(TestCase):
     @override_settings(CELERY_ALWAYS_EAGER=True)
     def test_generate_checksums(self):
         """
-        generate_checksums should call the generate_checksums method
-        on the transport from the archive with the build to generate
-        the checksums for.
+        generate_checksums should ask the transport to write the checksum
+        file for each directory the build's project build artifacts are in,
+        from the checksums recorded on the archived artifacts.
         """
         project = ProjectFactory.create()
         dependency = DependencyFactory.create()
@@ -147,10 +163,15 @@ class GenerateChecksumsTaskTest(TestCase):
             build=build, filename="testing/testing.txt")
         archive = ArchiveFactory.create(
             transport="local", basedir=self.basedir, default=True)
-        archived_artifact = ArchiveArtifact.objects.create(
+        ArchiveArtifact.objects.create(
             build=build, archive=archive, artifact=artifact,
             archived_path="/srv/builds/200101.01/artifact_filename",
-            projectbuild_dependency=projectbuild_dependency)
+            projectbuild_dependency=projectbuild_dependency, sha256="abc")
+        # Artifacts of other builds in the directory are included too.
+        ArchiveArtifact.objects.create(
+            archive=archive, artifact=ArtifactFactory.create(),
+            archived_path="/srv/builds/200101.01/other_filename",
+            projectbuild_dependency=projectbuild_dependency, sha256="def")
 
         transport = LoggingTransport(archive)
 
@@ -159,9 +180,139 @@ class GenerateChecksumsTaskTest(TestCase):
             generate_checksums(build.pk)
 
         self.assertEqual(
-            ["START", "Checksums generated for %s" % archived_artifact, "END"],
+            ["START",
+             "Checksums written to /srv/builds/200101.01 for "
+             "artifact_filename, other_filename",
+             "END"],
             transport.log)
 
+    def test_generate_checksums_with_concurrent_archiving(self):
+        """
+        If more checksums are recorded in a directory while its checksum file
+        is written, the file should be written again with them.
+        """
+        project = ProjectFactory.create()
+        dependency = DependencyFactory.create()
+        ProjectDependency.objects.create(
+            project=project, dependency=dependency)
+        projectbuild = build_project(project, queue_build=False)
+        build = BuildFactory.create(
+            job=dependency.job, build_id=projectbuild.build_key)
+        projectbuild_dependency = ProjectBuildDependency.objects.create(
+            build=build, projectbuild=projectbuild, dependency=dependency)
+        archive = ArchiveFactory.create(
+            transport="local", basedir=self.basedir, default=True)
+        ArchiveArtifact.objects.create(
+            build=build, archive=archive,
+            artifact=ArtifactFactory.create(build=build),
+            archived_path="/srv/builds/200101.01/artifact_filename",
+            projectbuild_dependency=projectbuild_dependency, sha256="abc")
+
+        transport = LoggingTransport(archive)
+        write_checksum_files = transport.write_checksum_files
+
+        def write_while_archiving(checksum_files):
+            if not ArchiveArtifact.objects.filter(sha256="def").exists():
+                ArchiveArtifact.objects.create(
+                    archive=archive, artifact=ArtifactFactory.create(),
+                    archived_path="/srv/builds/200101.01/other_filename",
+                    projectbuild_dependency=projectbuild_dependency,
+                    sha256="def")
+            return write_checksum_files(checksum_files)
+        transport.write_checksum_files = write_while_archiving
+
+        with mock.patch.object(
+                Archive, "get_transport", return_value=transport):
+            generate_checksums(build.pk)
+
+        self.assertEqual(
+            ["START",
+             "Checksums written to /srv/builds/200101.01 for "
+             "artifact_filename",
+             "Checksums written to /srv/builds/200101.01 for "
+             "artifact_filename, other_filename",
+             "END"],
+            transport.log)
+
+    def test_generate_checksums_writes_files(self):
+        """
+        The checksum file should be written from the recorded checksums, in
+        the format sha256sum writes.
+        """
+        project = ProjectFactory.create()
+        dependency = DependencyFactory.create()
+        ProjectDependency.objects.create(
+            project=project, dependency=dependency)
+        projectbuild = build_project(project, queue_build=False)
+        build = BuildFactory.create(
+            job=dependency.job, build_id=projectbuild.build_key)
+        projectbuild_dependency = ProjectBuildDependency.objects.create(
+            build=build, projectbuild=projectbuild, dependency=dependency)
+        archive = ArchiveFactory.create(
+            transport="local", basedir=self.basedir, default=True)
+        ArchiveArtifact.objects.create(
+            build=build, archive=archive,
+            artifact=ArtifactFactory.create(build=build),
+            archived_path="/srv/builds/200101.01/artifact_filename",
+            projectbuild_dependency=projectbuild_dependency, sha256="abc")
+
+        generate_checksums(build.pk)
+
+        filename = os.path.join(
+            self.basedir, "srv/builds/200101.01/SHA256SUMS")
+        self.assertEqual("abc  artifact_filename\n", file(filename).read())
+
+    def test_generate_checksums_keeps_existing_entries(self):
+        """
+        Artifacts archived before checksums were recorded should keep their
+        entries from the existing checksum file.
+        """
+        project = ProjectFactory.create()
+        dependency = DependencyFactory.create()
+        ProjectDependency.objects.create(
+            project=project, dependency=dependency)
+        projectbuild = build_project(project, queue_build=False)
+        build = BuildFactory.create(
+            job=dependency.job, build_id=projectbuild.build_key)
+        projectbuild_dependency = ProjectBuildDependency.objects.create(
+            build=build, projectbuild=projectbuild, dependency=dependency)
+        archive = ArchiveFactory.create(
+            transport="local", basedir=self.basedir, default=True)
+        for path, sha256 in [
+                ("/srv/builds/200101.01/old_filename", ""),
+                ("/srv/builds/200101.01/unknown_filename", ""),
+                ("/srv/builds/200101.01/artifact_filename", "abc")]:
+            ArchiveArtifact.objects.create(
+                build=build, archive=archive,
+                artifact=ArtifactFactory.create(build=build),
+                archived_path=path, sha256=sha256,
+                projectbuild_dependency=projectbuild_dependency)
+        old = "f" * 64
+        dirname = os.path.join(self.basedir, "srv/builds/200101.01")
+        os.makedirs(dirname)
+        with open(os.path.join(dirname, "SHA256SUMS"), "w") as f:
+            f.write("%s  old_filename\n%s  deleted_filename\n" % (old, old))
+
+        generate_checksums(build.pk)
+
+        self.assertEqual(
+            "abc  artifact_filename\n%s  old_filename\n" % old,
+            file(os.path.join(dirname, "SHA256SUMS")).read())
+
+    def test_generate_checksums_with_no_default_archive(self):
+        """
+        If we have no default archive, there's nothing to generate checksums
+        in.
+        """
+        build = BuildFactory.create()
+        ArchiveFactory.create(default=False)
+
+        with mock.patch("archives.tasks.logging") as mock_logging:
+            generate_checksums(build.pk)
+
+        mock_logging.info.assert_called_once_with(
+            "No default archiver - no checksums generated.")
+
 
 class ProcessBuildArtifactsTaskTest(TestCase):
 
@@ -270,24 +421,221 @@ class ProcessBuildArtifactsTaskTest(TestCase):
             transport="local", basedir=self.basedir, default=True,
             policy="cdimage")
 
-        with mock.patch("archives.transports.urllib2") as urllib2_mock:
-            urllib2_mock.urlopen.side_effect = lambda x: StringIO(
-                u"Artifact %s")
-            with mock.patch(
-                "archives.tasks.archive_artifact_from_jenkins") as archive_task:
-                with mock.patch(
-                    "archives.tasks.link_artifact_in_archive") as link_task:
-                    process_build_artifacts(build.pk)
+        with mock.patch("archives.tasks.archive_artifacts") as archive_task:
+            with mock.patch("archives.tasks.group") as group_mock:
+                process_build_artifacts(build.pk)
+                [lanes], _ = group_mock.call_args
+                lanes = list(lanes)
 
         [item1, item2, item3, item4] = list(
-            archive.get_archived_artifacts_for_build(build).order_by("artifact"))
+            archive.get_archived_artifacts_for_build(build).order_by("pk"))
 
+        # Each artifact is archived once, and linked to the others.
+        self.assertEqual(2, len(lanes))
         self.assertEqual(
-            [mock.call(item4.pk), mock.call(item2.pk)],
+            [mock.call([(item1.pk, [item3.pk])]),
+             mock.call([(item2.pk, [item4.pk])])],
             archive_task.si.call_args_list)
+        group_mock.return_value.apply_async.assert_called_once_with()
+
+    @override_settings(CELERY_ALWAYS_EAGER=True)
+    def test_process_build_artifacts_limits_concurrency(self):
+        """
+        The artifacts should be shared between at most the
+        max_build_concurrency of the archive tasks.
+        """
+        dependency = DependencyFactory.create()
+        build = BuildFactory.create(job=dependency.job)
+        for index in range(5):
+            ArtifactFactory.create(
+                build=build, filename="testing/testing%d.txt" % index)
+        ArchiveFactory.create(
+            transport="local", basedir=self.basedir, default=True,
+            max_build_concurrency=2)
+
+        with mock.patch("archives.tasks.group") as group_mock:
+            process_build_artifacts(build.pk)
+
+        [lanes], _ = group_mock.call_args
+        self.assertEqual([3, 2], [len(lane.args[0]) for lane in lanes])
+
+    @override_settings(CELERY_ALWAYS_EAGER=True)
+    def test_process_build_artifacts_with_failed_artifact(self):
+        """
+        If an artifact can't be archived, the rest of the artifacts in its
+        lane should still be archived, and the checksums generated once.
+        """
+        dependency = DependencyFactory.create()
+        build = BuildFactory.create(job=dependency.job)
+        artifacts = [
+            ArtifactFactory.create(
+                build=build, filename="testing/testing%d.txt" % index)
+            for index in range(3)]
+        archive = ArchiveFactory.create(
+            transport="local", basedir=self.basedir, default=True,
+            max_build_concurrency=1)
+
+        transport = LoggingTransport(archive)
+        original_archive_url = transport.archive_url
+
+        def archive_url(url, *args, **kwargs):
+            if url == artifacts[0].url:
+                raise IOError("Connection reset")
+            return original_archive_url(url, *args, **kwargs)
+
+        transport.archive_url = archive_url
+        with mock.patch.object(
+                Archive, "get_transport", return_value=transport):
+            with mock.patch(
+                    "archives.tasks.generate_checksums") as checksums_task:
+                process_build_artifacts(build.pk)
+
+        items = archive.get_archived_artifacts_for_build(build)
+        failed = items.get(artifact=artifacts[0])
+        self.assertIsNone(failed.archived_at)
+        self.assertIsNotNone(failed.failed_at)
+        self.assertEqual(
+            2, items.filter(archived_at__isnull=False).count())
+        checksums_task.delay.assert_called_once_with(build.pk, archive.pk)
+        # The connection the artifact failed on isn't reused.
+        self.assertEqual(
+            ["END FAILED", "END", "END"],
+            [x for x in transport.log if x.startswith("END")])
+
+    @override_settings(CELERY_ALWAYS_EAGER=True)
+    def test_process_build_artifacts_generates_checksums_once(self):
+        """
+        Once all the artifacts have been archived and linked, the checksums
+        should be generated once.
+        """
+        project = ProjectFactory.create()
+        dependency = DependencyFactory.create()
+        ProjectDependency.objects.create(
+            project=project, dependency=dependency)
+        projectbuild = build_project(project, queue_build=False)
+        build = BuildFactory.create(
+            job=dependency.job, build_id=projectbuild.build_key)
+        ArtifactFactory.create(build=build, filename="testing/testing1.txt")
+        ArtifactFactory.create(build=build, filename="testing/testing2.txt")
+        process_build_dependencies(build.pk)
+        archive = ArchiveFactory.create(
+            transport="local", basedir=self.basedir, default=True,
+            policy="cdimage")
+
+        transport = LoggingTransport(archive)
+        with mock.patch.object(
+                Archive, "get_transport", return_value=transport):
+            process_build_artifacts(build.pk)
+
+        items = archive.get_archived_artifacts_for_build(build)
+        self.assertEqual(4, items.filter(archived_at__isnull=False).count())
+        # The links have the checksums of the files they're linked to.
+        for item in items:
+            self.assertEqual(
+                hashlib.sha256(item.artifact.url).hexdigest(), item.sha256)
+        checksums = [x for x in transport.log if x.startswith("Checksums")]
+        self.assertEqual(1, len(checksums))
+        self.assertEqual(["START"] + checksums + ["END"], transport.log[-3:])
+
+
+class MarkArchivedTest(TestCase):
+
+    def test_mark_failed(self):
+        """
+        mark_failed should record that the artifact failed, and generate the
+        checksums if nothing else is outstanding.
+        """
+        archive = ArchiveFactory.create(default=True)
+        build = BuildFactory.create()
+        item1, item2 = [
+            ArchiveArtifact.objects.create(
+                build=build, archive=archive,
+                artifact=ArtifactFactory.create(build=build))
+            for x in range(2)]
+
+        with mock.patch("archives.tasks.generate_checksums") as checksums:
+            mark_archived(item1, 100)
+            mark_failed([item2.pk])
+
+        self.assertIsNotNone(
+            ArchiveArtifact.objects.get(pk=item2.pk).failed_at)
+        checksums.delay.assert_called_once_with(build.pk, archive.pk)
+
+    def test_mark_failed_archived(self):
+        """
+        Artifacts that have been archived shouldn't be marked as failed.
+        """
+        archive = ArchiveFactory.create(default=True)
+        build = BuildFactory.create()
+        item = ArchiveArtifact.objects.create(
+            build=build, archive=archive,
+            artifact=ArtifactFactory.create(build=build))
+
+        with mock.patch("archives.tasks.generate_checksums") as checksums:
+            mark_archived(item, 100)
+            checksums.reset_mock()
+            mark_failed([item.pk])
+
+        self.assertIsNone(ArchiveArtifact.objects.get(pk=item.pk).failed_at)
+        self.assertFalse(checksums.delay.called)
+
+    def test_mark_archived(self):
+        """
+        mark_archived should record the size and time the artifact was
+        archived.
+        """
+        archive = ArchiveFactory.create(default=True)
+        build = BuildFactory.create()
+        item = ArchiveArtifact.objects.create(
+            build=build, archive=archive,
+            artifact=ArtifactFactory.create(build=build))
+
+        with mock.patch("archives.tasks.generate_checksums") as checksums:
+            mark_archived(item, 100)
+
+        item = ArchiveArtifact.objects.get(pk=item.pk)
+        self.assertIsNotNone(item.archived_at)
+        self.assertEqual(100, item.archived_size)
+        checksums.delay.assert_called_once_with(build.pk, archive.pk)
+
+    def test_mark_archived_with_outstanding_artifacts(self):
+        """
+        While other artifacts of the build haven't been archived, checksums
+        shouldn't be generated.
+        """
+        archive = ArchiveFactory.create(default=True)
+        build = BuildFactory.create()
+        item1, item2 = [
+            ArchiveArtifact.objects.create(
+                build=build, archive=archive,
+                artifact=ArtifactFactory.create(build=build))
+            for x in range(2)]
+
+        with mock.patch("archives.tasks.generate_checksums") as checksums:
+            mark_archived(item1, 100)
+            self.assertFalse(checksums.delay.called)
+            mark_archived(item2, 100)
+            checksums.delay.assert_called_once_with(build.pk, archive.pk)
+
+    def test_mark_archived_already_archived(self):
+        """
+        Archiving an artifact again shouldn't generate the checksums again.
+        """
+        archive = ArchiveFactory.create(default=True)
+        build = BuildFactory.create()
+        item = ArchiveArtifact.objects.create(
+            build=build, archive=archive,
+            artifact=ArtifactFactory.create(build=build))
+
+        with mock.patch("archives.tasks.generate_checksums") as checksums:
+            mark_archived(item, 100)
+            checksums.reset_mock()
+            mark_archived(item, 200)
+
+        self.assertFalse(checksums.delay.called)
         self.assertEqual(
-            [mock.call(item4.pk, item3.pk), mock.call(item2.pk, item1.pk)],
-            link_task.si.call_args_list)
+            200, ArchiveArtifact.objects.get(pk=item.pk).archived_size)
+
 
 class LinkArtifactInArchiveTaskTest(LocalArchiveTestBase):
 
@@ -314,11 +662,40 @@ class LinkArtifactInArchiveTaskTest(LocalArchiveTestBase):
         item1.save()
 
         transport = mock.Mock(spec=LocalTransport)
+        transport.link_filename_to_filenames.return_value = [True]
         with mock.patch.object(
                 Archive, "get_transport", return_value=transport):
             link_artifact_in_archive(item1.pk, item2.pk)
 
-        transport.link_filename_to_filename.assert_called_once_with(
-            item1.archived_path, item2.archived_path)
+        transport.link_filename_to_filenames.assert_called_once_with(
+            item1.archived_path, [item2.archived_path])
         item2 = ArchiveArtifact.objects.get(pk=item2.pk)
         self.assertEqual(1000, item2.archived_size)
+
+    def test_link_artifacts_in_archive(self):
+        """
+        link_artifacts_in_archive should link all the destinations with a
+        single call to the transport, and only mark those that were linked as
+        archived.
+        """
+        archive = ArchiveFactory.create(
+            transport="local", basedir=self.basedir)
+        build = BuildFactory.create()
+        source, linked, failed = [
+            ArchiveArtifact.objects.create(
+                build=build, archive=archive, archived_path="/%d" % x,
+                artifact=ArtifactFactory.create(build=build))
+            for x in range(3)]
+
+        transport = mock.Mock(spec=LocalTransport)
+        transport.link_filename_to_filenames.return_value = [True, False]
+        with mock.patch.object(
+                Archive, "get_transport", return_value=transport):
+            link_artifacts_in_archive(source.pk, [linked.pk, failed.pk])
+
+        transport.link_filename_to_filenames.assert_called_once_with(
+            "/0", ["/1", "/2"])
+        self.assertIsNotNone(
+            ArchiveArtifact.objects.get(pk=linked.pk).archived_at)
+        self.assertIsNone(
+            ArchiveArtifact.objects.get(pk=failed.pk).archived_at)
@@ -2,13 +2,95 @@ import os
 import urllib2
 import logging
 import base64
-import subprocess
+import hashlib
+import uuid
+from io import BytesIO
 
+from django.conf import settings
 from paramiko import SSHClient, WarningPolicy
 
+from archives.connections import connections, close
 from archives.sftpclient import SFTPClient
 
 
+# Artifacts are copied in chunks of this many bytes, so the memory used
+# doesn't grow with the size of the artifact.
+CHUNK_SIZE = 256 * 1024
+
+# SshTransport scripts print this, the index of each command and its exit
+# status, to report the result of each command.
+STATUS_MARKER = "capomastro-status:"
+
+
+def write_all(fd, data):
+    """
+    Writes all of data to the file descriptor, which os.write may not do in a
+    single call.
+    """
+    view = memoryview(data) if isinstance(data, str) else data
+    while len(view):
+        view = view[os.write(fd, view):]
+
+
+def copy_fileobj_to_fd(fileobj, fd, chunk_size=CHUNK_SIZE):
+    """
+    Copies the content of fileobj to the file descriptor, a chunk at a time.
+
+    Returns the number of bytes copied.
+    """
+    size = 0
+    while True:
+        data = fileobj.read(chunk_size)
+        if not data:
+            break
+        write_all(fd, data)
+        size += len(data)
+    return size
+
+
+class HashingReader(object):
+    """
+    Wraps a file-like object, and computes the digest of the data as it's
+    read, so that it doesn't have to be read again.
+    """
+    def __init__(self, fileobj, algorithm="sha256"):
+        self.fileobj = fileobj
+        self.hash = hashlib.new(algorithm)
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.hash.update(data)
+        return data
+
+    def close(self):
+        self.fileobj.close()
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+
+def format_checksums(checksums):
+    """
+    Returns the content of a checksum file, in the format sha256sum writes,
+    for a list of (filename, sha256) pairs.
+    """
+    return "".join(
+        "%s  %s\n" % (sha256, filename) for filename, sha256 in checksums)
+
+
+def parse_checksums(content):
+    """
+    Returns a dictionary mapping the filenames in the content of a checksum
+    file to their sha256, skipping any lines that aren't checksums.
+    """
+    checksums = {}
+    for line in content.splitlines():
+        parts = line.split(None, 1)
+        if len(parts) == 2 and len(parts[0]) == 64:
+            checksums[parts[1].lstrip("*")] = parts[0]
+    return checksums
+
+
 class Transport(object):
     """
     Responsible for reading the artifacts from
@@ -18,15 +100,19 @@ class Transport(object):
 
     def __init__(self, archive):
         self.archive = archive
+        # The SHA-256 of the files archived by archive_url, by the destination
+        # path.
+        self.checksums = {}
 
     def start(self):
         """
         Initialize the archiving.
         """
 
-    def end(self):
+    def end(self, failed=False):
         """
-        Finalize the archiving.
+        Finalize the archiving, failed is True if an operation raised an
+        exception.
         """
 
     def archive_file(self, fileobj, destination_path):
@@ -35,14 +121,44 @@ class Transport(object):
         """
         raise NotImplemented
 
-    def generate_checksums(self, archived_artifact):
+    def open_file(self, filename):
+        """
+        Opens the archived file for reading, raising IOError if it doesn't
+        exist.
+        """
+        raise NotImplementedError
+
+    def read_checksum_file(self, directory):
         """
-        Generates checksum files for the specified artifact on the archive.
+        Returns a dictionary mapping the filenames in the existing checksum
+        file in the directory to their sha256, which is empty if there's no
+        checksum file.
         """
-        self._run_command("cd `dirname %s` && sha256sum %s >> %s" % (
-            self.get_relative_filename(archived_artifact.archived_path),
-            archived_artifact.artifact.filename,
-            self.checksum_filename))
+        try:
+            f = self.open_file(os.path.join(directory, self.checksum_filename))
+        except IOError:
+            return {}
+        try:
+            return parse_checksums(f.read().decode("utf-8"))
+        finally:
+            f.close()
+
+    def write_checksum_files(self, checksum_files):
+        """
+        Writes the checksum file in each directory, replacing any existing one
+        atomically.
+
+        checksum_files maps the directories to a list of (filename, sha256)
+        pairs for the files in them. Returns a dictionary mapping the
+        directories to whether the file was written.
+        """
+        results = {}
+        for directory, checksums in checksum_files.items():
+            self.archive_file(
+                BytesIO(format_checksums(checksums).encode("utf-8")),
+                os.path.join(directory, self.checksum_filename))
+            results[directory] = True
+        return results
 
     def get_relative_filename(self, filename):
         """
@@ -60,20 +176,29 @@ class Transport(object):
         request.add_header(
             "Authorization",
             "Basic " + base64.b64encode(username + ":" + password))
-        f = urllib2.urlopen(request)
-        return self.archive_file(f, destination_path)
+        f = HashingReader(urllib2.urlopen(request))
+        size = self.archive_file(f, destination_path)
+        self.checksums[destination_path] = f.hexdigest()
+        return size
 
-    def _run_command(self, command):
+    def link_filename_to_filename(self, source, destination):
         """
-        Runs a command on the archive.
+        Link a filename to another filename in the transport's backend.
         """
         raise NotImplemented
 
-    def link_filename_to_filename(self, source, destination):
+    def link_filename_to_filenames(self, source, destinations):
         """
-        Link a filename to another filename in the transport's backend.
+        Link a filename to each of the destination filenames in the
+        transport's backend.
+
+        Returns a list of whether each succeeded.
         """
-        raise NotImplemented
+        results = []
+        for destination in destinations:
+            self.link_filename_to_filename(source, destination)
+            results.append(True)
+        return results
 
 
 class LocalTransport(Transport):
@@ -93,42 +218,52 @@ class LocalTransport(Transport):
         Archives a single artifact from the fileobj to the
         destination path.
 
+        The artifact is streamed to a temporary file next to the destination,
+        which then replaces it, so the destination is never left partly
+        written. With settings.ARCHIVE_FSYNC, the file is synced to disk
+        before it replaces the destination.
+
         Returns the number of bytes archived.
         """
         filename = self.get_relative_filename(filename)
-        if not os.path.exists(os.path.dirname(filename)):
-            os.makedirs(os.path.dirname(filename))
+        dirname, basename = os.path.split(filename)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
         logging.info(
             "LocalTransport archiving artifact to %s", filename)
 
+        temp_filename = os.path.join(
+            dirname, ".%s.%s" % (basename, uuid.uuid4().hex))
+        fsync = getattr(settings, "ARCHIVE_FSYNC", False)
         # We use the low-level stuff here because Python2 returns None from
         # fileobj.write()
+        fd = os.open(
+            temp_filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0666)
         try:
-            fd = os.open(filename, os.O_RDWR | os.O_CREAT)
-            size = os.write(fd, fileobj.read())
+            try:
+                size = copy_fileobj_to_fd(fileobj, fd)
+                if fsync:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+            os.rename(temp_filename, filename)
         finally:
-            os.close(fd)
+            if os.path.exists(temp_filename):
+                os.unlink(temp_filename)
+        if fsync:
+            # Make sure the rename is on disk too.
+            fd = os.open(dirname, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
         return size
 
-    def _run_command(self, command):
+    def open_file(self, filename):
         """
-        Runs a command in a local shell.
+        Opens the archived file for reading.
         """
-        # TODO: raise exception if the command fails
-        logging.debug("Executing %s" % command)
-        subprocess.Popen(command, stdout=subprocess.PIPE, shell=True).stdout.read()
-
-    def archive_url(self, url, destination_path, username, password):
-        """
-        Archives a single fileobj to the destination path.
-        """
-        logging.info("Attempting to archive %s to %s", url, destination_path)
-        request = urllib2.Request(url)
-        request.add_header(
-            "Authorization",
-            "Basic " + base64.b64encode(username + ":" + password))
-        f = urllib2.urlopen(request)
-        return self.archive_file(f, destination_path)
+        return open(self.get_relative_filename(filename), "rb")
 
     def link_filename_to_filename(self, source, destination):
         """
@@ -161,27 +296,53 @@ class SshTransport(Transport):
             pkey=self.archive.ssh_credentials.get_pkey())
         sftp_client = SFTPClient.from_transport(
             ssh_client.get_transport())
+        # Keep idle pooled connections from being dropped by firewalls.
+        ssh_client.get_transport().set_keepalive(
+            getattr(settings, "ARCHIVE_SSH_KEEPALIVE", 30))
         return ssh_client, sftp_client
 
-    def _run_command(self, command):
-        """
-        Runs a command over the ssh connection, makes sure it finishes.
-        """
-        # TODO: raise exception if the command fails
-        _, stdout, _ = self.ssh_client.exec_command(command)
-        _ = stdout.channel.recv_exit_status()  # noqa
+    def _run_commands(self, commands):
+        """
+        Runs the commands over the ssh connection as a single shell script,
+        and returns the exit status of each, or None if it didn't run.
+        """
+        script = "".join(
+            "(%s); echo \"%s%d $?\"\n" % (command, STATUS_MARKER, index)
+            for index, command in enumerate(commands))
+        stdin, stdout, _ = self.ssh_client.exec_command("sh")
+        stdin.write(script)
+        stdin.channel.shutdown_write()
+        statuses = [None] * len(commands)
+        for line in stdout.read().splitlines():
+            if line.startswith(STATUS_MARKER):
+                index, status = line[len(STATUS_MARKER):].split()
+                statuses[int(index)] = int(status)
+        stdout.channel.recv_exit_status()
+        for command, status in zip(commands, statuses):
+            if status != 0:
+                logging.warning(
+                    "Command on %s failed with status %s: %s",
+                    self.archive, status, command)
+        return statuses
 
     def start(self):
         """
-        Opens the ssh connection.
+        Takes an ssh connection to the archive from the pool, opening one if
+        there are none.
         """
-        self.ssh_client, self.sftp_client = self._get_ssh_clients()
+        self.ssh_client, self.sftp_client = connections.acquire(
+            self.archive, self._get_ssh_clients)
 
-    def end(self):
+    def end(self, failed=False):
         """
-        Closes the ssh connection.
+        Returns the ssh connection to the pool, or closes it if an operation
+        failed, as it may have been left in an unknown state.
         """
-        self.ssh_client.close()
+        connection = (self.ssh_client, self.sftp_client)
+        if failed:
+            close(connection)
+        else:
+            connections.release(self.archive, connection)
 
     def archive_file(self, fileobj, filename):
         """
@@ -189,20 +350,62 @@ class SshTransport(Transport):
         the remote server, underneath the target's basedir.
         """
         destination = self.get_relative_filename(filename)
-        self._run_command("mkdir -p `dirname %s`" % destination)
-        # TODO: raise exception if the command fails
         logging.info(
             "SshTransport archiving artifact to %s", filename)
         return self.sftp_client.stream_file_to_remote(fileobj, destination)
 
+    def open_file(self, filename):
+        """
+        Opens the archived file on the remote server for reading.
+        """
+        return self.sftp_client.open(
+            self.get_relative_filename(filename), "rb")
+
     def link_filename_to_filename(self, source, destination):
         """
         Hard link a file in the filesystem.
         """
+        self.link_filename_to_filenames(source, [destination])
+
+    def link_filename_to_filenames(self, source, destinations):
+        """
+        Hard link a file to each of the destinations that don't already
+        exist, with a single remote script.
+
+        Returns a list of whether each succeeded.
+        """
         source = self.get_relative_filename(source)
-        destination = self.get_relative_filename(destination)
+        commands = []
+        for destination in destinations:
+            destination = self.get_relative_filename(destination)
+            commands.append(
+                "mkdir -p `dirname %s` && { [ -e \"%s\" ] || "
+                "ln \"%s\" \"%s\"; }" % (
+                    destination, destination, source, destination))
+        return [status == 0 for status in self._run_commands(commands)]
+
+    def write_checksum_files(self, checksum_files):
+        """
+        Writes the checksum file in each directory, replacing any existing one
+        atomically.
 
-        # TODO: Use the return value from the call to work out if we were
-        # successful or not.
-        self._run_command("mkdir -p `dirname %s`" % destination)
-        self._run_command("ln \"%s\" \"%s\"" % (source, destination))
+        Each file is uploaded next to the one it replaces, and then they're
+        all moved into place with a single remote script.
+        """
+        directories = sorted(checksum_files)
+        commands = []
+        for directory in directories:
+            filename = self.get_relative_filename(
+                os.path.join(directory, self.checksum_filename))
+            dirname, basename = os.path.split(filename)
+            temp_filename = os.path.join(
+                dirname, ".%s.%s" % (basename, uuid.uuid4().hex))
+            self.sftp_client.stream_file_to_remote(
+                BytesIO(format_checksums(
+                    checksum_files[directory]).encode("utf-8")),
+                temp_filename)
+            commands.append("mv -f \"%s\" \"%s\"" % (temp_filename, filename))
+        statuses = self._run_commands(commands)
+        return dict(
+            (directory, status == 0)
+            for directory, status in zip(directories, statuses))
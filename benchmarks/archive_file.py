@@ -0,0 +1,113 @@
+"""
+Measures the peak memory of archiving artifacts of increasing size with
+LocalTransport.archive_file, against reading the whole artifact and writing it
+in one go as it used to.
+
+    $ python -m benchmarks.archive_file [max_size_mb]
+
+Each measurement runs in a forked process, so the peak resident set size of
+the process only covers that one artifact.
+"""
+import collections
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "capomastro.settings")
+
+from django.conf import settings
+# Load the settings before forking, so they don't count as the transport's
+# memory, and the settings import tasks which import models first.
+settings.INSTALLED_APPS
+
+from archives.transports import LocalTransport
+
+
+Archive = collections.namedtuple("Archive", "basedir")
+
+
+class ArtifactStream(object):
+    """
+    A file-like object that produces size bytes without holding them, like a
+    response from Jenkins.
+    """
+    def __init__(self, size):
+        self.remaining = size
+        self.block = "x" * (1024 * 1024)
+
+    def read(self, size=-1):
+        if size < 0:
+            size = self.remaining
+        size = min(size, self.remaining)
+        self.remaining -= size
+        if size <= len(self.block):
+            return self.block[:size]
+        return self.block * (size // len(self.block)) + (
+            self.block[:size % len(self.block)])
+
+
+def archive_whole_file(transport, fileobj, filename):
+    """
+    How LocalTransport.archive_file used to archive artifacts.
+    """
+    filename = transport.get_relative_filename(filename)
+    if not os.path.exists(os.path.dirname(filename)):
+        os.makedirs(os.path.dirname(filename))
+    fd = os.open(filename, os.O_RDWR | os.O_CREAT)
+    try:
+        return os.write(fd, fileobj.read())
+    finally:
+        os.close(fd)
+
+
+def archive_streaming(transport, fileobj, filename):
+    return transport.archive_file(fileobj, filename)
+
+
+def measure(function, size):
+    """
+    Archives an artifact of size bytes in a child process, and returns the
+    growth in peak memory in MB and the time taken.
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        basedir = tempfile.mkdtemp()
+        try:
+            before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            start = time.time()
+            function(
+                LocalTransport(Archive(basedir)), ArtifactStream(size),
+                "/artifacts/artifact.iso")
+            elapsed = time.time() - start
+            after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            os.write(write_fd, "%d %f" % (after - before, elapsed))
+        finally:
+            shutil.rmtree(basedir)
+            os._exit(0)
+    os.close(write_fd)
+    peak, elapsed = os.read(read_fd, 100).split()
+    os.close(read_fd)
+    os.waitpid(pid, 0)
+    # ru_maxrss is in KB on Linux.
+    return int(peak) / 1024.0, float(elapsed)
+
+
+def main(max_size_mb=512):
+    print("%-10s %-10s %12s %10s" % ("size MB", "archiver", "peak MB", "MB/s"))
+    size_mb = 16
+    while size_mb <= max_size_mb:
+        for name, function in [("whole", archive_whole_file),
+                               ("streaming", archive_streaming)]:
+            peak, elapsed = measure(function, size_mb * 1024 * 1024)
+            print("%-10d %-10s %12.1f %10.1f" % (
+                size_mb, name, peak, size_mb / max(elapsed, 0.001)))
+        size_mb *= 4
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,96 @@
+"""
+Compares loading builds with all their fields against the summary that the
+Build manager returns by default, on a synthetic dataset in a test database.
+
+    $ python -m benchmarks.build_queries [builds] [console_size]
+"""
+import gc
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "capomastro.settings")
+
+from django.conf import settings
+# The settings import tasks which import models, so load them first.
+settings.INSTALLED_APPS
+
+from django.db import connection
+from django.test.utils import setup_test_environment
+from south.management.commands import patch_for_test_db_setup
+
+from jenkins.models import JenkinsServer, JobType, Job, Build
+
+
+def create_builds(count, console_size):
+    server = JenkinsServer.objects.create(
+        name="Benchmark", url="http://localhost/", username="root",
+        password="testing")
+    jobtype = JobType.objects.create(name="Benchmark", config_xml="<xml/>")
+    job = Job.objects.create(server=server, jobtype=jobtype, name="job")
+    console_log = ("Building line of output\n" * (
+        console_size // 24 + 1))[:console_size]
+    parameters = json.dumps([{"name": "PARAMETER_%d" % x, "value": "value %d" % x}
+                  for x in range(10)])
+    Build.objects.bulk_create([
+        Build(job=job, build_id="build-%d" % x, number=x, duration=1000,
+              url="http://localhost/job/job/%d/" % x, phase="FINALIZED",
+              status="SUCCESS", console_log=console_log,
+              parameters=parameters)
+        for x in range(count)])
+
+
+def get_fetched_bytes(queryset):
+    """
+    Returns the size of the column values the query fetches.
+    """
+    sql, params = queryset.query.sql_with_params()
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    return sum(len(unicode(value)) for row in cursor.fetchall()
+               for value in row if value is not None)
+
+
+def get_retained_size(builds):
+    """
+    Returns the approximate memory held by the field values of the builds.
+    """
+    size = 0
+    for build in builds:
+        for value in build.__dict__.values():
+            size += sys.getsizeof(value)
+            if isinstance(value, list):
+                size += sum(sys.getsizeof(x) for x in value)
+    return size
+
+
+def run(queryset):
+    gc.collect()
+    objects = len(gc.get_objects())
+    start = time.time()
+    builds = list(queryset)
+    elapsed = time.time() - start
+    objects = len(gc.get_objects()) - objects
+    return (elapsed * 1000, get_fetched_bytes(queryset),
+            get_retained_size(builds), objects)
+
+
+def main(count=5000, console_size=16 * 1024):
+    setup_test_environment()
+    patch_for_test_db_setup()
+    old_name = settings.DATABASES["default"]["NAME"]
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        create_builds(count, console_size)
+        print("%-14s %10s %14s %14s %10s" % (
+            "queryset", "ms", "bytes fetched", "bytes held", "objects"))
+        for name, queryset in [("with_details", Build.objects.with_details()),
+                               ("summary", Build.objects.summary())]:
+            print("%-14s %10.1f %14d %14d %10d" % ((name,) + run(queryset)))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
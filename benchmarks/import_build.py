@@ -0,0 +1,74 @@
+"""
+Compares fetching a build through jenkinsapi, as import_build_for_job used
+to, with the tree-filtered JSON API client.
+
+    $ python -m benchmarks.import_build [iterations]
+"""
+import collections
+import sys
+import time
+
+from jenkinsapi.jenkins import Jenkins
+
+from jenkins.client import get_build_details, iter_console_log
+from benchmarks.stub_jenkins import StubJenkins
+
+
+Server = collections.namedtuple("Server", "url username password")
+
+
+def import_with_jenkinsapi(server, job_name, number):
+    """
+    The fetches import_build_for_job made with jenkinsapi.
+    """
+    client = Jenkins(
+        server.url, username=server.username, password=server.password)
+    build_result = client.get_job(job_name).get_build(number)
+    return {
+        "status": build_result.get_status(),
+        "duration": build_result._data["duration"],
+        "url": build_result.get_result_url(),
+        "console_log": build_result.get_console(),
+        "parameters": build_result.get_actions()["parameters"],
+        "artifacts": [(x.filename, x.url) for x in
+                      build_result.get_artifacts()],
+    }
+
+
+def import_with_json_api(server, job_name, number):
+    """
+    The fetches import_build_for_job makes with jenkins.client.
+    """
+    details = get_build_details(server, job_name, number)
+    details["console_log"] = "".join(
+        iter_console_log(server, job_name, number))
+    return details
+
+
+def run(stub, function, iterations):
+    server = Server(stub.url, "root", "testing")
+    stub.reset()
+    start = time.time()
+    for number in range(iterations):
+        function(server, "job_1", number % stub.data.builds + 1)
+    elapsed = time.time() - start
+    return (elapsed / iterations * 1000, float(stub.requests) / iterations,
+            stub.bytes_sent / iterations)
+
+
+def main(iterations=200):
+    stub = StubJenkins()
+    stub.start()
+    try:
+        print("%-14s %12s %12s %14s" % (
+            "importer", "ms/build", "requests", "bytes/build"))
+        for name, function in [("jenkinsapi", import_with_jenkinsapi),
+                               ("json api", import_with_json_api)]:
+            print("%-14s %12.2f %12.1f %14d" % (
+                (name,) + run(stub, function, iterations)))
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
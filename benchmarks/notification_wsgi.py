@@ -0,0 +1,133 @@
+"""
+Compares posting Jenkins notifications through the full Django WSGI handler,
+with all the MIDDLEWARE_CLASSES, against the NotificationWSGIHandler that
+capomastro.wsgi sends them to.
+
+    $ python -m benchmarks.notification_wsgi [jobs] [builds]
+
+The postprocessing tasks are published to an in-memory broker but never run.
+
+Replaying the notifications is dominated by the database, so the overhead is
+also measured by alternating the handlers on a repeated STARTED notification,
+which does the same work for each request.
+"""
+from cStringIO import StringIO
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "capomastro.settings")
+
+from django.conf import settings
+# The settings import tasks which import models, so load them first.
+settings.INSTALLED_APPS
+
+from django.core.urlresolvers import reverse
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test.utils import setup_test_environment
+from south.management.commands import patch_for_test_db_setup
+
+from capomastro import celery_app
+from jenkins.models import Build
+from jenkins.wsgi import NotificationWSGIHandler
+from benchmarks.notifications import (
+    generate_notifications, create_jobs, percentile)
+
+
+def get_environ(path, query_string, body):
+    return {
+        "REQUEST_METHOD": "POST",
+        "PATH_INFO": path,
+        "QUERY_STRING": query_string,
+        "CONTENT_TYPE": "application/json",
+        "CONTENT_LENGTH": str(len(body)),
+        "SERVER_NAME": "localhost",
+        "SERVER_PORT": "80",
+        "REMOTE_ADDR": "127.0.0.1",
+        "wsgi.input": StringIO(body),
+        "wsgi.url_scheme": "http",
+        "wsgi.errors": sys.stderr,
+    }
+
+
+def post(application, server, payload):
+    """
+    Posts the payload to the notification URL, and returns the time taken.
+    """
+    statuses = []
+
+    def start_response(status, headers):
+        statuses.append(status)
+
+    start = time.time()
+    response = application(
+        get_environ(reverse("jenkins_notifications"),
+                    "server=%d&token=%s" % (
+                        server.pk, server.notification_token), payload),
+        start_response)
+    "".join(response)
+    response.close()
+    elapsed = time.time() - start
+    assert statuses == ["200 OK"], statuses
+    return elapsed
+
+
+def run(application, server, payloads):
+    Build.objects.all().delete()
+    start = time.time()
+    latencies = [post(application, server, payload) for payload in payloads]
+    elapsed = time.time() - start
+    return (len(payloads) / elapsed, percentile(latencies, 50) * 1000,
+            percentile(latencies, 99) * 1000)
+
+
+def measure_overhead(handlers, server, payload, iterations=2000):
+    """
+    Returns the mean microseconds per request for each handler, alternating
+    between them.
+    """
+    totals = [0.0] * len(handlers)
+    for x in range(iterations):
+        for index, (name, application) in enumerate(handlers):
+            totals[index] += post(application, server, payload)
+    return [total / iterations * 1000000 for total in totals]
+
+
+def main(jobs=50, builds=10):
+    notifications = list(generate_notifications(jobs, builds))
+    payloads = [json.dumps(x) for x in notifications]
+    celery_app.conf.BROKER_URL = "memory://"
+    setup_test_environment()
+    patch_for_test_db_setup()
+    old_name = settings.DATABASES["default"]["NAME"]
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        server = create_jobs(
+            "http://localhost/", sorted(set(x["name"] for x in notifications)))
+        # The fast path only accepts notifications from servers with a token.
+        server.notification_token = "benchmark"
+        server.save()
+        print("%d notifications for %d jobs" % (len(payloads), jobs))
+        print("%-12s %10s %10s %10s %14s" % (
+            "handler", "req/s", "p50 ms", "p99 ms", "repeated us"))
+        handlers = [("middleware", get_wsgi_application()),
+                    ("fast path", NotificationWSGIHandler())]
+        # Warm up the URL resolver and connections for both.
+        for name, application in handlers:
+            run(application, server, payloads[:100])
+        results = [run(application, server, payloads)
+                   for name, application in handlers]
+        overheads = measure_overhead(handlers, server, payloads[0])
+        for (name, _), result, overhead in zip(handlers, results, overheads):
+            print("%-12s %10.1f %10.2f %10.2f %14.0f" % (
+                (name,) + result + (overhead,)))
+        print("The middleware costs %.0fus per notification" % (
+            overheads[0] - overheads[1]))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
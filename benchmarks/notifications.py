@@ -0,0 +1,182 @@
+"""
+Replays Jenkins notifications against NotificationHandlerView in-process, and
+reports the throughput, latency and SQL queries per notification.
+
+    $ python -m benchmarks.notifications [options] [jobs] [builds]
+
+The notifications are STARTED/FINALIZED pairs for builds of each job, or the
+recorded notifications in the file given with --replay, one JSON object per
+line, as written by --record.
+
+Each mode runs against a fresh set of builds in a test database:
+
+    direct   Notifications are applied by the view, and the postprocessing
+             tasks are published to an in-memory broker but never run.
+    queued   As with QUEUE_NOTIFICATIONS, the view stores the notifications,
+             and they're then applied by process_queued_notifications, the
+             latencies are for the view, req/s includes applying them.
+    eager    With --eager, the view runs the postprocessing tasks in-process,
+             importing the builds from a stub Jenkins.
+"""
+import json
+import optparse
+import os
+import time
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "capomastro.settings")
+
+from django.conf import settings
+# The settings import tasks which import models, so load them first.
+settings.INSTALLED_APPS
+
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.client import Client
+from django.test.utils import (
+    setup_test_environment, override_settings, CaptureQueriesContext)
+from south.management.commands import patch_for_test_db_setup
+
+from capomastro import celery_app
+from jenkins.client import get_session
+from jenkins.models import JenkinsServer, JobType, Job, Build
+from jenkins.tasks import process_queued_notifications
+from benchmarks.stub_jenkins import StubJenkins
+
+
+def generate_notifications(jobs, builds):
+    """
+    Yields a STARTED and a FINALIZED notification for each build of each job,
+    in the order the notification plugin would send them if all the jobs were
+    building at once.
+    """
+    names = ["job_%d" % x for x in range(jobs)]
+    for number in range(1, builds + 1):
+        for phase in ["STARTED", "FINALIZED"]:
+            for name in names:
+                build = {
+                    "full_url": "http://localhost/job/%s/%d/" % (
+                        name, number),
+                    "number": number,
+                    "phase": phase,
+                    "url": "job/%s/%d/" % (name, number),
+                    "parameters": {
+                        "BUILD_ID": "%s.%d" % (name, number),
+                        "REQUESTOR": "testing"},
+                }
+                if phase == "FINALIZED":
+                    build["status"] = "SUCCESS"
+                yield {"name": name, "url": "job/%s/" % name, "build": build}
+
+
+def load_notifications(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_notifications(path, notifications):
+    with open(path, "w") as f:
+        for notification in notifications:
+            f.write(json.dumps(notification) + "\n")
+
+
+def create_jobs(server_url, names):
+    server = JenkinsServer.objects.create(
+        name="Benchmark", url=server_url, username="root", password="testing")
+    jobtype = JobType.objects.create(name="Benchmark", config_xml="<xml/>")
+    Job.objects.bulk_create([
+        Job(server=server, jobtype=jobtype, name=name) for name in names])
+    return server
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[int(round(percent / 100.0 * (len(values) - 1)))]
+
+
+def replay(server, payloads, mode):
+    """
+    Posts the payloads to the notification view one at a time, and returns
+    the elapsed time, the latency of each request and the number of queries.
+    """
+    client = Client()
+    url = "%s?server=%d" % (reverse("jenkins_notifications"), server.pk)
+    latencies = []
+    with CaptureQueriesContext(connection) as queries:
+        start = time.time()
+        for payload in payloads:
+            request_start = time.time()
+            response = client.post(
+                url, data=payload, content_type="application/json")
+            latencies.append(time.time() - request_start)
+            assert response.status_code in (200, 202), response.status_code
+        if mode == "queued":
+            while process_queued_notifications():
+                pass
+        elapsed = time.time() - start
+    return elapsed, latencies, len(queries)
+
+
+def run(server, payloads, mode):
+    Build.objects.all().delete()
+    overrides = {"QUEUE_NOTIFICATIONS": mode == "queued",
+                 "CELERY_ALWAYS_EAGER": mode == "eager"}
+    with override_settings(**overrides):
+        celery_app.conf.update(overrides)
+        elapsed, latencies, queries = replay(server, payloads, mode)
+    count = len(payloads)
+    return (count / elapsed, percentile(latencies, 50) * 1000,
+            percentile(latencies, 99) * 1000, float(queries) / count)
+
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options] [jobs] [builds]")
+    parser.add_option(
+        "--eager", action="store_true", default=False,
+        help="Also run the postprocessing tasks against a stub Jenkins")
+    parser.add_option(
+        "--replay", metavar="FILE",
+        help="Replay the notifications recorded in FILE")
+    parser.add_option(
+        "--record", metavar="FILE",
+        help="Write the generated notifications to FILE and exit")
+    options, args = parser.parse_args()
+    jobs, builds = ([int(x) for x in args] + [50, 10][len(args):])[:2]
+
+    if options.replay:
+        notifications = load_notifications(options.replay)
+    else:
+        notifications = list(generate_notifications(jobs, builds))
+    if options.record:
+        save_notifications(options.record, notifications)
+        return
+    payloads = [json.dumps(x) for x in notifications]
+    names = sorted(set(x["name"] for x in notifications))
+
+    # Tasks that aren't run eagerly are published to a broker in memory.
+    celery_app.conf.BROKER_URL = "memory://"
+    stub = StubJenkins()
+    stub.start()
+    setup_test_environment()
+    patch_for_test_db_setup()
+    old_name = settings.DATABASES["default"]["NAME"]
+    connection.creation.create_test_db(verbosity=0)
+    server = None
+    try:
+        server = create_jobs(stub.url, names)
+        print("%d notifications for %d jobs" % (len(payloads), len(names)))
+        print("%-8s %10s %10s %10s %14s" % (
+            "mode", "req/s", "p50 ms", "p99 ms", "queries/req"))
+        modes = ["direct", "queued"] + (["eager"] if options.eager else [])
+        for mode in modes:
+            print("%-8s %10.1f %10.2f %10.2f %14.1f" % (
+                (mode,) + run(server, payloads, mode)))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        # Close the connections the eager imports kept alive before the stub.
+        if server is not None:
+            get_session(server).close()
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
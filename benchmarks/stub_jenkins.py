@@ -0,0 +1,219 @@
+"""
+A minimal in-process Jenkins server for benchmarking the Jenkins clients.
+
+It serves the python and JSON APIs for a root object, jobs and builds, and the
+console text for builds. Requests and response bytes are counted so that
+benchmarks can compare how much each client fetches.
+"""
+import json
+import socket
+import threading
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+
+def parse_tree(tree):
+    """
+    Parses a Jenkins tree parameter e.g. "a,b[c,d]" into a dictionary of
+    field name to the nested tree, or None for leaf fields.
+    """
+    fields = {}
+    name, depth, start = "", 0, 0
+    for index, char in enumerate(tree + ","):
+        if char == "[":
+            if depth == 0:
+                name, start = tree[start:index].strip(), index + 1
+            depth += 1
+        elif char == "]":
+            depth -= 1
+            if depth == 0:
+                fields[name] = parse_tree(tree[start:index])
+                name, start = "", index + 1
+        elif char == "," and depth == 0:
+            field = tree[start:index].strip()
+            if field:
+                fields[field] = None
+            start = index + 1
+    return fields
+
+
+def filter_tree(data, fields):
+    """
+    Filters data to the fields parsed from a tree, the way Jenkins does.
+    """
+    if fields is None:
+        return data
+    if isinstance(data, list):
+        return [filter_tree(item, fields) for item in data]
+    if isinstance(data, dict):
+        return dict(
+            (key, filter_tree(data[key], nested))
+            for key, nested in fields.items() if key in data)
+    return data
+
+
+class StubJenkinsData(object):
+    """
+    Generates the Jenkins API data served by the stub.
+    """
+    def __init__(self, base_url, jobs=50, builds=100, artifacts=20,
+                 console_size=64 * 1024):
+        self.base_url = base_url
+        self.jobs = ["job_%d" % x for x in range(jobs)]
+        self.builds = builds
+        self.artifacts = artifacts
+        self.console = ("Building line of output\n" * (
+            console_size // 24 + 1))[:console_size]
+
+    def job_url(self, name):
+        return "%sjob/%s/" % (self.base_url, name)
+
+    def build_url(self, name, number):
+        return "%s%d/" % (self.job_url(name), number)
+
+    def root(self):
+        return {
+            "jobs": [{"name": name, "url": self.job_url(name),
+                      "color": "blue"} for name in self.jobs],
+            "views": [{"name": "All", "url": self.base_url}],
+            "useSecurity": True,
+        }
+
+    def job(self, name):
+        builds = [{"number": number, "url": self.build_url(name, number)}
+                  for number in range(self.builds, 0, -1)]
+        return {
+            "name": name,
+            "url": self.job_url(name),
+            "description": "Job %s" % name,
+            "builds": builds,
+            "firstBuild": builds[-1],
+            "lastBuild": builds[0],
+            "lastCompletedBuild": builds[0],
+            "healthReport": [{"description": "Build stability", "score": 100}],
+            "property": [{"parameterDefinitions": [
+                {"name": "BUILD_ID", "type": "StringParameterDefinition"}]}],
+        }
+
+    def build(self, name, number):
+        return {
+            "actions": [
+                {"parameters": [
+                    {"name": "BUILD_ID", "value": "20140312.%d" % number},
+                    {"name": "REQUESTOR", "value": "testing"}]},
+                {"causes": [{"shortDescription": "Started by user"}]},
+                {"lastBuiltRevision": {"SHA1": "a" * 40}},
+            ],
+            "artifacts": [
+                {"displayPath": "artifact%d.img" % x,
+                 "fileName": "artifact%d.img" % x,
+                 "relativePath": "output/artifact%d.img" % x}
+                for x in range(self.artifacts)],
+            "building": False,
+            "description": None,
+            "duration": 120000,
+            "fullDisplayName": "%s #%d" % (name, number),
+            "id": "2014-03-12_10-00-%02d" % (number % 60),
+            "number": number,
+            "result": "SUCCESS",
+            "timestamp": 1394618400000,
+            "url": self.build_url(name, number),
+            "changeSet": {"kind": "git", "items": [
+                {"msg": "Change %d" % x, "commitId": "b" * 40,
+                 "affectedPaths": ["src/file%d.py" % x]}
+                for x in range(20)]},
+            "culprits": [{"fullName": "Developer %d" % x} for x in range(5)],
+        }
+
+
+class StubJenkinsHandler(BaseHTTPRequestHandler):
+
+    # Allow clients to keep connections alive.
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        # Headers and body are written separately, don't let Nagle delay them.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        params = urlparse.parse_qs(url.query)
+        parts = [x for x in url.path.split("/") if x]
+        data = self.server.data
+        body = None
+        headers = {}
+        api = parts[-2:] if len(parts) >= 2 else []
+        if parts == ["api", "python"] or parts == ["api", "json"]:
+            content = data.root()
+        elif len(parts) == 4 and parts[0] == "job" and api[0] == "api":
+            content = data.job(parts[1])
+        elif len(parts) == 5 and parts[0] == "job" and api[0] == "api":
+            content = data.build(parts[1], int(parts[2]))
+        elif len(parts) == 4 and parts[0] == "job" and parts[3] == "consoleText":
+            body = data.console
+        elif (len(parts) == 5 and parts[0] == "job" and
+              parts[3:] == ["logText", "progressiveText"]):
+            start = int(params.get("start", ["0"])[0])
+            body = data.console[start:]
+            headers["X-Text-Size"] = str(len(data.console))
+            headers["X-More-Data"] = "false"
+        else:
+            self.send_error(404)
+            return
+
+        if body is None:
+            if "tree" in params:
+                content = filter_tree(content, parse_tree(params["tree"][0]))
+            if api[-1] == "json":
+                body = json.dumps(content)
+            else:
+                body = repr(content)
+        self.server.record(len(body))
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubJenkins(ThreadingMixIn, HTTPServer):
+    """
+    Serves StubJenkinsData on a local port in a background thread.
+
+    server = StubJenkins(builds=100)
+    server.start()
+    ...
+    server.stop()
+    """
+    daemon_threads = True
+
+    def __init__(self, **kwargs):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), StubJenkinsHandler)
+        self.url = "http://127.0.0.1:%d/" % self.server_address[1]
+        self.data = StubJenkinsData(self.url, **kwargs)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def record(self, size):
+        with self.lock:
+            self.requests += 1
+            self.bytes_sent += size
+
+    def reset(self):
+        self.requests = 0
+        self.bytes_sent = 0
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -34,9 +34,35 @@ class JobTypeViewSet(viewsets.ModelViewSet):
     serializer_class = JobTypeSerializer
 
 
+class BuildSummarySerializer(serializers.HyperlinkedModelSerializer):
+    """
+    Builds are linked like they are by the default serializer of the detail
+    view, but without the console log and parameters.
+    """
+
+    class Meta:
+        model = Build
+        fields = (
+            "url", "job", "build_id", "number", "duration", "phase", "status",
+            "created_at", "requested_by", "imported_at")
+
+
 class BuildViewSet(viewsets.ModelViewSet):
     model = Build
 
+    def get_queryset(self):
+        """
+        Lists of builds don't include the console log and parameters.
+        """
+        if self.action == "list":
+            return Build.objects.summary()
+        return Build.objects.with_details()
+
+    def get_serializer_class(self):
+        if self.action == "list":
+            return BuildSummarySerializer
+        return super(BuildViewSet, self).get_serializer_class()
+
 
 class ArtifactViewSet(viewsets.ModelViewSet):
     model = Artifact
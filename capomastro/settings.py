@@ -8,6 +8,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/1.6/ref/settings/
 """
 
+from datetime import timedelta
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 import os
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
@@ -111,11 +112,79 @@ REST_FRAMEWORK = {
     ]
 }
 
+# Set QUEUE_NOTIFICATIONS to True to have Jenkins notifications stored and
+# applied every few seconds, scheduled by celery beat, by a dedicated worker:
+#   celery -A capomastro worker -Q notifications -c 1
+QUEUE_NOTIFICATIONS = False
+# Each process caches the servers and jobs that notifications refer to for at
+# most this many seconds. Changes made in other processes are seen straight
+# away only if CACHES is configured with a backend they share, e.g. memcached.
+NOTIFICATION_LOOKUPS_TTL = 60
+# Identical build requests for a job made within this many seconds of a request
+# that Jenkins hasn't started yet are coalesced with it.
+BUILD_REQUEST_WINDOW = 300
+# Build requests that Jenkins hasn't started within this many seconds are no
+# longer linked to builds, and are expired by reconcile_stale_builds.
+BUILD_REQUEST_EXPIRY = 3600
+# Route the tasks that talk to a Jenkins server to a queue per server, named
+# jenkins.server.<pk>, so that a slow server can't hold up the others.
+# "python manage.py jenkins_server queues" lists the workers to run.
+ROUTE_TASKS_BY_SERVER = False
+# Dependencies replicated across servers are built on the least busy server,
+# going by the load of each server sampled by the sample_server_loads task,
+# which is used for this many seconds.
+SERVER_LOAD_CACHE_TIMEOUT = 30
+# Servers that take longer than this many seconds to report their load are
+# treated as if their load is unknown.
+SERVER_LOAD_TIMEOUT = 5
+# Sync artifacts archived by the local transport to disk before they replace
+# the previous file, trading archiving speed for durability.
+ARCHIVE_FSYNC = False
+# Idle ssh connections to archives are kept open for reuse by later tasks for
+# this many seconds, and sent keepalives every ARCHIVE_SSH_KEEPALIVE seconds.
+ARCHIVE_SSH_MAX_IDLE = 300
+ARCHIVE_SSH_KEEPALIVE = 30
+
+# Builds that have been STARTED for this many seconds are checked with
+# Jenkins, in case their FINALIZED notification was lost.
+STALE_BUILD_AGE = 3600
+
+CELERYBEAT_SCHEDULE = {
+    "reconcile-stale-builds": {
+        "task": "jenkins.tasks.reconcile_stale_builds",
+        "schedule": timedelta(minutes=10),
+    },
+    "sample-server-loads": {
+        "task": "jenkins.tasks.sample_server_loads",
+        "schedule": timedelta(seconds=15),
+        # Skip the samples that are already out of date when they're run.
+        "options": {"expires": 15},
+    },
+}
+
+CELERY_ROUTES = (
+    "jenkins.routers.JenkinsServerRouter",
+)
+
 try:
     from local_settings import *  # noqa
 except ImportError, e:
     pass
 
-from archives.tasks import process_build_artifacts, generate_checksums
+if QUEUE_NOTIFICATIONS:
+    # Only drain the queue, on the worker dedicated to it, if notifications
+    # are queued at all.
+    CELERYBEAT_SCHEDULE["process-queued-notifications"] = {
+        "task": "jenkins.tasks.process_queued_notifications",
+        "schedule": timedelta(seconds=5),
+    }
+    CELERY_ROUTES = (
+        {"jenkins.tasks.process_queued_notifications": {
+            "queue": "notifications"}},
+    ) + tuple(CELERY_ROUTES)
+
+from archives.tasks import process_build_artifacts
 from projects.tasks import process_build_dependencies
-POST_BUILD_TASKS=[process_build_dependencies, process_build_artifacts, generate_checksums]
+# process_build_artifacts queues generate_checksums once the artifacts have
+# been archived.
+POST_BUILD_TASKS=[process_build_dependencies, process_build_artifacts]
@@ -69,3 +69,54 @@ class DependencyBuildAPITest(APITestCase):
 
         self.assertEqual(status.HTTP_202_ACCEPTED, response.status_code)
         self.assertFalse(build_job_mock.delay.called)
+
+
+class BuildAPITest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("testing")
+        self.client.force_authenticate(user=self.user)
+
+    def test_build_list(self):
+        """
+        Lists of builds shouldn't include the console log and parameters.
+        """
+        build = BuildFactory.create(console_log="Log")
+
+        response = self.client.get(reverse("build-list"))
+
+        self.assertEqual([build.number], [x["number"] for x in response.data])
+        self.assertEqual(build.url, response.data[0]["url"])
+        self.assertNotIn("id", response.data[0])
+        self.assertEqual(
+            "http://testserver" +
+            reverse("job-detail", kwargs={"pk": build.job.pk}),
+            response.data[0]["job"])
+        self.assertNotIn("console_log", response.data[0])
+        self.assertNotIn("parameters", response.data[0])
+
+    def test_build_list_matches_detail(self):
+        """
+        Builds in lists have the same fields as the detail view, other than
+        the console log and parameters.
+        """
+        build = BuildFactory.create()
+
+        summary = self.client.get(reverse("build-list")).data[0]
+        detail = self.client.get(
+            reverse("build-detail", kwargs={"pk": build.pk})).data
+
+        self.assertEqual(
+            set(detail) - set(["console_log", "parameters"]), set(summary))
+
+    def test_build_detail(self):
+        """
+        A single build should include all the details.
+        """
+        build = BuildFactory.create(console_log="Log")
+
+        response = self.client.get(
+            reverse("build-detail", kwargs={"pk": build.pk}))
+
+        self.assertEqual("Log", response.data["console_log"])
+        self.assertIn("parameters", response.data)
@@ -11,4 +11,7 @@ import os
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "capomastro.settings")
 
 from django.core.wsgi import get_wsgi_application
-application = get_wsgi_application()
+from jenkins.wsgi import NotificationDispatcher
+
+# Jenkins notifications skip the middleware, which they don't need.
+application = NotificationDispatcher(get_wsgi_application())
@@ -0,0 +1,295 @@
+import threading
+from urllib import quote
+from urlparse import urljoin
+
+import requests
+from jenkinsapi.utils.requester import Requester
+
+
+# Only the fields of a build that import_build_for_job stores.
+BUILD_TREE = (
+    "result,duration,url,building,"
+    "actions[parameters[name,value]],"
+    "artifacts[fileName,relativePath]")
+
+
+def get_job_url(server, job_name):
+    """
+    Returns the URL for a job on the server, with a trailing /.
+    """
+    return urljoin(
+        server.url.rstrip("/") + "/", "job/%s/" % quote(job_name, safe=""))
+
+
+def get_build_url(server, job_name, number):
+    """
+    Returns the URL for a build of a job on the server, with a trailing /.
+    """
+    return "%s%d/" % (get_job_url(server, job_name), number)
+
+
+class ServerPool(object):
+    """
+    A cache of objects for talking to Jenkins servers, shared by everything
+    in this worker process.
+
+    Objects are keyed by the server and its credentials, so changing the
+    details of a server will never reuse an old object.
+    """
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def get(self, server, factory):
+        """
+        Returns the object for the server, creating it with factory if needed.
+        """
+        key = (getattr(server, "pk", None), server.url, server.username,
+               server.password)
+        with self._lock:
+            if key not in self._items:
+                self._items[key] = factory()
+            return self._items[key]
+
+    def invalidate(self, server_pk):
+        """
+        Discards all objects for the server with server_pk.
+        """
+        with self._lock:
+            for key in [x for x in self._items if x[0] == server_pk]:
+                del self._items[key]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+sessions = ServerPool()
+requesters = ServerPool()
+
+
+class SessionRequester(Requester):
+    """
+    A jenkinsapi Requester that makes its requests with a shared Session, so
+    that HTTP connections to the server are kept alive between requests.
+    """
+    def __init__(self, session, *args, **kwargs):
+        super(SessionRequester, self).__init__(*args, **kwargs)
+        self.session = session
+
+    def get_url(self, url, params=None, headers=None):
+        request_kwargs = self.get_request_dict(params=params, headers=headers)
+        return self.session.get(
+            self._update_url_scheme(url), **request_kwargs)
+
+    def post_url(self, url, params=None, data=None, files=None,
+                 headers=None):
+        request_kwargs = self.get_request_dict(
+            params=params, data=data, files=files, headers=headers)
+        return self.session.post(
+            self._update_url_scheme(url), **request_kwargs)
+
+
+def create_session(server):
+    """
+    Returns a new requests Session authenticated for the server.
+    """
+    session = requests.Session()
+    if server.username:
+        session.auth = (server.username, server.password)
+    return session
+
+
+def get_session(server):
+    """
+    Returns the pooled requests Session for the server.
+    """
+    return sessions.get(server, lambda: create_session(server))
+
+
+def get_requester(server):
+    """
+    Returns the pooled jenkinsapi Requester for the server.
+    """
+    return requesters.get(server, lambda: SessionRequester(
+        get_session(server), server.username, server.password,
+        baseurl=server.url))
+
+
+def invalidate_server(server_pk):
+    """
+    Discards the pooled sessions and requesters for a server.
+    """
+    sessions.invalidate(server_pk)
+    requesters.invalidate(server_pk)
+
+
+def get_json(server, url, tree, timeout=None):
+    """
+    Fetches the JSON API for the url restricted to the fields in tree, waiting
+    at most timeout seconds for the server if a timeout is given.
+    """
+    response = get_session(server).get(
+        url + "api/json", params={"tree": tree}, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+
+def get_job_names(server):
+    """
+    Returns the set of names of the jobs on the server, with a single request.
+    """
+    data = get_json(server, server.url.rstrip("/") + "/", "jobs[name]")
+    return set(job["name"] for job in data.get("jobs", []))
+
+
+# The one minute averages of the load statistics that Jenkins keeps.
+LOAD_TREE = (
+    "busyExecutors[min[latest]],queueLength[min[latest]],"
+    "totalExecutors[min[latest]]")
+
+
+def get_server_load(server, timeout=None):
+    """
+    Returns a dictionary with the number of busy and total executors on the
+    server, and the length of its build queue, with a single request.
+    """
+    data = get_json(
+        server, server.url.rstrip("/") + "/overallLoad/", LOAD_TREE, timeout)
+    return dict(
+        (key, data.get(name, {}).get("min", {}).get("latest") or 0)
+        for key, name in [("busy", "busyExecutors"), ("queued", "queueLength"),
+                          ("total", "totalExecutors")])
+
+
+def _encode_xml(config_xml):
+    if isinstance(config_xml, unicode):
+        return config_xml.encode("utf-8")
+    return config_xml
+
+
+def create_job(server, job_name, config_xml):
+    """
+    Creates a job on the server with the config_xml.
+    """
+    response = get_session(server).post(
+        server.url.rstrip("/") + "/createItem", params={"name": job_name},
+        data=_encode_xml(config_xml),
+        headers={"Content-Type": "application/xml"})
+    response.raise_for_status()
+
+
+def update_job_config(server, job_name, config_xml):
+    """
+    Replaces the config of an existing job on the server with config_xml.
+    """
+    response = get_session(server).post(
+        get_job_url(server, job_name) + "config.xml",
+        data=_encode_xml(config_xml),
+        headers={"Content-Type": "application/xml"})
+    response.raise_for_status()
+
+
+def parse_build_details(data):
+    """
+    Converts the JSON API data for a build to a dictionary with the status,
+    duration, url, parameters and artifacts.
+
+    Artifacts are returned as a list of (filename, url) tuples.
+    """
+    parameters = []
+    for action in data.get("actions", []):
+        if action and "parameters" in action:
+            parameters = action["parameters"]
+            break
+    build_url = data["url"]
+    artifacts = [
+        (artifact["fileName"],
+         "%s/artifact/%s" % (build_url.rstrip("/"), artifact["relativePath"]))
+        for artifact in data.get("artifacts", [])]
+    return {
+        "status": data.get("result"),
+        "duration": data.get("duration"),
+        "url": build_url,
+        "parameters": parameters,
+        "artifacts": artifacts,
+    }
+
+
+def get_build_details(server, job_name, number):
+    """
+    Fetches the details of a build with a single request to the server.
+    """
+    data = get_json(
+        server, get_build_url(server, job_name, number), BUILD_TREE)
+    return parse_build_details(data)
+
+
+def get_build_numbers(server, job_name):
+    """
+    Returns the numbers of all the builds of a job that have finished, with a
+    single request to the server.
+    """
+    data = get_json(
+        server, get_job_url(server, job_name), "allBuilds[number,building]")
+    return [build["number"] for build in data.get("allBuilds", [])
+            if not build.get("building")]
+
+
+# The latest build, and a range of the builds from the newest, with the
+# fields get_build_states needs. Jenkins caps "builds" at 100, "allBuilds"
+# honours the whole range.
+BUILD_STATES_TREE = (
+    "lastBuild[number],allBuilds[number,building,result,url]{0,%d}")
+
+
+def get_build_states(server, job_name, oldest, newest=None):
+    """
+    Returns a dictionary mapping the number of each build of a job, from the
+    latest back to build number oldest, to whether it's building, its result
+    and URL.
+
+    Jenkins lists builds newest first, so only the builds back to oldest are
+    fetched, with a single request if there are no builds after newest, the
+    newest we know of, and a second one to fetch the rest if there are.
+    """
+    url = get_job_url(server, job_name)
+    count = max(newest or oldest, oldest) - oldest + 1
+    data = get_json(server, url, BUILD_STATES_TREE % count)
+    last = (data.get("lastBuild") or {}).get("number") or 0
+    if last - oldest + 1 > count:
+        data = get_json(server, url, BUILD_STATES_TREE % (last - oldest + 1))
+    return dict(
+        (build["number"], {"building": build.get("building"),
+                           "result": build.get("result"),
+                           "url": build.get("url")})
+        for build in data.get("allBuilds", []))
+
+
+def iter_console_log(server, job_name, number, start=0,
+                     chunk_size=256 * 1024):
+    """
+    Yields the console log for a build in chunks of at most chunk_size bytes,
+    starting from the byte offset start.
+
+    This uses the progressive text API, which tells us where the text ended
+    and whether Jenkins has more to send.
+    """
+    url = get_build_url(server, job_name, number) + "logText/progressiveText"
+    session = get_session(server)
+    more_data = True
+    while more_data:
+        response = session.get(url, params={"start": start}, stream=True)
+        try:
+            response.raise_for_status()
+            text_size = int(response.headers.get("X-Text-Size", -1))
+            more_data = response.headers.get("X-More-Data") == "true"
+            # Jenkins reports where the text it sent ends, if that's where we
+            # started there's nothing new, and polling again won't help.
+            if text_size == start:
+                break
+            for data in response.iter_content(chunk_size):
+                yield data
+            start = text_size
+        finally:
+            response.close()
@@ -11,7 +11,7 @@ class JSONField(models.Field):
     __metaclass__ = models.SubfieldBase
 
     def to_python(self, value):
-        if isinstance(value, dict):
+        if isinstance(value, (dict, list)):
             return value
         else:
             if not value:
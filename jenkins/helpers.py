@@ -1,11 +1,18 @@
+from datetime import timedelta
 import logging
 
 from django.conf import settings
-from celery import chain
+from django.core.cache import cache
+from django.utils import timezone
+from celery import chain, group
+from requests.exceptions import RequestException
 
-from jenkins.models import Job
+from jenkins.lookups import lookups
+from jenkins.models import Job, Build, BuildRequest
 from jenkins.utils import generate_job_name
-from jenkins.tasks import import_build_for_job
+from jenkins.client import get_build_numbers, get_job_names, get_server_load
+from jenkins.tasks import (
+    import_build_for_job, import_builds, sync_server_jobs)
 
 
 def create_job(jobtype, server):
@@ -17,27 +24,147 @@ def create_job(jobtype, server):
     return job
 
 
-def import_builds_for_job(job_pk):
+def get_server_load_key(server_pk):
+    return "jenkins.server.load.%d" % server_pk
+
+
+def cache_server_load(server):
     """
-    Import all Builds for a job using the job_pk.
+    Samples the load of the server and caches it for
+    SERVER_LOAD_CACHE_TIMEOUT seconds.
 
-    TODO: Add testing - only used by command-line tool just now.
+    Returns the load, or None if it couldn't be sampled.
     """
-    job = Job.objects.get(pk=job_pk)
+    try:
+        load = get_server_load(
+            server, timeout=getattr(settings, "SERVER_LOAD_TIMEOUT", 5))
+    except (RequestException, ValueError):
+        logging.exception("Error sampling the load of %s" % server)
+        # Replace the previous sample, the load of the server is unknown now.
+        load = {}
+    cache.set(
+        get_server_load_key(server.pk), load,
+        getattr(settings, "SERVER_LOAD_CACHE_TIMEOUT", 30))
+    return load or None
 
-    logging.info("Located job %s\n" % job)
 
-    client = job.server.get_client()
+def get_least_loaded_job(jobs):
+    """
+    Returns the job on the server with the shortest build queue and then the
+    most free executors.
+
+    The loads are only read from the samples cached by the
+    sample_server_loads task, the servers aren't contacted here. Servers
+    whose load is unknown come last, and the first job wins a tie.
+    """
+    if len(jobs) == 1:
+        return jobs[0]
+
+    loads = cache.get_many(
+        [get_server_load_key(job.server_id) for job in jobs])
 
+    def get_load(item):
+        index, job = item
+        load = loads.get(get_server_load_key(job.server_id))
+        if not load:
+            return (1, 0, 0, index)
+        return (0, load["queued"], load["busy"] - load["total"], index)
+    return min(enumerate(jobs), key=get_load)[1]
+
+
+def import_builds_for_job(job_pk, concurrency=None):
+    """
+    Queues importing all the finished builds of a job from Jenkins, that
+    haven't already been imported.
+
+    The builds are shared between at most concurrency tasks, the
+    max_concurrency of the server by default, so that we don't swamp the
+    Jenkins server, and returns the GroupResult, or None if there's nothing to
+    import.
+    """
+    job = Job.objects.get(pk=job_pk)
+    concurrency = concurrency or job.server.max_concurrency
+    logging.info("Located job %s\n" % job)
     logging.info("Using server at %s\n" % job.server.url)
 
-    jenkins_job = client.get_job(job.name)
+    build_numbers = get_build_numbers(job.server, job.name)
+    existing_numbers = set(job.build_set.values_list("number", flat=True))
+    Build.objects.bulk_create([
+        Build(job=job, number=number, phase=Build.FINALIZED)
+        for number in build_numbers if number not in existing_numbers])
 
-    good_build_numbers = list(jenkins_job.get_build_ids())
-    logging.info("%s\n" % good_build_numbers)
+    finished_numbers = set(build_numbers)
+    build_pks = [
+        pk for pk, number in job.build_set.filter(
+            imported_at__isnull=True).order_by("number").values_list(
+            "pk", "number") if number in finished_numbers]
+    logging.info(
+        "Importing %d of %d builds for %s" % (
+            len(build_pks), len(build_numbers), job))
+    if not build_pks:
+        return
+    return group(
+        import_builds.s(build_pks[lane::concurrency])
+        for lane in range(min(concurrency, len(build_pks)))).apply_async()
 
-    for build_number in good_build_numbers:
-        import_build_for_job(job.pk, build_number)
+
+def sync_jobs(jobs, concurrency=None, force=False, dry_run=False):
+    """
+    Queues pushing the config for the jobs to their servers, where it has
+    changed or the job is missing.
+
+    The names of the jobs on each server are fetched with a single request,
+    and the jobs for each server are shared between at most concurrency
+    tasks, the max_concurrency of the server by default. A dry run queues
+    nothing, and works out what would be pushed here instead.
+
+    Returns a tuple of the list of (job name, server name, action) results
+    already known, which includes the jobs on servers whose jobs couldn't be
+    listed as "failed", and the GroupResult of the queued tasks, or None if
+    nothing was queued.
+    """
+    jobs_by_server = {}
+    for job in jobs.select_related("server"):
+        jobs_by_server.setdefault(job.server, []).append((job.pk, job.name))
+
+    results = []
+    tasks = []
+    for server, server_jobs in jobs_by_server.items():
+        try:
+            remote_names = get_job_names(server)
+        except (RequestException, ValueError):
+            logging.exception("Error listing the jobs on %s" % server)
+            results.extend(
+                (name, server.name, "failed") for pk, name in server_jobs)
+            continue
+        logging.info(
+            "Synchronising %d jobs with %s" % (len(server_jobs), server))
+        if dry_run:
+            results.extend(sync_server_jobs(
+                [pk for pk, name in server_jobs],
+                [name for pk, name in server_jobs if name in remote_names],
+                force=force, dry_run=True))
+            continue
+        lanes = min(concurrency or server.max_concurrency, len(server_jobs))
+        for lane in range(lanes):
+            lane_jobs = server_jobs[lane::lanes]
+            tasks.append(sync_server_jobs.s(
+                [pk for pk, name in lane_jobs],
+                [name for pk, name in lane_jobs if name in remote_names],
+                force=force))
+    if not tasks:
+        return results, None
+    return results, group(tasks).apply_async()
+
+
+def get_postprocess_chain(build):
+    """
+    Returns the chain of tasks that import the build from Jenkins, followed by
+    any tasks that should be executed post build.
+    """
+    post_build_tasks = getattr(settings, "POST_BUILD_TASKS", [])
+    additional_tasks = [x.s() for x in post_build_tasks]
+    return chain(import_build_for_job.s(build.pk), *additional_tasks)
 
 
 def postprocess_build(build):
@@ -48,7 +175,128 @@ def postprocess_build(build):
     When a build completes, execute any tasks that should be executed post
     build.
     """
-    post_build_tasks = getattr(settings, "POST_BUILD_TASKS", [])
-    additional_tasks = [x.s() for x in post_build_tasks]
-    return chain(
-        import_build_for_job.s(build.pk), *additional_tasks).apply_async()
+    return get_postprocess_chain(build).apply_async()
+
+
+def postprocess_builds(builds):
+    """
+    Queues the postprocessing for several builds as a single group.
+
+    Returns None if there are no builds to process.
+    """
+    if not builds:
+        return
+    return group(
+        [get_postprocess_chain(build) for build in builds]).apply_async()
+
+
+def update_build_from_notification(job, notification):
+    """
+    Creates or updates the Build for a job from a Jenkins notification.
+
+    Jenkins can resend notifications, so this is safe to replay, a build is
+    only finalized once.
+
+    Returns the Build if this notification finalized it, otherwise None.
+    """
+    build_id = ""
+    build_number = notification["build"]["number"]
+    parameters = notification["build"].get("parameters") or {}
+
+    # Translate the build phase name, as we may be running with an older
+    # version of the Notification plugin
+    build_phase = Build.translate_build_phase(notification["build"]["phase"])
+
+    if "parameters" in notification["build"]:
+        build_id = notification["build"]["parameters"].get("BUILD_ID")
+
+    if Build.STARTED == build_phase:
+        # A late STARTED for a build we already know about changes nothing.
+        build, created = job.build_set.get_or_create(
+            number=build_number,
+            defaults={"build_id": build_id, "phase": build_phase})
+        if created:
+            link_build_request(build, parameters)
+    elif Build.FINALIZED == build_phase:
+        build_details = {
+            "status": notification["build"]["status"],
+            "url": notification["build"]["url"],
+            "phase": build_phase}
+        defaults = dict(build_details, build_id=build_id)
+        existing_build, created = job.build_set.get_or_create(
+            number=build_number, defaults=defaults)
+        if created:
+            link_build_request(existing_build, parameters)
+            return existing_build
+
+        # Only one notification can move the build to FINALIZED.
+        updated = job.build_set.filter(pk=existing_build.pk).exclude(
+            phase=Build.FINALIZED).update(**build_details)
+        if not updated:
+            logging.info(
+                "Ignoring duplicate %s notification for %s #%s",
+                build_phase, job, build_number)
+            return
+        return job.build_set.get(pk=existing_build.pk)
+
+
+def link_build_request(build, parameters):
+    """
+    Links the oldest queued BuildRequest for the job that matches the
+    parameters of the build to the build.
+
+    Requests older than BUILD_REQUEST_EXPIRY seconds are never linked, they
+    were never started, and would otherwise claim the builds of newer
+    requests.
+
+    Returns the BuildRequest, or None if no queued request matches.
+    """
+    expiry = getattr(settings, "BUILD_REQUEST_EXPIRY", 3600)
+    queued = BuildRequest.objects.filter(
+        job=build.job_id, status=BuildRequest.QUEUED,
+        requested_at__gte=timezone.now() - timedelta(seconds=expiry))
+    for request in queued:
+        if request.matches_build_parameters(parameters):
+            if queued.filter(pk=request.pk).update(
+                    build=build, status=BuildRequest.STARTED):
+                return request
+
+
+def is_valid_notification(notification):
+    """
+    Returns True if the notification has the details needed to update a Build.
+
+    FINALIZED notifications must also carry the status and url of the build.
+    """
+    try:
+        build = notification["build"]
+        keys = ["number", "phase"]
+        if Build.translate_build_phase(build["phase"]) == Build.FINALIZED:
+            keys.extend(["status", "url"])
+        return bool(notification["name"]) and all(key in build for key in keys)
+    except (KeyError, TypeError):
+        return False
+
+
+def get_jobs_for_notifications(server_names, token=None,
+                               token_required=False):
+    """
+    Resolves a list of (server pk, job name) pairs to Jobs with at most a query
+    for the servers and a query for the jobs that aren't already cached.
+
+    If a token is given, servers that don't accept the token are treated as
+    unknown, as are servers without a token if token_required is True.
+
+    Returns a tuple of the set of known server pks, and a dictionary mapping
+    (server pk, job name) to the Job.
+    """
+    servers = lookups.get_servers(set(x[0] for x in server_names))
+    known_servers = set(
+        pk for pk, server in servers.items()
+        if token is None or server.check_notification_token(
+            token, required=token_required))
+    jobs = {}
+    if known_servers:
+        jobs = lookups.get_jobs(
+            set(x for x in server_names if x[0] in known_servers))
+    return known_servers, jobs
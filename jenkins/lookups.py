@@ -0,0 +1,106 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+VERSION_KEY = "jenkins.lookups.version"
+
+
+class NotificationLookups(object):
+    """
+    An in-process cache of JenkinsServers by pk, and Jobs by server pk and
+    name, for resolving notifications without querying for them each time.
+
+    Unknown servers and jobs aren't cached. Saving or deleting a server or job
+    calls invalidate, which clears this cache and changes a version stored in
+    the Django cache. The default local-memory cache isn't shared, so other
+    processes only drop what they've cached once it's NOTIFICATION_LOOKUPS_TTL
+    seconds old, unless CACHES is configured with a backend they share.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._expires = 0
+        self._servers = {}
+        self._jobs = {}
+
+    def _check_version(self):
+        """
+        Clears the cache if it has expired, or if another process has
+        invalidated it since it was filled. Must be called with the lock held.
+        """
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+            version = cache.get(VERSION_KEY)
+        now = time.time()
+        if version != self._version or now >= self._expires:
+            self._servers.clear()
+            self._jobs.clear()
+            self._version = version
+            self._expires = now + getattr(
+                settings, "NOTIFICATION_LOOKUPS_TTL", 60)
+
+    def get_servers(self, server_pks):
+        """
+        Returns a dictionary mapping the pks of the known servers to the
+        JenkinsServer, with at most one query for those not already cached.
+        """
+        from jenkins.models import JenkinsServer
+        with self._lock:
+            self._check_version()
+            missing = set(server_pks) - set(self._servers)
+            if missing:
+                self._servers.update(
+                    (server.pk, server) for server in
+                    JenkinsServer.objects.filter(pk__in=missing))
+            return dict((pk, self._servers[pk]) for pk in server_pks
+                        if pk in self._servers)
+
+    def get_jobs(self, server_names):
+        """
+        Returns a dictionary mapping the known (server pk, job name) pairs to
+        the Job, with at most one query for those not already cached.
+        """
+        from jenkins.models import Job
+        with self._lock:
+            self._check_version()
+            missing = set(server_names) - set(self._jobs)
+            if missing:
+                self._jobs.update(
+                    ((job.server_id, job.name), job) for job in
+                    Job.objects.filter(
+                        server__pk__in=set(x[0] for x in missing),
+                        name__in=set(x[1] for x in missing)))
+            return dict((key, self._jobs[key]) for key in server_names
+                        if key in self._jobs)
+
+    def get_server(self, server_pk):
+        """
+        Returns the JenkinsServer with server_pk, or None.
+        """
+        return self.get_servers([server_pk]).get(server_pk)
+
+    def get_job(self, server_pk, name):
+        """
+        Returns the Job on the server with the name, or None.
+        """
+        return self.get_jobs([(server_pk, name)]).get((server_pk, name))
+
+    def invalidate(self):
+        """
+        Clears the cache in this process, and in the others that share the
+        Django cache.
+        """
+        with self._lock:
+            self._servers.clear()
+            self._jobs.clear()
+            self._version = uuid.uuid4().hex
+            cache.set(VERSION_KEY, self._version, None)
+
+
+lookups = NotificationLookups()
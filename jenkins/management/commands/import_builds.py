@@ -1,9 +1,11 @@
 from optparse import make_option
+import time
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 
 from jenkins.helpers import import_builds_for_job
+from jenkins.utils import can_wait_for_results
 
 
 class Command(BaseCommand):
@@ -12,8 +14,35 @@ class Command(BaseCommand):
     option_list = BaseCommand.option_list + (
         make_option(
             "-j", dest="job_id",
-            help="Job Id to process"),)
+            help="Job Id to process"),
+        make_option(
+            "--concurrency", dest="concurrency", type="int", default=None,
+            help="Number of builds to import from the server at once, the "
+                 "server's max_concurrency by default"),
+        make_option(
+            "--wait", action="store_true", dest="wait", default=False,
+            help="Wait for the import to finish and report the throughput, "
+                 "which needs a CELERY_RESULT_BACKEND"),
+    )
 
     def handle(self, *args, **options):
-        import_builds_for_job(int(options['job_id']))
+        if not options["job_id"]:
+            raise CommandError("must provide a job id")
+        if options["wait"] and not can_wait_for_results():
+            raise CommandError(
+                "--wait needs a CELERY_RESULT_BACKEND to fetch the results")
+        start = time.time()
+        result = import_builds_for_job(
+            int(options["job_id"]), concurrency=options["concurrency"])
         transaction.commit_unless_managed()
+        if result is None:
+            self.stdout.write("No builds to import\n")
+            return
+
+        self.stdout.write("Queued %d import tasks\n" % len(result))
+        if options["wait"]:
+            imported = sum(result.get())
+            elapsed = time.time() - start
+            self.stdout.write(
+                "Imported %d builds in %.1fs (%.1f builds/s)\n" % (
+                    imported, elapsed, imported / max(elapsed, 0.001)))
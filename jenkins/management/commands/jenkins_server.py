@@ -3,6 +3,7 @@ from django.db import transaction
 
 from jenkins.models import JenkinsServer
 from jenkins.management.helpers import verify_jenkinsserver
+from jenkins.routers import get_queue_backlog
 
 
 def list_servers(stdout):
@@ -17,6 +18,27 @@ def list_servers(stdout):
         stdout.write("No servers")
 
 
+def list_queues(stdout):
+    """
+    Writes the queue for each server, the number of tasks waiting in it, and
+    the command to run a worker for it.
+    """
+    servers = list(JenkinsServer.objects.all())
+    if not servers:
+        stdout.write("No servers")
+        return
+    backlog = get_queue_backlog([s.get_queue_name() for s in servers])
+    max_name = max(len(s.name) for s in servers)
+    format_string = "{:<%d}  {:<20}  {:>7}  {}\n" % max_name
+    stdout.write(format_string.format("", "queue", "backlog", "worker"))
+    for server in servers:
+        queue = server.get_queue_name()
+        stdout.write(format_string.format(
+            server.name, queue, backlog[queue],
+            "celery -A capomastro worker -Q %s -c %d" % (
+                queue, server.max_concurrency)))
+
+
 def verify_server(name, stdout):
     try:
         server = JenkinsServer.objects.get(name=name)
@@ -37,6 +59,8 @@ class Command(BaseCommand):
     def handle(self, command, *args, **options):
         if command == "list":
             list_servers(self.stdout)
+        elif command == "queues":
+            list_queues(self.stdout)
         elif command == "verify":
             verify_server(args[0], self.stdout)
         transaction.commit_unless_managed()
@@ -0,0 +1,85 @@
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from jenkins.helpers import sync_jobs
+from jenkins.models import Job
+from jenkins.utils import can_wait_for_results
+
+
+ACTIONS = ["created", "updated", "unchanged", "failed"]
+
+
+class Command(BaseCommand):
+    help = "Push changed job configs to the Jenkins servers"
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            "--jobtype", dest="jobtype",
+            help="Name of the JobType to synchronise the jobs of"),
+        make_option(
+            "--server", dest="server",
+            help="Name of the JenkinsServer to synchronise the jobs of"),
+        make_option(
+            "--concurrency", dest="concurrency", type="int", default=None,
+            help="Number of jobs to push to each server at once, the server's "
+                 "max_concurrency by default"),
+        make_option(
+            "--force", action="store_true", dest="force", default=False,
+            help="Push jobs even if their config hasn't changed"),
+        make_option(
+            "--dry-run", action="store_true", dest="dry_run", default=False,
+            help="Report the jobs that would be pushed without pushing"),
+        make_option(
+            "--wait", action="store_true", dest="wait", default=False,
+            help="Wait for the jobs to be pushed and report the results, "
+                 "which needs a CELERY_RESULT_BACKEND"),
+    )
+
+    def handle(self, *args, **options):
+        if not (options["jobtype"] or options["server"]):
+            raise CommandError("must provide a jobtype or server")
+        if options["wait"] and not can_wait_for_results():
+            raise CommandError(
+                "--wait needs a CELERY_RESULT_BACKEND to fetch the results")
+        jobs = Job.objects.all()
+        if options["jobtype"]:
+            jobs = jobs.filter(jobtype__name=options["jobtype"])
+        if options["server"]:
+            jobs = jobs.filter(server__name=options["server"])
+
+        start = time.time()
+        results, queued = sync_jobs(
+            jobs, concurrency=options["concurrency"],
+            force=options["force"], dry_run=options["dry_run"])
+        if not results and queued is None:
+            self.stdout.write("No jobs to synchronise\n")
+            return
+
+        if queued is not None:
+            self.stdout.write(
+                "Queued %d synchronisation tasks\n" % len(queued))
+            if options["wait"]:
+                results.extend(x for task in queued.get() for x in task)
+            elif not results:
+                return
+        # Without --wait, this only reports the jobs that failed because
+        # their server couldn't be listed.
+        self.report(results, time.time() - start)
+
+    def report(self, results, elapsed):
+        """
+        Writes the jobs that were pushed, and a summary of the actions.
+        """
+        for job_name, server_name, action in sorted(results):
+            if action != "unchanged":
+                self.stdout.write(
+                    "%s: %s on %s\n" % (action, job_name, server_name))
+        counts = dict((action, 0) for action in ACTIONS)
+        for _, _, action in results:
+            counts[action] += 1
+        self.stdout.write(
+            ", ".join("%d %s" % (counts[x], x) for x in ACTIONS) +
+            " in %.1fs (%.1f jobs/s)\n" % (
+                elapsed, len(results) / max(elapsed, 0.001)))
@@ -14,11 +14,11 @@ def verify_jenkinsserver(server):
     """
     messages = []
     try:
-        client = server.get_client()
+        # Clients are lazy, so get_plugins makes the first request.
+        plugins = server.get_client().get_plugins()
     except HTTPError as e:
         messages.append("ERROR: %s" % str(e))
     else:
-        plugins = client.get_plugins()
         missing_plugins = []
         for plugin in REQUIRED_PLUGINS:
             if not plugin in plugins:
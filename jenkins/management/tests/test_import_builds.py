@@ -0,0 +1,65 @@
+from __future__ import unicode_literals
+
+from cStringIO import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.test.utils import override_settings
+
+import mock
+
+from jenkins.tests.factories import JobFactory
+
+
+class ImportBuildsCommandTest(TestCase):
+
+    @override_settings(CELERY_ALWAYS_EAGER=True)
+    def test_import_builds_and_wait(self):
+        """
+        With --wait the command should report how many builds were imported.
+        """
+        job = JobFactory.create()
+        stdout = StringIO()
+
+        with mock.patch(
+                "jenkins.helpers.get_build_numbers", return_value=[3, 2, 1]):
+            with mock.patch("jenkins.tasks.import_build_for_job"):
+                call_command(
+                    "import_builds", job_id=str(job.pk), concurrency=2,
+                    wait=True, stdout=stdout)
+
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual("Queued 2 import tasks", lines[0])
+        self.assertTrue(lines[1].startswith("Imported 3 builds in "))
+        self.assertEqual(3, job.build_set.count())
+
+    @override_settings(CELERY_ALWAYS_EAGER=False, CELERY_RESULT_BACKEND=None)
+    def test_import_builds_and_wait_without_result_backend(self):
+        """
+        Without a result backend --wait can't report the results, so nothing
+        should be queued.
+        """
+        job = JobFactory.create()
+
+        with mock.patch(
+                "jenkins.management.commands.import_builds."
+                "import_builds_for_job") as mock_import:
+            with self.assertRaises(CommandError):
+                call_command(
+                    "import_builds", job_id=str(job.pk), wait=True,
+                    stdout=StringIO())
+
+        self.assertFalse(mock_import.called)
+
+    def test_import_builds_with_nothing_to_import(self):
+        """
+        If there's nothing to import, the command should say so.
+        """
+        job = JobFactory.create()
+        stdout = StringIO()
+
+        with mock.patch("jenkins.helpers.get_build_numbers", return_value=[]):
+            call_command("import_builds", job_id=str(job.pk), stdout=stdout)
+
+        self.assertEqual("No builds to import\n", stdout.getvalue())
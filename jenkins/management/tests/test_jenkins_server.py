@@ -0,0 +1,32 @@
+from cStringIO import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+import mock
+
+from jenkins.tests.factories import JenkinsServerFactory
+
+
+class ListQueuesTest(TestCase):
+
+    def test_list_queues(self):
+        """
+        The queues command should list the queue, backlog and worker command
+        for each server.
+        """
+        server = JenkinsServerFactory.create(name="server", max_concurrency=2)
+        queue = "jenkins.server.%d" % server.pk
+        stdout = StringIO()
+
+        with mock.patch(
+                "jenkins.management.commands.jenkins_server.get_queue_backlog",
+                return_value={queue: 7}) as mock_backlog:
+            call_command("jenkins_server", "queues", stdout=stdout)
+
+        mock_backlog.assert_called_once_with([queue])
+        line = stdout.getvalue().splitlines()[1].split()
+        self.assertEqual(["server", queue, "7"], line[:3])
+        self.assertEqual(
+            "celery -A capomastro worker -Q %s -c 2" % queue,
+            " ".join(line[3:]))
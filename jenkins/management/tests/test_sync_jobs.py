@@ -0,0 +1,104 @@
+from __future__ import unicode_literals
+
+from cStringIO import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.test.utils import override_settings
+
+import mock
+
+from jenkins.tests.factories import JobFactory
+
+
+class SyncJobsCommandTest(TestCase):
+
+    @override_settings(
+        CELERY_ALWAYS_EAGER=True, NOTIFICATION_HOST="http://example.com")
+    def test_sync_jobs_and_wait(self):
+        """
+        With --wait the command should report the jobs that were pushed, and
+        a summary.
+        """
+        job1 = JobFactory.create(name="job1")
+        JobFactory.create(name="job2", jobtype=job1.jobtype)
+        stdout = StringIO()
+
+        with mock.patch(
+                "jenkins.helpers.get_job_names", return_value=set(["job2"])):
+            with mock.patch("jenkins.tasks.create_job"):
+                with mock.patch("jenkins.tasks.update_job_config"):
+                    call_command(
+                        "sync_jobs", jobtype=job1.jobtype.name, wait=True,
+                        stdout=stdout)
+
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual("Queued 2 synchronisation tasks", lines[0])
+        self.assertEqual("created: job1 on %s" % job1.server.name, lines[1])
+        self.assertTrue(lines[3].startswith(
+            "1 created, 1 updated, 0 unchanged, 0 failed in "))
+
+    @override_settings(NOTIFICATION_HOST="http://example.com")
+    def test_sync_jobs_dry_run(self):
+        """
+        With --dry-run the command should report what would be pushed without
+        queueing anything.
+        """
+        job = JobFactory.create(name="job1")
+        stdout = StringIO()
+
+        with mock.patch("jenkins.helpers.get_job_names", return_value=set()):
+            with mock.patch("jenkins.helpers.group") as mock_group:
+                call_command(
+                    "sync_jobs", jobtype=job.jobtype.name, dry_run=True,
+                    stdout=stdout)
+
+        self.assertFalse(mock_group.called)
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual("created: job1 on %s" % job.server.name, lines[0])
+        self.assertTrue(lines[1].startswith(
+            "1 created, 0 updated, 0 unchanged, 0 failed in "))
+
+    @override_settings(CELERY_ALWAYS_EAGER=False, CELERY_RESULT_BACKEND=None)
+    def test_sync_jobs_and_wait_without_result_backend(self):
+        """
+        Without a result backend --wait can't report the results, so nothing
+        should be queued.
+        """
+        job = JobFactory.create()
+
+        with mock.patch(
+                "jenkins.management.commands.sync_jobs."
+                "sync_jobs") as mock_sync:
+            with self.assertRaises(CommandError):
+                call_command(
+                    "sync_jobs", jobtype=job.jobtype.name, wait=True,
+                    stdout=StringIO())
+
+        self.assertFalse(mock_sync.called)
+
+    @override_settings(CELERY_ALWAYS_EAGER=False, CELERY_RESULT_BACKEND=None)
+    def test_sync_jobs_without_wait_or_result_backend(self):
+        """
+        Without --wait, the command only queues the tasks, which doesn't need
+        a result backend.
+        """
+        job = JobFactory.create()
+        stdout = StringIO()
+
+        with mock.patch(
+                "jenkins.management.commands.sync_jobs.sync_jobs",
+                return_value=([], [mock.Mock()])):
+            call_command(
+                "sync_jobs", jobtype=job.jobtype.name, stdout=stdout)
+
+        self.assertEqual(
+            "Queued 1 synchronisation tasks\n", stdout.getvalue())
+
+    def test_sync_jobs_requires_jobtype_or_server(self):
+        """
+        The command should refuse to push every job.
+        """
+        with self.assertRaises(CommandError):
+            call_command("sync_jobs")
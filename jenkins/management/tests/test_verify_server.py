@@ -24,7 +24,8 @@ class VerifyServerTest(TestCase):
             messages = verify_jenkinsserver(server)
 
         mock_jenkins.assert_called_with(
-            server.url, username=u"root", password=u"testing")
+            server.url, username=u"root", password=u"testing",
+            requester=mock.ANY, lazy=True)
         mock_jenkins.return_value.get_plugins.assert_called_once()
 
         self.assertEqual(
@@ -44,6 +45,24 @@ class VerifyServerTest(TestCase):
             messages = verify_jenkinsserver(server)
 
         mock_jenkins.assert_called_with(
-            server.url, username=u"root", password=u"testing")
+            server.url, username=u"root", password=u"testing",
+            requester=mock.ANY, lazy=True)
+        self.assertEqual(
+            ["ERROR: [Errno 401] No authentication"], messages)
+
+    def test_verify_server_with_authentication_error_on_first_request(self):
+        """
+        Clients don't connect until they're used, so authentication errors
+        can come from the first request.
+        """
+        server = JenkinsServerFactory.create()
+
+        with mock.patch(
+                "jenkins.models.Jenkins",
+                spec=jenkins.Jenkins) as mock_jenkins:
+            error = HTTPError(401, "No authentication")
+            mock_jenkins.return_value.get_plugins.side_effect = error
+            messages = verify_jenkinsserver(server)
+
         self.assertEqual(
             ["ERROR: [Errno 401] No authentication"], messages)
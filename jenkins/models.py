@@ -1,9 +1,19 @@
-from django.db import models
+import json
+import zlib
+from xml.etree.ElementTree import ParseError
+
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.crypto import constant_time_compare
 from django.utils.encoding import python_2_unicode_compatible
 from django.contrib.auth.models import User
 
 from jenkinsapi.jenkins import Jenkins
-from jenkins.utils import parse_parameters_from_job
+from jenkins.client import get_requester, invalidate_server
+from jenkins.lookups import lookups
+from jenkins.routers import get_queue_name
+from jenkins.utils import parse_parameters_from_job, get_content_hash
 from jenkins import fields
 
 
@@ -14,16 +24,52 @@ class JenkinsServer(models.Model):
     url = models.CharField(max_length=255, unique=True)
     username = models.CharField(max_length=255)
     password = models.CharField(max_length=255)
+    max_concurrency = models.PositiveIntegerField(
+        default=4, help_text="The most tasks that talk to this server at once")
+    notification_token = models.CharField(
+        max_length=64, blank=True,
+        help_text="If set, notifications from this server must include it")
 
     def __str__(self):
         return "%s (%s)" % (self.name, self.url)
 
+    def check_notification_token(self, token, required=False):
+        """
+        Returns True if notifications with token come from this server.
+
+        Servers without a notification token accept any notification, unless
+        a token is required.
+        """
+        if not self.notification_token:
+            return not required
+        return constant_time_compare(self.notification_token, token or "")
+
+    def get_queue_name(self):
+        """
+        Returns the Celery queue that tasks for this server are routed to.
+        """
+        return get_queue_name(self.pk)
+
     def get_client(self):
         """
         Returns a configured jenkinsapi Jenkins client.
+
+        The client doesn't poll the server until it's needed. Its connections
+        are shared by the worker process, but each client polls afresh, so it
+        sees jobs created since the last one.
         """
         return Jenkins(
-            self.url, username=self.username, password=self.password)
+            self.url, username=self.username, password=self.password,
+            requester=get_requester(self), lazy=True)
+
+
+@receiver(post_save, sender=JenkinsServer)
+@receiver(post_delete, sender=JenkinsServer)
+def invalidate_jenkinsserver_clients(sender, instance, **kwargs):
+    """
+    Discard any pooled clients when the server details change.
+    """
+    invalidate_server(instance.pk)
 
 
 @python_2_unicode_compatible
@@ -35,15 +81,27 @@ class JobType(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(null=True, blank=True)
     config_xml = models.TextField()
+    # The parameters parsed from config_xml when it was saved.
+    parameters = fields.JSONField(null=True, blank=True, editable=False)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        try:
+            self.parameters = parse_parameters_from_job(self.config_xml)
+        except ParseError:
+            self.parameters = None
+        super(JobType, self).save(*args, **kwargs)
+
     def get_parameters(self):
         """
-        Parse the config_xml and extract the parameters.
+        Returns the parameters from the config_xml, only parsing it if the
+        parameters weren't stored when it was saved.
         """
-        return parse_parameters_from_job(self.config_xml)
+        if self.parameters is None:
+            return parse_parameters_from_job(self.config_xml)
+        return self.parameters
 
 
 @python_2_unicode_compatible
@@ -52,6 +110,9 @@ class Job(models.Model):
     server = models.ForeignKey(JenkinsServer)
     jobtype = models.ForeignKey(JobType)
     name = models.CharField(max_length=255)
+    # The hash of the config last pushed to the server.
+    config_fingerprint = models.CharField(
+        max_length=40, blank=True, editable=False)
 
     class Meta:
         unique_together = "server", "name"
@@ -60,6 +121,53 @@ class Job(models.Model):
         return self.name
 
 
+@receiver(post_save, sender=JenkinsServer)
+@receiver(post_delete, sender=JenkinsServer)
+@receiver(post_save, sender=Job)
+@receiver(post_delete, sender=Job)
+def invalidate_notification_lookups(sender, instance, **kwargs):
+    """
+    Discard the cached servers and jobs when any of them change.
+    """
+    lookups.invalidate()
+
+
+class BuildQuerySet(models.query.QuerySet):
+
+    # Columns that are only needed when displaying a single build.
+    DETAIL_FIELDS = ("console_log", "parameters")
+
+    def summary(self):
+        """
+        Returns builds without the console log and parameters.
+        """
+        return self.defer(*self.DETAIL_FIELDS)
+
+    def with_details(self):
+        """
+        Returns builds with all their fields loaded.
+        """
+        return self.defer(None)
+
+
+class BuildManager(models.Manager):
+    """
+    Builds are loaded without their console log and parameters unless they're
+    requested with with_details(), listing builds doesn't need them and the
+    parameters are decoded from JSON for every build.
+    """
+    use_for_related_fields = True
+
+    def get_queryset(self):
+        return BuildQuerySet(self.model, using=self._db).summary()
+
+    def summary(self):
+        return self.get_queryset()
+
+    def with_details(self):
+        return self.get_queryset().with_details()
+
+
 @python_2_unicode_compatible
 class Build(models.Model):
     # Define the phase names
@@ -78,13 +186,36 @@ class Build(models.Model):
     parameters = fields.JSONField(blank=True, null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     requested_by = models.ForeignKey(User, null=True, editable=False, blank=True)
+    imported_at = models.DateTimeField(null=True, editable=False)
+
+    objects = BuildManager()
 
     class Meta:
         ordering = ["-number"]
+        unique_together = "job", "number"
 
     def __str__(self):
         return self.build_id or "%s %s" % (self.job, self.number)
 
+    def __eq__(self, other):
+        # Builds with deferred fields are instances of a subclass of Build,
+        # which Model.__eq__ doesn't consider equal to a Build.
+        return (isinstance(other, Build) and
+                self._get_pk_val() == other._get_pk_val())
+
+    def __hash__(self):
+        return hash(self._get_pk_val())
+
+    def get_console_log(self):
+        """
+        Returns the text of the console log, from the chunked log store if
+        it has been imported there.
+        """
+        try:
+            return self.console.read()
+        except ConsoleLog.DoesNotExist:
+            return self.console_log
+
     @staticmethod
     def translate_build_phase(phase):
         """
@@ -102,5 +233,172 @@ class Artifact(models.Model):
     filename = models.CharField(max_length=255)
     url = models.CharField(max_length=255)
 
+    class Meta:
+        unique_together = "build", "filename"
+
     def __str__(self):
         return "%s for %s" % (self.filename, self.build)
+
+
+@python_2_unicode_compatible
+class ConsoleLog(models.Model):
+    """
+    The console log of a build, stored as a sequence of compressed chunks so
+    that the text never has to be held in memory in full.
+    """
+    build = models.OneToOneField(Build, related_name="console")
+    size = models.BigIntegerField(default=0)
+    line_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return "Console log for %s" % self.build
+
+    def append(self, data):
+        """
+        Compresses and stores data as the next chunk of the log, and saves the
+        new size and line count with it, so an interrupted import resumes
+        after the last chunk stored.
+        """
+        if not data:
+            return
+        line_count = data.count(b"\n")
+        with transaction.atomic():
+            self.chunks.create(
+                offset=self.size, size=len(data), first_line=self.line_count,
+                line_count=line_count, data=zlib.compress(data))
+            self.size += len(data)
+            self.line_count += line_count
+            self.save(update_fields=["size", "line_count"])
+
+    def read(self, start=0, end=None):
+        """
+        Returns the bytes of the log from start up to end, only decompressing
+        the chunks that overlap the range.
+        """
+        end = self.size if end is None else min(end, self.size)
+        if start >= end:
+            return b""
+        chunks = self.chunks.filter(offset__lt=end).order_by("offset")
+        if start > 0:
+            first_offset = self.chunks.filter(
+                offset__lte=start).aggregate(
+                models.Max("offset"))["offset__max"] or 0
+            chunks = chunks.filter(offset__gte=first_offset)
+        result = []
+        for chunk in chunks:
+            data = zlib.decompress(chunk.data)
+            result.append(
+                data[max(start - chunk.offset, 0):end - chunk.offset])
+        return b"".join(result)
+
+    def get_line_offset(self, line):
+        """
+        Returns the byte offset that line (counting from 0) starts at, using
+        the line index of the chunks to decompress at most one chunk.
+        """
+        if line <= 0:
+            return 0
+        if line > self.line_count:
+            return self.size
+        chunk = self.chunks.filter(
+            first_line__lt=line, line_count__gt=0).order_by("-offset")[0]
+        data = zlib.decompress(chunk.data)
+        position = -1
+        for _ in range(line - chunk.first_line):
+            position = data.index(b"\n", position + 1)
+        return chunk.offset + position + 1
+
+    def read_lines(self, start=0, end=None):
+        """
+        Returns the bytes of the lines of the log from start up to end.
+        """
+        if end is not None:
+            end = self.get_line_offset(end)
+        return self.read(self.get_line_offset(start), end)
+
+
+class ConsoleLogChunk(models.Model):
+    """
+    A compressed chunk of a ConsoleLog, starting at offset bytes and
+    first_line lines into the log.
+    """
+    log = models.ForeignKey(ConsoleLog, related_name="chunks")
+    offset = models.BigIntegerField()
+    size = models.IntegerField()
+    first_line = models.IntegerField()
+    line_count = models.IntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        ordering = ["offset"]
+        unique_together = "log", "offset"
+
+
+# Parameters that don't change what a build does, so requests that differ only
+# in these are coalesced.
+IGNORED_REQUEST_PARAMETERS = ("REQUESTOR",)
+
+
+@python_2_unicode_compatible
+class BuildRequest(models.Model):
+    """
+    A request to build a job that has been sent to Jenkins.
+
+    Identical requests made while one is queued are counted in coalesced
+    instead of being sent again, and the request is linked to the build when
+    Jenkins starts it. Requests that are never started expire.
+    """
+    QUEUED = "QUEUED"
+    STARTED = "STARTED"
+    EXPIRED = "EXPIRED"
+
+    job = models.ForeignKey(Job)
+    parameters = fields.JSONField(blank=True, null=True, editable=False)
+    parameters_hash = models.CharField(max_length=40, db_index=True)
+    status = models.CharField(max_length=25, default=QUEUED)
+    build = models.ForeignKey(Build, null=True, blank=True)
+    coalesced = models.IntegerField(default=0)
+    requested_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["pk"]
+
+    def __str__(self):
+        return "Request %s for %s" % (self.pk, self.job)
+
+    @staticmethod
+    def get_parameters_hash(parameters):
+        """
+        Returns a hash that is the same for parameters that request the same
+        build.
+        """
+        parameters = dict(
+            (name, value) for name, value in (parameters or {}).items()
+            if name not in IGNORED_REQUEST_PARAMETERS)
+        return get_content_hash(json.dumps(parameters, sort_keys=True))
+
+    def matches_build_parameters(self, parameters):
+        """
+        Returns True if the build parameters include all the parameters of
+        this request, Jenkins adds the defaults for any we didn't send.
+        """
+        return all(
+            parameters.get(name) == value
+            for name, value in (self.parameters or {}).items()
+            if name not in IGNORED_REQUEST_PARAMETERS)
+
+
+@python_2_unicode_compatible
+class QueuedNotification(models.Model):
+    """
+    A raw Jenkins notification that has been accepted, but not yet applied.
+    """
+    server = models.ForeignKey(JenkinsServer)
+    payload = models.TextField()
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["pk"]
+
+    def __str__(self):
+        return "Notification %s from %s" % (self.pk, self.server)
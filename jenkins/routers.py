@@ -0,0 +1,91 @@
+from django.conf import settings
+
+
+def get_server_for_job(job_pk):
+    from jenkins.models import Job
+    return Job.objects.filter(pk=job_pk).values_list(
+        "server_id", flat=True)[0]
+
+
+def get_server_for_build(build_pk):
+    from jenkins.models import Build
+    return Build.objects.filter(pk=build_pk).values_list(
+        "job__server_id", flat=True)[0]
+
+
+def get_server_for_archived_artifact(archived_artifact_pk):
+    from archives.models import ArchiveArtifact
+    return ArchiveArtifact.objects.filter(pk=archived_artifact_pk).values_list(
+        "artifact__build__job__server_id", flat=True)[0]
+
+
+def first(get_server):
+    """
+    Finds the server from the first of a list of pks.
+    """
+    return lambda pks: get_server(pks[0])
+
+
+# Maps the tasks that talk to Jenkins to a function that finds the pk of the
+# JenkinsServer from the first argument of the task.
+SERVER_TASKS = {
+    "jenkins.tasks.build_job": get_server_for_job,
+    "jenkins.tasks.push_job_to_jenkins": get_server_for_job,
+    "jenkins.tasks.import_build_for_job": get_server_for_build,
+    "jenkins.tasks.import_builds": first(get_server_for_build),
+    "jenkins.tasks.sync_server_jobs": first(get_server_for_job),
+    "jenkins.tasks.sample_server_load": lambda server_pk: server_pk,
+    "archives.tasks.archive_artifact_from_jenkins":
+        get_server_for_archived_artifact,
+    "archives.tasks.archive_artifacts":
+        first(first(get_server_for_archived_artifact)),
+}
+
+
+def get_queue_name(server_pk):
+    """
+    Returns the name of the Celery queue for tasks that talk to the server.
+    """
+    return "jenkins.server.%d" % server_pk
+
+
+class JenkinsServerRouter(object):
+    """
+    Routes tasks that talk to a Jenkins server to a queue for that server, so
+    that a slow server only holds up the workers consuming its queue.
+
+    This is only enabled when settings.ROUTE_TASKS_BY_SERVER is True.
+    """
+
+    def route_for_task(self, task, args=None, kwargs=None):
+        if not getattr(settings, "ROUTE_TASKS_BY_SERVER", False):
+            return
+        get_server = SERVER_TASKS.get(task)
+        if get_server is None or not args:
+            return
+        try:
+            server_pk = get_server(args[0])
+        except (IndexError, TypeError):
+            return
+        return {"queue": get_queue_name(server_pk)}
+
+
+def get_queue_backlog(queue_names):
+    """
+    Returns a dictionary mapping each queue name to the number of tasks
+    waiting in that queue on the broker.
+    """
+    from celery import current_app
+    backlog = {}
+    with current_app.connection() as connection:
+        for name in queue_names:
+            channel = connection.channel()
+            try:
+                backlog[name] = channel.queue_declare(
+                    queue=name, passive=True).message_count
+            except connection.channel_errors:
+                # Nothing has been routed to the queue yet.
+                backlog[name] = 0
+            finally:
+                channel.close()
+    return backlog
@@ -1,10 +1,26 @@
+from datetime import timedelta
+from itertools import groupby
+import json
+import time
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
 
 from celery.utils.log import get_task_logger
 from celery import shared_task
+from jenkinsapi.custom_exceptions import WillNotBuild
+from requests.exceptions import RequestException
 
-from jenkins.models import Job, Build, Artifact
-from jenkins.utils import get_job_xml_for_upload
+from jenkins.models import (
+    Job, Build, BuildRequest, Artifact, ConsoleLog, JenkinsServer,
+    QueuedNotification)
+from jenkins.utils import get_job_xml_for_upload, get_content_hash
+from jenkins.client import (
+    get_build_details, get_build_states, iter_console_log, create_job,
+    update_job_config)
 
 logger = get_task_logger(__name__)
 
@@ -13,34 +29,122 @@ logger = get_task_logger(__name__)
 def build_job(job_pk, build_id=None, params=None, user=None):
     """
     Request building Job.
+
+    If an identical request for the job was queued within the last
+    BUILD_REQUEST_WINDOW seconds and hasn't started, this request is
+    coalesced with it instead of being sent to Jenkins.
+
+    Returns the pk of the BuildRequest.
     """
-    # TODO: If a job is already queued, then this can throw
-    # WillNotBuild: <jenkinsapi.job.Job job> is already queued
-    job = Job.objects.get(pk=job_pk)
-    client = job.server.get_client()
     if params is None:
         params = {}
     if build_id is not None:
         params["BUILD_ID"] = build_id
     if user is not None:
         params["REQUESTOR"] = user
-    client.build_job(job.name, params=params)
+    parameters_hash = BuildRequest.get_parameters_hash(params)
+    window = getattr(settings, "BUILD_REQUEST_WINDOW", 300)
+
+    with transaction.atomic():
+        # Lock the job so that concurrent requests can't both be sent.
+        job = Job.objects.select_for_update().get(pk=job_pk)
+        queued = BuildRequest.objects.filter(
+            job=job, parameters_hash=parameters_hash,
+            status=BuildRequest.QUEUED,
+            requested_at__gte=timezone.now() - timedelta(seconds=window))
+        if queued.exists():
+            request = queued[0]
+            queued.filter(pk=request.pk).update(coalesced=F("coalesced") + 1)
+            logger.info("Coalesced build of %s with %s" % (job, request))
+            return request.pk
+        request = BuildRequest.objects.create(
+            job=job, parameters=params, parameters_hash=parameters_hash)
+
+    client = job.server.get_client()
+    try:
+        client.build_job(job.name, params=params)
+    except WillNotBuild as e:
+        # Jenkins already has this build queued, it will start the build that
+        # this request is linked to.
+        logger.info("Jenkins will not build %s: %s" % (job, e))
+    except Exception:
+        # Don't let a request that never reached Jenkins swallow retries.
+        request.delete()
+        raise
+    return request.pk
 
 
 @shared_task
-def push_job_to_jenkins(job_pk):
+def push_job_to_jenkins(job_pk, force=False):
     """
     Create or update a job in the server with the config.
+
+    If the config is the same as the config last pushed for the job, the push
+    is skipped unless force is True.
     """
     job = Job.objects.get(pk=job_pk)
     xml = get_job_xml_for_upload(job, job.server)
+    fingerprint = get_content_hash(xml)
+    if not force and job.config_fingerprint == fingerprint:
+        logger.info("Config for %s is unchanged, not pushing" % job)
+        return
     client = job.server.get_client()
 
     if client.has_job(job.name):
-        job = client.get_job(job.name)
-        job.update_config(xml)
+        jenkins_job = client.get_job(job.name)
+        jenkins_job.update_config(xml)
     else:
         client.create_job(job.name, xml)
+    Job.objects.filter(pk=job.pk).update(config_fingerprint=fingerprint)
+
+
+def sync_job(job, exists, force=False, dry_run=False):
+    """
+    Pushes the config for the job to its server if it isn't there, or has
+    changed since it was last pushed, and returns what was done, "created",
+    "updated" or "unchanged".
+
+    If dry_run is True, nothing is pushed, but the result is the same.
+    """
+    xml = get_job_xml_for_upload(job, job.server)
+    fingerprint = get_content_hash(xml)
+    if not exists:
+        action = "created"
+    elif force or job.config_fingerprint != fingerprint:
+        action = "updated"
+    else:
+        return "unchanged"
+    if not dry_run:
+        if exists:
+            update_job_config(job.server, job.name, xml)
+        else:
+            create_job(job.server, job.name, xml)
+        Job.objects.filter(pk=job.pk).update(config_fingerprint=fingerprint)
+    return action
+
+
+@shared_task
+def sync_server_jobs(job_pks, remote_names, force=False, dry_run=False):
+    """
+    Synchronises the jobs with job_pks in turn, remote_names are the names of
+    the jobs that already exist on the server.
+
+    Returns a list of (job name, server name, action) for each job, where
+    action is "failed" if the job couldn't be pushed.
+    """
+    remote_names = set(remote_names)
+    results = []
+    for job in Job.objects.filter(pk__in=job_pks).select_related(
+            "server", "jobtype"):
+        try:
+            action = sync_job(
+                job, job.name in remote_names, force=force, dry_run=dry_run)
+        except Exception:
+            logger.exception("Error synchronising job %s", job)
+            action = "failed"
+        results.append((job.name, job.server.name, action))
+    return results
+
 
 def extract_requestor_from_params(params):
     """
@@ -64,22 +168,15 @@ def import_build_for_job(build_pk):
     build = Build.objects.get(pk=build_pk)
     logger.info("Located job %s\n" % build.job)
 
-    client = build.job.server.get_client()
-    logger.info("Using server at %s\n" % build.job.server.url)
-
-    jenkins_job = client.get_job(build.job.name)
-    build_result = jenkins_job.get_build(build.number)
+    server = build.job.server
+    logger.info("Using server at %s\n" % server.url)
 
-    # TODO: Shouldn't access _data here.
+    build_result = get_build_details(server, build.job.name, build.number)
     build_details = {
-        "status": build_result.get_status(),
-        # TODO: What should we do with this ID we get from Jenkins?
-        # Discard? or only set it if we don't have one?
-        # "build_id": build_result._data["id"],
-        "duration": build_result._data["duration"],
-        "url": build_result.get_result_url(),
-        "console_log": build_result.get_console(),
-        "parameters": build_result.get_actions()["parameters"],
+        "status": build_result["status"],
+        "duration": build_result["duration"],
+        "url": build_result["url"],
+        "parameters": build_result["parameters"],
     }
     requestor = extract_requestor_from_params(build_details["parameters"])
     build_details["requested_by"] = requestor
@@ -88,17 +185,87 @@ def import_build_for_job(build_pk):
     Build.objects.filter(
         job=build.job, number=build.number).update(**build_details)
     build = Build.objects.get(job=build.job, number=build.number)
-    for artifact in build_result.get_artifacts():
-        artifact_details = {
-            "filename": artifact.filename,
-            "url": artifact.url,
-            "build": build
-        }
-        logger.info("Importing artifact %s", artifact_details)
-        Artifact.objects.create(**artifact_details)
+    import_console_log(build)
+    import_artifacts(build, build_result["artifacts"])
+    Build.objects.filter(pk=build.pk).update(imported_at=timezone.now())
     return build_pk
 
 
+@shared_task
+def import_builds(build_pks):
+    """
+    Import each of the builds in turn, skipping builds that have already been
+    imported, and returns the number of builds imported.
+
+    A failure to import a build is logged, and doesn't stop the remaining
+    builds from being imported.
+    """
+    imported = 0
+    for build_pk in build_pks:
+        if not Build.objects.filter(
+                pk=build_pk, imported_at__isnull=True).exists():
+            continue
+        try:
+            import_build_for_job(build_pk)
+        except Exception:
+            logger.exception("Error importing build %d", build_pk)
+        else:
+            imported += 1
+    return imported
+
+
+def import_artifacts(build, artifacts):
+    """
+    Stores the (filename, url) artifacts for a build, creating all the new
+    artifacts with a single insert, and updating artifacts whose URL has
+    changed.
+
+    Artifacts that are no longer reported by Jenkins are kept, as they may
+    already have been archived.
+    """
+    existing = dict(
+        (x.filename, x) for x in build.artifact_set.only("filename", "url"))
+    new_artifacts = []
+    for filename, url in artifacts:
+        artifact = existing.get(filename)
+        if artifact is None:
+            artifact = Artifact(build=build, filename=filename, url=url)
+            # Artifacts in different directories can share a filename, we
+            # only keep the first.
+            existing[filename] = artifact
+            new_artifacts.append(artifact)
+        elif artifact.url != url:
+            Artifact.objects.filter(pk=artifact.pk).update(url=url)
+    if new_artifacts:
+        Artifact.objects.bulk_create(new_artifacts)
+    logger.info(
+        "Imported %d new artifacts for %s #%d" % (
+            len(new_artifacts), build.job, build.number))
+
+
+def import_console_log(build, chunk_size=256 * 1024):
+    """
+    Streams the console log for a build from Jenkins into the ConsoleLog for
+    the build, picking up after any text that has already been stored.
+    """
+    log, _ = ConsoleLog.objects.get_or_create(build=build)
+    pending = []
+    pending_size = 0
+    for data in iter_console_log(
+            build.job.server, build.job.name, build.number, start=log.size,
+            chunk_size=chunk_size):
+        pending.append(data)
+        pending_size += len(data)
+        if pending_size >= chunk_size:
+            log.append(b"".join(pending))
+            pending, pending_size = [], 0
+    log.append(b"".join(pending))
+    logger.info(
+        "Imported console log for %s #%d, %d bytes in %d lines" % (
+            build.job, build.number, log.size, log.line_count))
+    return log
+
+
 @shared_task
 def delete_job_from_jenkins(job_pk):
     """
@@ -108,3 +275,186 @@ def delete_job_from_jenkins(job_pk):
     client = job.server.get_client()
 
     return client.delete_job(job.name)
+
+
+@shared_task
+def process_queued_notifications(batch_size=100):
+    """
+    Applies queued notifications in the order they were received, and queues
+    postprocessing for any builds they finalized.
+
+    Returns the number of notifications processed.
+    """
+    from jenkins.helpers import (
+        get_jobs_for_notifications, update_build_from_notification,
+        postprocess_builds, is_valid_notification)
+
+    finalized_builds = []
+    with transaction.atomic():
+        queued = list(QueuedNotification.objects.select_for_update().order_by(
+            "pk")[:batch_size])
+        notifications = []
+        for item in queued:
+            try:
+                notification = json.loads(item.payload)
+            except ValueError:
+                notification = None
+            if is_valid_notification(notification):
+                notifications.append((item, notification))
+            else:
+                logger.error(
+                    "Discarding invalid queued notification %d: %r",
+                    item.pk, item.payload)
+        server_names = [
+            (x.server_id, payload["name"]) for x, payload in notifications]
+        _, jobs = get_jobs_for_notifications(server_names)
+        for key, (item, notification) in zip(server_names, notifications):
+            job = jobs.get(key)
+            if job is None:
+                logger.warning("Notification for unknown job '%s'", key[1])
+                continue
+            # Each notification gets its own savepoint, so that one that
+            # can't be applied is discarded without holding up the queue.
+            try:
+                with transaction.atomic():
+                    build = update_build_from_notification(job, notification)
+            except Exception:
+                logger.exception(
+                    "Discarding queued notification %d: %r",
+                    item.pk, item.payload)
+                continue
+            if build is not None:
+                finalized_builds.append(build)
+        QueuedNotification.objects.filter(
+            pk__in=[x.pk for x in queued]).delete()
+
+    postprocess_builds(finalized_builds)
+    if len(queued) == batch_size:
+        process_queued_notifications.delay(batch_size=batch_size)
+    return len(queued)
+
+
+@shared_task
+def sample_server_load(server_pk):
+    """
+    Samples the load of the server, and caches it for get_least_loaded_job.
+    """
+    from jenkins.helpers import cache_server_load
+    cache_server_load(JenkinsServer.objects.get(pk=server_pk))
+
+
+@shared_task
+def sample_server_loads():
+    """
+    Queues sampling the load of each server, separately so that a server
+    that's slow to answer doesn't hold up sampling the others.
+    """
+    for server_pk in JenkinsServer.objects.values_list("pk", flat=True):
+        sample_server_load.delay(server_pk)
+
+
+def get_stale_build_notification(build, state):
+    """
+    Returns the FINALIZED notification that Jenkins should have sent for a
+    build that has finished.
+    """
+    return {
+        "name": build.job.name,
+        "build": {
+            "number": build.number,
+            "phase": Build.FINALIZED,
+            "status": state["result"] or "UNKNOWN",
+            "url": state["url"] or build.url,
+        },
+    }
+
+
+@shared_task
+def reconcile_stale_builds(max_age=None):
+    """
+    Checks the builds that have been STARTED for more than max_age seconds,
+    STALE_BUILD_AGE by default, with a single request per job, and finalizes
+    those that Jenkins has finished as if the notification had arrived.
+
+    Stale builds that are no longer on the server are finalized with the
+    status UNKNOWN, without postprocessing, so that they aren't checked
+    forever. Build requests older than BUILD_REQUEST_EXPIRY seconds that
+    haven't started are expired.
+
+    Returns a dictionary mapping server names to the number of stale builds,
+    the number finalized, the number missing from the server, how far behind
+    the oldest stale build is and how long the server took to answer, all of
+    which are logged too.
+    """
+    from jenkins.helpers import (
+        update_build_from_notification, postprocess_builds)
+
+    if max_age is None:
+        max_age = getattr(settings, "STALE_BUILD_AGE", 3600)
+    now = timezone.now()
+    expired = BuildRequest.objects.filter(
+        status=BuildRequest.QUEUED,
+        requested_at__lt=now - timedelta(
+            seconds=getattr(settings, "BUILD_REQUEST_EXPIRY", 3600))).update(
+        status=BuildRequest.EXPIRED)
+    if expired:
+        logger.info("Expired %d build requests that never started", expired)
+    stale_builds = list(Build.objects.filter(
+        phase=Build.STARTED,
+        created_at__lt=now - timedelta(seconds=max_age)).select_related(
+        "job__server").order_by("job__server", "job", "number"))
+    # The newest build of each job, so that we only ask for the builds from
+    # there back to the oldest stale build.
+    newest_numbers = dict(
+        Build.objects.filter(
+            job__in=set(build.job_id for build in stale_builds)).values_list(
+            "job").annotate(Max("number")).order_by())
+
+    finalized_builds = []
+    metrics = {}
+    for job, builds in groupby(stale_builds, key=lambda build: build.job):
+        builds = list(builds)
+        server_metrics = metrics.setdefault(job.server.name, {
+            "stale": 0, "finalized": 0, "missing": 0, "lag": 0.0,
+            "poll_time": 0.0})
+        server_metrics["stale"] += len(builds)
+        server_metrics["lag"] = max(
+            server_metrics["lag"],
+            (now - builds[0].created_at).total_seconds())
+
+        start = time.time()
+        try:
+            states = get_build_states(
+                job.server, job.name, builds[0].number,
+                newest_numbers.get(job.pk))
+        except (RequestException, ValueError):
+            logger.exception("Error checking the builds of %s", job)
+            continue
+        finally:
+            server_metrics["poll_time"] += time.time() - start
+
+        for build in builds:
+            state = states.get(build.number)
+            if state is None:
+                logger.warning(
+                    "Stale build %s is not on the server, finalizing it as "
+                    "UNKNOWN", build)
+                if update_build_from_notification(
+                        job, get_stale_build_notification(
+                            build, {"result": None, "url": None})):
+                    server_metrics["missing"] += 1
+            elif not state["building"]:
+                build = update_build_from_notification(
+                    job, get_stale_build_notification(build, state))
+                if build is not None:
+                    finalized_builds.append(build)
+                    server_metrics["finalized"] += 1
+
+    for name, server_metrics in sorted(metrics.items()):
+        logger.info(
+            "Reconciled %s: %d stale builds, %d finalized, %d missing, "
+            "%.0fs behind, polled in %.2fs", name, server_metrics["stale"],
+            server_metrics["finalized"], server_metrics["missing"],
+            server_metrics["lag"], server_metrics["poll_time"])
+    postprocess_builds(finalized_builds)
+    return metrics
@@ -0,0 +1,335 @@
+import json
+from urlparse import parse_qs
+
+from django.test import SimpleTestCase, TestCase
+
+from httmock import HTTMock, urlmatch
+
+from jenkins.client import (
+    get_job_url, get_build_url, get_build_details, get_build_numbers,
+    get_build_states, iter_console_log, get_job_names, get_server_load,
+    create_job, update_job_config, parse_build_details)
+from .helpers import mock_url
+from .factories import JenkinsServerFactory
+
+
+class JenkinsUrlTest(TestCase):
+
+    def test_get_job_url(self):
+        """
+        get_job_url should return the job URL relative to the server URL,
+        with the job name quoted.
+        """
+        server = JenkinsServerFactory.create(url="http://example.com/jenkins")
+        self.assertEqual(
+            "http://example.com/jenkins/job/my%20job/",
+            get_job_url(server, "my job"))
+
+    def test_get_build_url(self):
+        """
+        get_build_url should return the URL for a numbered build of the job.
+        """
+        server = JenkinsServerFactory.create(url="http://example.com/")
+        self.assertEqual(
+            "http://example.com/job/testing/20/",
+            get_build_url(server, "testing", 20))
+
+
+class ParseBuildDetailsTest(SimpleTestCase):
+
+    def test_parse_build_details(self):
+        """
+        parse_build_details should extract the parameters from the actions,
+        and calculate the URLs of the artifacts.
+        """
+        data = {
+            "actions": [{}, {"parameters": [{"name": "A", "value": "1"}]}],
+            "artifacts": [
+                {"fileName": "a.txt", "relativePath": "dir/a.txt"}],
+            "building": False,
+            "duration": 200,
+            "result": "FAILURE",
+            "url": "http://example.com/job/testing/1/"}
+
+        self.assertEqual(
+            {"status": "FAILURE",
+             "duration": 200,
+             "url": "http://example.com/job/testing/1/",
+             "parameters": [{"name": "A", "value": "1"}],
+             "artifacts": [
+                 ("a.txt",
+                  "http://example.com/job/testing/1/artifact/dir/a.txt")]},
+            parse_build_details(data))
+
+    def test_parse_build_details_without_parameters(self):
+        """
+        Builds of jobs without parameters have no parameters action.
+        """
+        data = {"actions": [{}, None], "artifacts": [],
+                "url": "http://example.com/job/testing/1/"}
+
+        details = parse_build_details(data)
+
+        self.assertEqual([], details["parameters"])
+        self.assertEqual([], details["artifacts"])
+
+
+class GetBuildDetailsTest(TestCase):
+
+    def setUp(self):
+        self.server = JenkinsServerFactory.create(
+            url="http://www.example.com/")
+
+    def test_get_build_details(self):
+        """
+        get_build_details should fetch the build with a single authenticated
+        request to the JSON API, restricted to the fields we need.
+        """
+        mock_requests = []
+        mock_request = mock_url(
+            r"^/job/testjob/5/api/json$", "build_api_json", mock_requests)
+        with HTTMock(mock_request):
+            details = get_build_details(self.server, "testjob", 5)
+
+        self.assertEqual("SUCCESS", details["status"])
+        self.assertEqual(1000, details["duration"])
+        self.assertEqual(2, len(details["artifacts"]))
+        [request] = mock_requests
+        self.assertIn("tree=result%2Cduration", request.url)
+        self.assertEqual(
+            "Basic cm9vdDp0ZXN0aW5n", request.headers["Authorization"])
+
+    def test_get_build_numbers(self):
+        """
+        get_build_numbers should list all the builds of the job with a single
+        request, ignoring builds that are still building.
+        """
+        mock_requests = []
+
+        @urlmatch(path=r"^/job/testjob/api/json$")
+        def mock_job(url, request):
+            mock_requests.append(request)
+            return json.dumps({"allBuilds": [
+                {"number": 3, "building": True},
+                {"number": 2, "building": False},
+                {"number": 1, "building": False}]})
+
+        with HTTMock(mock_job):
+            numbers = get_build_numbers(self.server, "testjob")
+
+        self.assertEqual([2, 1], numbers)
+        [request] = mock_requests
+        self.assertIn("tree=allBuilds%5Bnumber%2Cbuilding%5D", request.url)
+
+    def test_get_build_states(self):
+        """
+        get_build_states should return the state of the builds of the job
+        back to the oldest requested, with a single request.
+        """
+        mock_requests = []
+
+        @urlmatch(path=r"^/job/testjob/api/json$")
+        def mock_job(url, request):
+            mock_requests.append(request)
+            return json.dumps({
+                "lastBuild": {"number": 2},
+                "allBuilds": [
+                    {"number": 2, "building": True, "result": None,
+                     "url": "http://www.example.com/job/testjob/2/"},
+                    {"number": 1, "building": False, "result": "SUCCESS",
+                     "url": "http://www.example.com/job/testjob/1/"}]})
+
+        with HTTMock(mock_job):
+            states = get_build_states(self.server, "testjob", 1, 2)
+
+        self.assertEqual(
+            {"building": False, "result": "SUCCESS",
+             "url": "http://www.example.com/job/testjob/1/"}, states[1])
+        self.assertTrue(states[2]["building"])
+        [request] = mock_requests
+        self.assertIn(
+            "allBuilds%5Bnumber%2Cbuilding%2Cresult%2Curl%5D%7B0%2C2%7D",
+            request.url)
+
+    def test_get_build_states_with_newer_builds(self):
+        """
+        If Jenkins has builds newer than the newest we know of,
+        get_build_states should ask again for enough builds to reach the
+        oldest requested.
+        """
+        ranges = []
+
+        @urlmatch(path=r"^/job/testjob/api/json$")
+        def mock_job(url, request):
+            ranges.append(request.url.rsplit("%7B", 1)[1])
+            builds = [
+                {"number": number, "building": False, "result": "SUCCESS",
+                 "url": "http://www.example.com/job/testjob/%d/" % number}
+                for number in [5, 4, 3]]
+            return json.dumps({
+                "lastBuild": {"number": 5},
+                "allBuilds": builds[:int(ranges[-1].split("%2C")[1][0])]})
+
+        with HTTMock(mock_job):
+            states = get_build_states(self.server, "testjob", 3, 3)
+
+        self.assertEqual(["0%2C1%7D", "0%2C3%7D"], ranges)
+        self.assertEqual([3, 4, 5], sorted(states))
+
+    def test_get_build_states_more_than_100_builds_behind(self):
+        """
+        Jenkins only lists 100 "builds", so get_build_states should use
+        "allBuilds" to reach a build that's further behind the latest.
+        """
+        @urlmatch(path=r"^/job/testjob/api/json$")
+        def mock_job(url, request):
+            tree = parse_qs(url.query)["tree"][0]
+            count = int(tree.rsplit(",", 1)[1].rstrip("}"))
+            builds = [
+                {"number": number, "building": False, "result": "SUCCESS",
+                 "url": "http://www.example.com/job/testjob/%d/" % number}
+                for number in range(250, 0, -1)][:count]
+            data = {"lastBuild": {"number": 250}}
+            if "allBuilds[" in tree:
+                data["allBuilds"] = builds
+            else:
+                data["builds"] = builds[:100]
+            return json.dumps(data)
+
+        with HTTMock(mock_job):
+            states = get_build_states(self.server, "testjob", 100, 150)
+
+        self.assertEqual(
+            {"building": False, "result": "SUCCESS",
+             "url": "http://www.example.com/job/testjob/100/"}, states[100])
+        self.assertEqual(range(100, 251), sorted(states))
+
+    def test_iter_console_log(self):
+        """
+        iter_console_log should fetch the progressive text for the build from
+        the requested offset, and keep fetching while Jenkins has more.
+        """
+        console = "First line\nSecond line\n"
+        mock_requests = []
+
+        @urlmatch(path=r"^/job/testjob/5/logText/progressiveText$")
+        def mock_console(url, request):
+            mock_requests.append(request)
+            start = int(url.query.split("=")[1])
+            end = min(start + 11, len(console))
+            more_data = str(end < len(console)).lower()
+            return {"status_code": 200, "content": console[start:end],
+                    "headers": {"X-Text-Size": str(end),
+                                "X-More-Data": more_data}}
+
+        with HTTMock(mock_console):
+            log = "".join(iter_console_log(self.server, "testjob", 5, start=0))
+
+        self.assertEqual(console, log)
+        self.assertEqual(
+            ["start=0", "start=11", "start=22"],
+            [x.url.split("?")[1] for x in mock_requests])
+
+    def test_iter_console_log_stops_without_progress(self):
+        """
+        If Jenkins claims to have more data but sends nothing, we should stop
+        rather than poll forever.
+        """
+        mock_requests = []
+
+        @urlmatch(path=r"^/job/testjob/5/logText/progressiveText$")
+        def mock_console(url, request):
+            mock_requests.append(request)
+            return {"status_code": 200, "content": "",
+                    "headers": {"X-Text-Size": "100", "X-More-Data": "true"}}
+
+        with HTTMock(mock_console):
+            log = list(iter_console_log(self.server, "testjob", 5, start=100))
+
+        self.assertEqual([], log)
+        self.assertEqual(1, len(mock_requests))
+
+
+class JobConfigTest(TestCase):
+
+    def setUp(self):
+        self.server = JenkinsServerFactory.create(
+            url="http://www.example.com/")
+
+    def test_get_job_names(self):
+        """
+        get_job_names should list the names of the jobs on the server with a
+        single request.
+        """
+        mock_requests = []
+
+        @urlmatch(path=r"^/api/json$")
+        def mock_root(url, request):
+            mock_requests.append(request)
+            return json.dumps({"jobs": [{"name": "job1"}, {"name": "job2"}]})
+
+        with HTTMock(mock_root):
+            names = get_job_names(self.server)
+
+        self.assertEqual(set(["job1", "job2"]), names)
+        [request] = mock_requests
+        self.assertIn("tree=jobs%5Bname%5D", request.url)
+
+    def test_get_server_load(self):
+        """
+        get_server_load should return the one minute averages of the load on
+        the server, with a single request.
+        """
+        mock_requests = []
+
+        @urlmatch(path=r"^/overallLoad/api/json$")
+        def mock_load(url, request):
+            mock_requests.append(request)
+            return json.dumps({
+                "busyExecutors": {"min": {"latest": 1.5}},
+                "queueLength": {"min": {"latest": 3.0}},
+                "totalExecutors": {"min": {"latest": 4.0}}})
+
+        with HTTMock(mock_load):
+            load = get_server_load(self.server)
+
+        self.assertEqual({"busy": 1.5, "queued": 3.0, "total": 4.0}, load)
+        [request] = mock_requests
+        self.assertIn("tree=busyExecutors", request.url)
+
+    def test_create_job(self):
+        """
+        create_job should post the config to createItem.
+        """
+        mock_requests = []
+
+        @urlmatch(path=r"^/createItem$", method="POST")
+        def mock_create(url, request):
+            mock_requests.append(request)
+            return ""
+
+        with HTTMock(mock_create):
+            create_job(self.server, "my job", u"<project>\xe9</project>")
+
+        [request] = mock_requests
+        self.assertEqual(
+            "http://www.example.com/createItem?name=my+job", request.url)
+        self.assertEqual("<project>\xc3\xa9</project>", request.body)
+        self.assertEqual("application/xml", request.headers["Content-Type"])
+
+    def test_update_job_config(self):
+        """
+        update_job_config should post the config to the config.xml of the job.
+        """
+        mock_requests = []
+
+        @urlmatch(path=r"^/job/my%20job/config.xml$", method="POST")
+        def mock_update(url, request):
+            mock_requests.append(request)
+            return ""
+
+        with HTTMock(mock_update):
+            update_job_config(self.server, "my job", "<project/>")
+
+        [request] = mock_requests
+        self.assertEqual("<project/>", request.body)
@@ -1,12 +1,21 @@
+from datetime import timedelta
+
+from django.core.cache import cache
 from django.test import TestCase
 from django.test.utils import override_settings
+from django.utils import timezone
 
-from celery import shared_task
+from celery import shared_task, chain
 import mock
+from requests.exceptions import ConnectionError
 
-from jenkins.helpers import postprocess_build, create_job
-from jenkins.models import Job
-from jenkins.tasks import import_build_for_job
+from jenkins.helpers import (
+    postprocess_build, postprocess_builds, create_job, import_builds_for_job,
+    sync_jobs, update_build_from_notification, link_build_request,
+    get_least_loaded_job, cache_server_load)
+from jenkins.models import Job, BuildRequest
+from jenkins.tasks import (
+    import_build_for_job, import_builds, sync_server_jobs)
 from .factories import (
     JobFactory, BuildFactory, JobTypeFactory, JenkinsServerFactory)
 
@@ -29,6 +38,236 @@ class CreateJobTest(TestCase):
         self.assertEqual("known name", job.name)
 
 
+class ImportBuildsForJobTest(TestCase):
+
+    def setUp(self):
+        self.job = JobFactory.create()
+
+    def test_import_builds_for_job(self):
+        """
+        import_builds_for_job should create the builds that we don't know
+        about, and share the builds that haven't been imported between the
+        import tasks.
+        """
+        BuildFactory.create(job=self.job, number=1, imported_at=timezone.now())
+        build2 = BuildFactory.create(job=self.job, number=2)
+
+        with mock.patch(
+                "jenkins.helpers.get_build_numbers",
+                return_value=[5, 4, 3, 2, 1]) as mock_numbers:
+            with mock.patch("jenkins.helpers.group") as mock_group:
+                import_builds_for_job(self.job.pk, concurrency=2)
+
+        mock_numbers.assert_called_once_with(self.job.server, self.job.name)
+        self.assertEqual(
+            [1, 2, 3, 4, 5],
+            sorted(self.job.build_set.values_list("number", flat=True)))
+        pks = dict(self.job.build_set.values_list("number", "pk"))
+        [tasks], _ = mock_group.call_args
+        self.assertEqual(
+            [import_builds.s([build2.pk, pks[4]]),
+             import_builds.s([pks[3], pks[5]])],
+            list(tasks))
+        mock_group.return_value.apply_async.assert_called_once()
+
+    def test_import_builds_for_job_uses_server_max_concurrency(self):
+        """
+        By default the builds should be shared between as many tasks as the
+        server allows.
+        """
+        self.job.server.max_concurrency = 3
+        self.job.server.save()
+
+        with mock.patch(
+                "jenkins.helpers.get_build_numbers",
+                return_value=[1, 2, 3, 4, 5]):
+            with mock.patch("jenkins.helpers.group") as mock_group:
+                import_builds_for_job(self.job.pk)
+
+        [tasks], _ = mock_group.call_args
+        self.assertEqual(3, len(list(tasks)))
+
+    def test_import_builds_for_job_with_nothing_to_import(self):
+        """
+        If all the builds have been imported, no tasks should be queued.
+        """
+        BuildFactory.create(job=self.job, number=1, imported_at=timezone.now())
+
+        with mock.patch(
+                "jenkins.helpers.get_build_numbers", return_value=[1]):
+            with mock.patch("jenkins.helpers.group") as mock_group:
+                result = import_builds_for_job(self.job.pk)
+
+        self.assertIsNone(result)
+        self.assertFalse(mock_group.called)
+
+
+class SyncJobsTest(TestCase):
+
+    def test_sync_jobs(self):
+        """
+        sync_jobs should list the jobs on each server once, and share the
+        jobs for each server between the tasks.
+        """
+        server1, server2 = JenkinsServerFactory.create_batch(2)
+        job1, job2, job3 = JobFactory.create_batch(3, server=server1)
+        job4 = JobFactory.create(server=server2)
+
+        with mock.patch(
+                "jenkins.helpers.get_job_names",
+                return_value=set([job1.name, job4.name])) as mock_names:
+            with mock.patch("jenkins.helpers.group") as mock_group:
+                sync_jobs(Job.objects.order_by("pk"), concurrency=2)
+
+        self.assertEqual(
+            [mock.call(server1), mock.call(server2)],
+            sorted(mock_names.call_args_list, key=lambda x: x[0][0].pk))
+        [tasks], _ = mock_group.call_args
+        self.assertEqual(
+            sorted([
+                sync_server_jobs.s(
+                    [job1.pk, job3.pk], [job1.name], force=False),
+                sync_server_jobs.s([job2.pk], [], force=False),
+                sync_server_jobs.s([job4.pk], [job4.name], force=False)]),
+            sorted(tasks))
+
+    def test_sync_jobs_without_jobs(self):
+        """
+        If there are no jobs, nothing should be queued.
+        """
+        with mock.patch("jenkins.helpers.group") as mock_group:
+            self.assertEqual(([], None), sync_jobs(Job.objects.none()))
+        self.assertFalse(mock_group.called)
+
+    def test_sync_jobs_with_unreachable_server(self):
+        """
+        If the jobs on a server can't be listed, its jobs should be reported
+        as failed, and the jobs of the other servers still synchronised.
+        """
+        server1, server2 = JenkinsServerFactory.create_batch(2)
+        job1 = JobFactory.create(server=server1)
+        job2 = JobFactory.create(server=server2)
+
+        def get_job_names(server):
+            if server == server1:
+                raise ConnectionError("Connection refused")
+            return set()
+
+        with mock.patch(
+                "jenkins.helpers.get_job_names", side_effect=get_job_names):
+            with mock.patch("jenkins.helpers.group") as mock_group:
+                results, queued = sync_jobs(Job.objects.order_by("pk"))
+
+        self.assertEqual([(job1.name, server1.name, "failed")], results)
+        [tasks], _ = mock_group.call_args
+        self.assertEqual(
+            [sync_server_jobs.s([job2.pk], [], force=False)], tasks)
+
+    @override_settings(NOTIFICATION_HOST="http://example.com")
+    def test_sync_jobs_dry_run(self):
+        """
+        A dry run should work out what would be pushed without queueing any
+        tasks or pushing anything.
+        """
+        job1, job2 = JobFactory.create_batch(2)
+
+        with mock.patch(
+                "jenkins.helpers.get_job_names",
+                return_value=set([job2.name])):
+            with mock.patch("jenkins.helpers.group") as mock_group:
+                with mock.patch("jenkins.tasks.create_job") as mock_create:
+                    results, queued = sync_jobs(
+                        Job.objects.order_by("pk"), dry_run=True)
+
+        self.assertIsNone(queued)
+        self.assertFalse(mock_group.called)
+        self.assertFalse(mock_create.called)
+        self.assertEqual(
+            [(job1.name, job1.server.name, "created"),
+             (job2.name, job2.server.name, "updated")], sorted(results))
+
+
+class LinkBuildRequestTest(TestCase):
+
+    def setUp(self):
+        self.job = JobFactory.create()
+
+    def test_link_build_request(self):
+        """
+        The oldest queued request whose parameters are all in the build's
+        parameters should be linked to the build.
+        """
+        BuildRequest.objects.create(
+            job=self.job, parameters={"BUILD_ID": "other"},
+            parameters_hash="a")
+        request = BuildRequest.objects.create(
+            job=self.job, parameters={"BUILD_ID": "1", "REQUESTOR": "x"},
+            parameters_hash="b")
+        BuildRequest.objects.create(
+            job=self.job, parameters={"BUILD_ID": "1"}, parameters_hash="b")
+        build = BuildFactory.create(job=self.job)
+
+        self.assertEqual(
+            request,
+            link_build_request(build, {"BUILD_ID": "1", "BRANCH": "trunk"}))
+
+        request = BuildRequest.objects.get(pk=request.pk)
+        self.assertEqual(build, request.build)
+        self.assertEqual(BuildRequest.STARTED, request.status)
+        self.assertEqual(
+            1, BuildRequest.objects.filter(
+                status=BuildRequest.STARTED).count())
+
+    @override_settings(BUILD_REQUEST_EXPIRY=3600)
+    def test_link_build_request_with_stale_request(self):
+        """
+        A request that was never started shouldn't claim the build of a fresh
+        identical request.
+        """
+        stale = BuildRequest.objects.create(
+            job=self.job, parameters={"BUILD_ID": "1"}, parameters_hash="a")
+        BuildRequest.objects.filter(pk=stale.pk).update(
+            requested_at=timezone.now() - timedelta(seconds=3601))
+        fresh = BuildRequest.objects.create(
+            job=self.job, parameters={"BUILD_ID": "1"}, parameters_hash="a")
+        build = BuildFactory.create(job=self.job)
+
+        self.assertEqual(fresh, link_build_request(build, {"BUILD_ID": "1"}))
+        self.assertEqual(
+            BuildRequest.QUEUED, BuildRequest.objects.get(pk=stale.pk).status)
+        self.assertEqual(
+            BuildRequest.STARTED,
+            BuildRequest.objects.get(pk=fresh.pk).status)
+
+    def test_link_build_request_without_match(self):
+        """
+        If no queued request matches, nothing is linked.
+        """
+        BuildRequest.objects.create(
+            job=self.job, parameters={"BUILD_ID": "other"},
+            parameters_hash="a")
+        build = BuildFactory.create(job=self.job)
+
+        self.assertIsNone(link_build_request(build, {"BUILD_ID": "1"}))
+
+    def test_started_notification_links_build_request(self):
+        """
+        A STARTED notification for a new build should link the request.
+        """
+        request = BuildRequest.objects.create(
+            job=self.job, parameters={"BUILD_ID": "20140312.1"},
+            parameters_hash="a")
+        notification = {
+            "name": self.job.name,
+            "build": {"number": 1, "phase": "STARTED",
+                      "parameters": {"BUILD_ID": "20140312.1"}}}
+
+        update_build_from_notification(self.job, notification)
+
+        request = BuildRequest.objects.get(pk=request.pk)
+        self.assertEqual(1, request.build.number)
+
+
 @shared_task
 def postbuild_testing_hook(build_pk):
     return "Testing"
@@ -68,3 +307,119 @@ class PostProcessBuildTest(TestCase):
             import_build_for_job.s(build.pk),
             postbuild_testing_hook.s())
         chain_mock.return_value.apply_async.assert_called_once()
+
+    @override_settings(CELERY_ALWAYS_EAGER=True, POST_BUILD_TASKS=[])
+    def test_postprocess_builds(self):
+        """
+        postprocess_builds should queue the postprocessing chains for all the
+        builds as a single group.
+        """
+        builds = BuildFactory.create_batch(2)
+        with mock.patch("jenkins.helpers.group") as group_mock:
+            postprocess_builds(builds)
+
+        group_mock.assert_called_once_with(
+            [chain(import_build_for_job.s(builds[0].pk)),
+             chain(import_build_for_job.s(builds[1].pk))])
+        group_mock.return_value.apply_async.assert_called_once()
+
+    def test_postprocess_builds_with_no_builds(self):
+        """
+        If there are no builds to postprocess, nothing should be queued.
+        """
+        with mock.patch("jenkins.helpers.group") as group_mock:
+            self.assertIsNone(postprocess_builds([]))
+
+        self.assertFalse(group_mock.called)
+
+
+class GetLeastLoadedJobTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.jobs = [
+            JobFactory.create(server=server)
+            for server in JenkinsServerFactory.create_batch(3)]
+
+    def tearDown(self):
+        cache.clear()
+
+    def cache_loads(self, loads):
+        with mock.patch(
+                "jenkins.helpers.get_server_load",
+                side_effect=lambda server, timeout: loads[server.pk]):
+            for job in self.jobs:
+                cache_server_load(job.server)
+
+    def test_get_least_loaded_job(self):
+        """
+        The job on the server with the shortest queue, and then the most free
+        executors, should be chosen.
+        """
+        self.cache_loads({
+            self.jobs[0].server.pk: {"busy": 2, "queued": 1, "total": 2},
+            self.jobs[1].server.pk: {"busy": 2, "queued": 0, "total": 4},
+            self.jobs[2].server.pk: {"busy": 1, "queued": 0, "total": 4},
+        })
+
+        with mock.patch("jenkins.helpers.get_server_load") as mock_load:
+            self.assertEqual(self.jobs[2], get_least_loaded_job(self.jobs))
+
+        self.assertFalse(mock_load.called)
+
+    def test_get_least_loaded_job_without_samples(self):
+        """
+        Servers that haven't been sampled should only be chosen if there's no
+        other choice, without being contacted.
+        """
+        with mock.patch(
+                "jenkins.helpers.get_server_load",
+                return_value={"busy": 4, "queued": 10, "total": 4}):
+            cache_server_load(self.jobs[2].server)
+
+        with mock.patch("jenkins.helpers.get_server_load") as mock_load:
+            self.assertEqual(self.jobs[2], get_least_loaded_job(self.jobs))
+
+        self.assertFalse(mock_load.called)
+
+    def test_get_least_loaded_job_with_unreachable_server(self):
+        """
+        Servers that can't be sampled should only be chosen if there's no
+        other choice.
+        """
+        def get_load(server, timeout):
+            if server == self.jobs[0].server:
+                raise ConnectionError("Connection refused")
+            return {"busy": 4, "queued": 10, "total": 4}
+
+        with mock.patch(
+                "jenkins.helpers.get_server_load", side_effect=get_load):
+            self.assertIsNone(cache_server_load(self.jobs[0].server))
+            cache_server_load(self.jobs[1].server)
+
+        self.assertEqual(self.jobs[1], get_least_loaded_job(self.jobs))
+
+    @override_settings(SERVER_LOAD_TIMEOUT=2)
+    def test_cache_server_load_with_timeout(self):
+        """
+        The load should be sampled with a short timeout, so that a server
+        that's hanging doesn't hold up sampling.
+        """
+        load = {"busy": 0, "queued": 0, "total": 1}
+
+        with mock.patch(
+                "jenkins.helpers.get_server_load",
+                return_value=load) as mock_load:
+            self.assertEqual(load, cache_server_load(self.jobs[0].server))
+
+        mock_load.assert_called_once_with(self.jobs[0].server, timeout=2)
+
+    def test_get_least_loaded_job_with_one_job(self):
+        """
+        The cache shouldn't be read if there's only one job to choose.
+        """
+        with mock.patch("jenkins.helpers.cache") as mock_cache:
+            self.assertEqual(
+                self.jobs[0], get_least_loaded_job(self.jobs[:1]))
+
+        self.assertFalse(mock_cache.get_many.called)
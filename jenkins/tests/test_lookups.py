@@ -0,0 +1,135 @@
+import json
+
+import mock
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.test.client import RequestFactory
+
+from jenkins.lookups import NotificationLookups, lookups
+from jenkins.models import Build
+from jenkins.views import NotificationHandlerView
+from .factories import JobFactory
+
+
+class NotificationLookupsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.lookups = NotificationLookups()
+        self.job = JobFactory.create(name="mytestjob")
+        self.server = self.job.server
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_get_server(self):
+        """
+        Servers should only be fetched from the database once.
+        """
+        self.assertEqual(self.server, self.lookups.get_server(self.server.pk))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.server, self.lookups.get_server(self.server.pk))
+
+    def test_get_jobs(self):
+        """
+        Jobs should be fetched with a single query, and only once.
+        """
+        other_job = JobFactory.create(server=self.server)
+        keys = [(self.server.pk, "mytestjob"),
+                (self.server.pk, other_job.name),
+                (self.server.pk, "unknown")]
+
+        with self.assertNumQueries(1):
+            jobs = self.lookups.get_jobs(keys)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.job, self.lookups.get_job(self.server.pk, "mytestjob"))
+
+        self.assertEqual(
+            {keys[0]: self.job, keys[1]: other_job}, jobs)
+
+    def test_unknown_jobs_are_not_cached(self):
+        """
+        A job that isn't found should be looked for again next time.
+        """
+        self.assertIsNone(self.lookups.get_job(self.server.pk, "newjob"))
+        job = JobFactory.create(server=self.server, name="newjob")
+
+        self.assertEqual(job, self.lookups.get_job(self.server.pk, "newjob"))
+
+    def test_invalidated_by_another_process(self):
+        """
+        Invalidating the lookups in another process should clear the cache in
+        this one.
+        """
+        self.lookups.get_job(self.server.pk, "mytestjob")
+        NotificationLookups().invalidate()
+
+        with self.assertNumQueries(1):
+            self.lookups.get_job(self.server.pk, "mytestjob")
+
+    @override_settings(NOTIFICATION_LOOKUPS_TTL=60)
+    def test_expires(self):
+        """
+        Cached lookups should be dropped once they're older than the TTL, in
+        case they were changed by a process that doesn't share the cache.
+        """
+        with mock.patch("jenkins.lookups.time.time", return_value=1000):
+            self.lookups.get_job(self.server.pk, "mytestjob")
+        with mock.patch("jenkins.lookups.time.time", return_value=1059):
+            with self.assertNumQueries(0):
+                self.lookups.get_job(self.server.pk, "mytestjob")
+        with mock.patch("jenkins.lookups.time.time", return_value=1060):
+            with self.assertNumQueries(1):
+                self.lookups.get_job(self.server.pk, "mytestjob")
+
+    def test_invalidated_when_job_changes(self):
+        """
+        Saving a job should invalidate the cached lookups.
+        """
+        lookups.get_job(self.server.pk, "mytestjob")
+        self.job.name = "renamed"
+        self.job.save()
+
+        self.assertIsNone(lookups.get_job(self.server.pk, "mytestjob"))
+        self.assertEqual(self.job, lookups.get_job(self.server.pk, "renamed"))
+
+    def test_invalidated_when_server_changes(self):
+        """
+        Saving a server should invalidate the cached lookups.
+        """
+        lookups.get_server(self.server.pk)
+        self.server.notification_token = "secret"
+        self.server.save()
+
+        self.assertEqual(
+            "secret", lookups.get_server(self.server.pk).notification_token)
+
+
+class CachedNotificationTest(TestCase):
+
+    def test_notification_does_no_lookup_queries(self):
+        """
+        Once the server and job are cached, handling a notification shouldn't
+        query for them.
+        """
+        job = JobFactory.create(name="mytestjob")
+        job.build_set.create(number=10, phase=Build.STARTED)
+        view = NotificationHandlerView.as_view()
+
+        def post():
+            request = RequestFactory().post(
+                "/jenkins/notifications/?server=%d" % job.server.pk,
+                content_type="application/json",
+                data=json.dumps({
+                    "name": "mytestjob",
+                    "build": {"phase": Build.STARTED, "number": 10}}))
+            return view(request)
+
+        post()
+        # Only the build is fetched, to see that it's already started.
+        with self.assertNumQueries(1):
+            self.assertEqual(200, post().status_code)
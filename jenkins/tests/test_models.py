@@ -1,12 +1,16 @@
+from django.db import IntegrityError
 from django.test import TestCase
 
-from httmock import HTTMock
+from httmock import HTTMock, urlmatch
 from jenkinsapi.jenkins import Jenkins
+import mock
 
-from jenkins.models import Build, JobType
-from .helpers import mock_url
+from jenkins.client import requesters, get_session
+from jenkins.models import Build, ConsoleLog, JobType
+from .helpers import mock_url, load_fixture
 from .factories import (
-    BuildFactory, JenkinsServerFactory, JobTypeWithParamsFactory)
+    ArtifactFactory, BuildFactory, JenkinsServerFactory,
+    JobTypeWithParamsFactory)
 
 
 class JenkinsServerTest(TestCase):
@@ -22,7 +26,69 @@ class JenkinsServerTest(TestCase):
             r"\/api\/python$", "fixture1")
         with HTTMock(mock_request):
             client = server.get_client()
-        self.assertIsInstance(client, Jenkins)
+            self.assertIsInstance(client, Jenkins)
+            self.assertEqual(
+                ["testing1", "testing2", "testing3"], client.keys())
+
+    def test_get_client_is_lazy(self):
+        """
+        JenkinsServer.get_client shouldn't poll the server until the client is
+        used.
+        """
+        server = JenkinsServerFactory.create()
+
+        with HTTMock(lambda url, request: self.fail("Unexpected request")):
+            server.get_client()
+
+    def test_get_client_is_pooled(self):
+        """
+        The connections of the client should be reused until the server is
+        changed.
+        """
+        server = JenkinsServerFactory.create()
+        client = server.get_client()
+
+        self.assertIs(client.requester, server.get_client().requester)
+        self.assertIs(
+            client.requester.session, get_session(server))
+
+        server.password = "changed"
+        server.save()
+        new_client = server.get_client()
+
+        self.assertIsNot(client.requester, new_client.requester)
+        self.assertEqual(
+            ("root", "changed"), new_client.requester.session.auth)
+
+    def test_get_client_sees_new_jobs(self):
+        """
+        A job created after a client has polled the server should be seen by
+        later clients.
+        """
+        server = JenkinsServerFactory.create()
+        data = load_fixture("fixture1")
+
+        with HTTMock(mock_url(r"\/api\/python$", "fixture1")):
+            self.assertNotIn("testing4", server.get_client().keys())
+
+        @urlmatch(path=r"\/api\/python$")
+        def with_new_job(url, request):
+            return data.replace("'name': 'testing3'", "'name': 'testing4'")
+
+        with HTTMock(with_new_job):
+            self.assertIn("testing4", server.get_client().keys())
+
+    def test_get_client_pool_invalidated_on_delete(self):
+        """
+        Deleting a server discards its pooled requester.
+        """
+        server = JenkinsServerFactory.create()
+        server.get_client()
+        pk = server.pk
+
+        server.delete()
+
+        self.assertEqual([], [x for x in requesters._items if x[0] == pk])
 
 
 class BuildTest(TestCase):
@@ -36,6 +102,41 @@ class BuildTest(TestCase):
             build_numbers,
             list(Build.objects.all().values_list("number", flat=True)))
 
+    def test_job_and_number_are_unique(self):
+        """A job can only have one build with a given number."""
+        build = BuildFactory.create()
+
+        with self.assertRaises(IntegrityError):
+            BuildFactory.create(job=build.job, number=build.number)
+
+    def test_builds_are_summaries_by_default(self):
+        """
+        Builds should be loaded without the console log and parameters unless
+        they are requested with with_details.
+        """
+        build = BuildFactory.create(console_log="Log")
+
+        summary = Build.objects.get(pk=build.pk)
+        self.assertNotIn("console_log", summary.__dict__)
+        self.assertNotIn("parameters", summary.__dict__)
+
+        detail = Build.objects.with_details().get(pk=build.pk)
+        self.assertFalse(detail._deferred)
+        self.assertEqual("Log", detail.__dict__["console_log"])
+
+    def test_deferred_builds_are_equal(self):
+        """
+        Builds loaded with deferred fields should be equal to fully loaded
+        builds with the same pk.
+        """
+        build = BuildFactory.create()
+
+        self.assertEqual(build, Build.objects.get(pk=build.pk))
+        self.assertEqual(Build.objects.get(pk=build.pk), build)
+        self.assertEqual(
+            Build.objects.get(pk=build.pk),
+            Build.objects.with_details().get(pk=build.pk))
+
     def test_phase_names(self):
         """
         The names of the phases vary depending on the version of the
@@ -47,6 +148,80 @@ class BuildTest(TestCase):
         self.assertEquals(Build.FINALIZED, 'FINALIZED')
 
 
+class ArtifactTest(TestCase):
+
+    def test_build_and_filename_are_unique(self):
+        """A build can only have one artifact with a given filename."""
+        artifact = ArtifactFactory.create()
+
+        with self.assertRaises(IntegrityError):
+            ArtifactFactory.create(
+                build=artifact.build, filename=artifact.filename)
+
+
+class ConsoleLogTest(TestCase):
+
+    def setUp(self):
+        self.log = ConsoleLog.objects.create(build=BuildFactory.create())
+        self.log.append("First line\nSecond ")
+        self.log.append("line\nThird line\n")
+        self.log.save()
+
+    def test_append(self):
+        """
+        Appending text should store a compressed chunk at the end of the log,
+        and track the size and number of lines.
+        """
+        self.assertEqual(34, self.log.size)
+        self.assertEqual(3, self.log.line_count)
+        self.assertEqual(
+            [(0, 0), (18, 1)],
+            list(self.log.chunks.values_list("offset", "first_line")))
+
+    def test_read(self):
+        """
+        Reading the log should return the text of all the chunks.
+        """
+        self.assertEqual(
+            "First line\nSecond line\nThird line\n", self.log.read())
+
+    def test_read_range(self):
+        """
+        Reading a range should only return the bytes in that range, even if it
+        spans chunks.
+        """
+        self.assertEqual("Second line", self.log.read(11, 22))
+        self.assertEqual("Third line\n", self.log.read(23))
+
+    def test_get_line_offset(self):
+        """
+        get_line_offset should return the offset that a line starts at, even
+        if the line starts in a different chunk to the one it ends in.
+        """
+        self.assertEqual(
+            [0, 11, 23, 34, 34],
+            [self.log.get_line_offset(x) for x in range(5)])
+
+    def test_read_lines(self):
+        """
+        read_lines should return whole lines from the log.
+        """
+        self.assertEqual("Second line\n", self.log.read_lines(1, 2))
+        self.assertEqual("Second line\nThird line\n", self.log.read_lines(1))
+
+    def test_build_get_console_log(self):
+        """
+        Builds should read the console from the chunked log, falling back to
+        the console_log stored on older builds.
+        """
+        self.assertEqual(
+            "First line\nSecond line\nThird line\n",
+            Build.objects.get(pk=self.log.build.pk).get_console_log())
+
+        build = BuildFactory.create(console_log="Old log")
+        self.assertEqual("Old log", build.get_console_log())
+
+
 class JobTypeTest(TestCase):
 
     def test_instantiation(self):
@@ -64,3 +239,40 @@ class JobTypeTest(TestCase):
         self.assertEqual(
             ["BUILD_ID", "BRANCH_TO_CHECKOUT"],
             [x["name"] for x in parameters])
+
+    def test_parameters_are_stored_on_save(self):
+        """
+        The parameters should be parsed when the JobType is saved, so that
+        get_parameters doesn't need to parse the config.
+        """
+        job_type = JobTypeWithParamsFactory.create()
+        job_type = JobType.objects.get(pk=job_type.pk)
+
+        with mock.patch(
+                "jenkins.models.parse_parameters_from_job") as mock_parse:
+            parameters = job_type.get_parameters()
+
+        self.assertFalse(mock_parse.called)
+        self.assertEqual(
+            ["BUILD_ID", "BRANCH_TO_CHECKOUT"],
+            [x["name"] for x in parameters])
+
+    def test_parameters_are_updated_on_save(self):
+        """
+        Changing the config should update the stored parameters.
+        """
+        job_type = JobTypeWithParamsFactory.create()
+        job_type.config_xml = "<project/>"
+        job_type.save()
+
+        self.assertEqual(
+            [], JobType.objects.get(pk=job_type.pk).get_parameters())
+
+    def test_parameters_with_invalid_config(self):
+        """
+        If the config can't be parsed, no parameters are stored.
+        """
+        job_type = JobType.objects.create(
+            name="my-test", config_xml="testing xml")
+
+        self.assertIsNone(JobType.objects.get(pk=job_type.pk).parameters)
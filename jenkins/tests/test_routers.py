@@ -0,0 +1,82 @@
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from jenkins.routers import JenkinsServerRouter
+from .factories import JobFactory, BuildFactory
+
+
+class JenkinsServerRouterTest(TestCase):
+
+    def setUp(self):
+        self.router = JenkinsServerRouter()
+        self.job = JobFactory.create()
+
+    @override_settings(ROUTE_TASKS_BY_SERVER=True)
+    def test_route_task_for_job(self):
+        """
+        Tasks that take a job should be routed to the queue for the server of
+        the job.
+        """
+        route = self.router.route_for_task(
+            "jenkins.tasks.push_job_to_jenkins", (self.job.pk,))
+
+        self.assertEqual(
+            {"queue": "jenkins.server.%d" % self.job.server.pk}, route)
+
+    @override_settings(ROUTE_TASKS_BY_SERVER=True)
+    def test_route_task_for_server(self):
+        """
+        Tasks that take a server should be routed to the queue for the
+        server.
+        """
+        route = self.router.route_for_task(
+            "jenkins.tasks.sample_server_load", (self.job.server.pk,))
+
+        self.assertEqual(
+            {"queue": self.job.server.get_queue_name()}, route)
+
+    @override_settings(ROUTE_TASKS_BY_SERVER=True)
+    def test_route_task_for_builds(self):
+        """
+        Tasks that take a list of builds should be routed by the first build.
+        """
+        build = BuildFactory.create(job=self.job)
+
+        route = self.router.route_for_task(
+            "jenkins.tasks.import_builds", ([build.pk],))
+
+        self.assertEqual(
+            {"queue": self.job.server.get_queue_name()}, route)
+
+    @override_settings(ROUTE_TASKS_BY_SERVER=True)
+    def test_route_task_for_archived_artifacts(self):
+        """
+        archive_artifacts should be routed by the first archived artifact.
+        """
+        from archives.tests.factories import ArchiveArtifactFactory
+        item = ArchiveArtifactFactory.create(
+            artifact__build__job=self.job)
+
+        route = self.router.route_for_task(
+            "archives.tasks.archive_artifacts", ([(item.pk, [])],))
+
+        self.assertEqual(
+            {"queue": self.job.server.get_queue_name()}, route)
+
+    @override_settings(ROUTE_TASKS_BY_SERVER=True)
+    def test_route_other_task(self):
+        """
+        Tasks that don't talk to a server should be left to the other routes.
+        """
+        self.assertIsNone(self.router.route_for_task(
+            "jenkins.tasks.process_queued_notifications", ()))
+        self.assertIsNone(self.router.route_for_task(
+            "jenkins.tasks.build_job", (self.job.pk + 1,)))
+
+    @override_settings(ROUTE_TASKS_BY_SERVER=False)
+    def test_routing_disabled(self):
+        """
+        Tasks should not be routed unless ROUTE_TASKS_BY_SERVER is set.
+        """
+        self.assertIsNone(self.router.route_for_task(
+            "jenkins.tasks.push_job_to_jenkins", (self.job.pk,)))
@@ -1,16 +1,31 @@
+from datetime import timedelta
+import json
+
+from django.core.cache import cache
 from django.test import TestCase
 from django.test.utils import override_settings
 from django.contrib.auth.models import User
+from django.utils import timezone
 
+from httmock import HTTMock, urlmatch
 import mock
 import jenkinsapi
+from jenkinsapi.custom_exceptions import WillNotBuild
+from requests.exceptions import HTTPError, ConnectionError
 
-from jenkins.models import Build
+from jenkins.helpers import get_least_loaded_job
+from jenkins.models import Build, BuildRequest, Job, QueuedNotification
 from jenkins.tasks import (
     build_job, push_job_to_jenkins, import_build_for_job,
-    delete_job_from_jenkins, extract_requestor_from_params)
+    delete_job_from_jenkins, extract_requestor_from_params,
+    process_queued_notifications, import_builds, import_artifacts,
+    sync_server_jobs, reconcile_stale_builds, import_console_log,
+    sample_server_loads)
+from jenkins.utils import get_content_hash
+from .helpers import mock_url
 from .factories import (
-    JobFactory, JenkinsServerFactory, JobTypeFactory, BuildFactory)
+    JobFactory, JenkinsServerFactory, JobTypeFactory, BuildFactory,
+    ArtifactFactory)
 
 
 class BuildJobTaskTest(TestCase):
@@ -31,7 +46,8 @@ class BuildJobTaskTest(TestCase):
             build_job(job.pk)
 
         mock_jenkins.assert_called_with(
-            self.server.url, username=u"root", password=u"testing")
+            self.server.url, username=u"root", password=u"testing",
+            requester=mock.ANY, lazy=True)
         mock_jenkins.return_value.build_job.assert_called_with(
             job.name, params={})
 
@@ -47,7 +63,8 @@ class BuildJobTaskTest(TestCase):
             build_job(job.pk, "20140312.1")
 
         mock_jenkins.assert_called_with(
-            self.server.url, username=u"root", password=u"testing")
+            self.server.url, username=u"root", password=u"testing",
+            requester=mock.ANY, lazy=True)
         mock_jenkins.return_value.build_job.assert_called_with(
             job.name, params={"BUILD_ID": "20140312.1"})
 
@@ -64,7 +81,8 @@ class BuildJobTaskTest(TestCase):
             build_job(job.pk, params={"MYTEST": "500"})
 
         mock_jenkins.assert_called_with(
-            self.server.url, username=u"root", password=u"testing")
+            self.server.url, username=u"root", password=u"testing",
+            requester=mock.ANY, lazy=True)
         mock_jenkins.return_value.build_job.assert_called_with(
             job.name, params={"MYTEST": "500"})
 
@@ -81,7 +99,8 @@ class BuildJobTaskTest(TestCase):
             build_job(job.pk, "20140312.1", params={"MYTEST": "500"})
 
         mock_jenkins.assert_called_with(
-            self.server.url, username=u"root", password=u"testing")
+            self.server.url, username=u"root", password=u"testing",
+            requester=mock.ANY, lazy=True)
         mock_jenkins.return_value.build_job.assert_called_with(
             job.name, params={"MYTEST": "500", "BUILD_ID": "20140312.1"})
 
@@ -99,12 +118,109 @@ class BuildJobTaskTest(TestCase):
                 user="testing")
 
         mock_jenkins.assert_called_with(
-            self.server.url, username=u"root", password=u"testing")
+            self.server.url, username=u"root", password=u"testing",
+            requester=mock.ANY, lazy=True)
         mock_jenkins.return_value.build_job.assert_called_with(
             job.name, params={
               "MYTEST": "500", "BUILD_ID": "20140312.1",
               "REQUESTOR": "testing"})
 
+    def test_build_job_records_request(self):
+        """
+        build_job should record the request that was sent to Jenkins.
+        """
+        job = JobFactory.create(server=self.server)
+        with mock.patch(
+                "jenkins.models.Jenkins", spec=jenkinsapi.jenkins.Jenkins):
+            request_pk = build_job(job.pk, "20140312.1", user="testing")
+
+        request = BuildRequest.objects.get(pk=request_pk)
+        self.assertEqual(job, request.job)
+        self.assertEqual(BuildRequest.QUEUED, request.status)
+        self.assertEqual(
+            {"BUILD_ID": "20140312.1", "REQUESTOR": "testing"},
+            request.parameters)
+
+    def test_build_job_coalesces_identical_requests(self):
+        """
+        An identical request for a job that's already queued shouldn't be
+        sent to Jenkins, even if it was requested by another user.
+        """
+        job = JobFactory.create(server=self.server)
+        with mock.patch(
+                "jenkins.models.Jenkins",
+                spec=jenkinsapi.jenkins.Jenkins) as mock_jenkins:
+            request_pk = build_job(job.pk, "20140312.1", user="testing")
+            with mock.patch("jenkins.tasks.logger") as mock_logger:
+                self.assertEqual(
+                    request_pk, build_job(job.pk, "20140312.1", user="other"))
+
+        self.assertEqual(1, mock_jenkins.return_value.build_job.call_count)
+        request = BuildRequest.objects.get(pk=request_pk)
+        self.assertEqual(1, request.coalesced)
+        mock_logger.info.assert_called_once_with(
+            "Coalesced build of %s with %s" % (job, request))
+
+    def test_build_job_with_different_parameters(self):
+        """
+        Requests with different parameters should both be sent.
+        """
+        job = JobFactory.create(server=self.server)
+        with mock.patch(
+                "jenkins.models.Jenkins",
+                spec=jenkinsapi.jenkins.Jenkins) as mock_jenkins:
+            build_job(job.pk, "20140312.1")
+            build_job(job.pk, "20140312.2")
+
+        self.assertEqual(2, mock_jenkins.return_value.build_job.call_count)
+
+    @override_settings(BUILD_REQUEST_WINDOW=60)
+    def test_build_job_outside_window(self):
+        """
+        Requests after the coalescing window should be sent to Jenkins.
+        """
+        job = JobFactory.create(server=self.server)
+        with mock.patch(
+                "jenkins.models.Jenkins",
+                spec=jenkinsapi.jenkins.Jenkins) as mock_jenkins:
+            request_pk = build_job(job.pk)
+            BuildRequest.objects.filter(pk=request_pk).update(
+                requested_at=timezone.now() - timedelta(seconds=61))
+            build_job(job.pk)
+
+        self.assertEqual(2, mock_jenkins.return_value.build_job.call_count)
+
+    def test_build_job_already_queued_in_jenkins(self):
+        """
+        If Jenkins won't build the job because it's already queued, then the
+        request is still recorded.
+        """
+        job = JobFactory.create(server=self.server)
+        with mock.patch(
+                "jenkins.models.Jenkins",
+                spec=jenkinsapi.jenkins.Jenkins) as mock_jenkins:
+            mock_jenkins.return_value.build_job.side_effect = WillNotBuild(
+                "Already queued")
+            request_pk = build_job(job.pk)
+
+        self.assertEqual(
+            BuildRequest.QUEUED,
+            BuildRequest.objects.get(pk=request_pk).status)
+
+    def test_build_job_with_error(self):
+        """
+        If the request fails, it shouldn't stop later requests being sent.
+        """
+        job = JobFactory.create(server=self.server)
+        with mock.patch(
+                "jenkins.models.Jenkins",
+                spec=jenkinsapi.jenkins.Jenkins) as mock_jenkins:
+            mock_jenkins.return_value.build_job.side_effect = HTTPError(500)
+            with self.assertRaises(HTTPError):
+                build_job(job.pk)
+
+        self.assertEqual(0, BuildRequest.objects.count())
+
 
 class ImportBuildTaskTest(TestCase):
 
@@ -142,30 +258,26 @@ class ImportBuildTaskTest(TestCase):
         from the Jenkins server, including fetching the artifact details.
         """
         user = User.objects.create_user("testing")
-        job = JobFactory.create()
+        server = JenkinsServerFactory.create(url="http://www.example.com/")
+        job = JobFactory.create(server=server, name="testjob")
         build = BuildFactory.create(job=job, number=5)
 
-        mock_job = mock.Mock(spec=jenkinsapi.job.Job)
-        mock_build = mock.Mock(_data={"duration": 1000})
+        mock_requests = []
+        mock_api = mock_url(
+            r"^/job/testjob/5/api/json$", "build_api_json", mock_requests)
 
-        mock_job.get_build.return_value = mock_build
-
-        mock_build.get_status.return_value = "SUCCESS"
-        mock_build.get_result_url.return_value = "http://localhost/123"
-        mock_build.get_console.return_value = "This is the log"
-        mock_build.get_artifacts.return_value = []
-        parameters = [{"name": "BUILD_ID", "value": ""},
-                      {"name": "REQUESTOR", "value": "testing"}]
-        mock_build.get_actions.return_value = {"parameters": parameters}
+        @urlmatch(path=r"^/job/testjob/5/logText/progressiveText$")
+        def mock_console(url, request):
+            mock_requests.append(request)
+            return {"status_code": 200, "content": "This is the log\n",
+                    "headers": {"X-Text-Size": "16", "X-More-Data": "false"}}
 
         with mock.patch("jenkins.tasks.logger") as mock_logger:
-            with mock.patch("jenkins.models.Jenkins") as mock_jenkins:
-                mock_jenkins.return_value.get_job.return_value = mock_job
+            with HTTMock(mock_api, mock_console):
                 result = import_build_for_job(build.pk)
 
         self.assertEqual(build.pk, result)
-        mock_jenkins.assert_called_with(
-            job.server.url, username=u"root", password=u"testing")
+        self.assertEqual(2, len(mock_requests))
 
         mock_logger.assert_has_calls(
             [mock.call.info("Located job %s\n" % job),
@@ -175,9 +287,109 @@ class ImportBuildTaskTest(TestCase):
         build = Build.objects.get(pk=build.pk)
         self.assertEqual(1000, build.duration)
         self.assertEqual("SUCCESS", build.status)
-        self.assertEqual("This is the log", build.console_log)
-        self.assertEqual(parameters, build.parameters)
+        self.assertEqual("http://www.example.com/job/testjob/5/", build.url)
+        self.assertEqual("This is the log\n", build.console.read())
+        self.assertEqual(16, build.console.size)
+        self.assertEqual(1, build.console.line_count)
+        self.assertEqual(
+            [{"name": "BUILD_ID", "value": ""},
+             {"name": "REQUESTOR", "value": "testing"}],
+            build.parameters)
         self.assertEqual(user, build.requested_by)
+        self.assertIsNotNone(build.imported_at)
+        self.assertEqual(
+            [("testing.img",
+              "http://www.example.com/job/testjob/5/artifact/testing.img"),
+             ("testing.txt",
+              "http://www.example.com/job/testjob/5/artifact/output/"
+              "testing.txt")],
+            list(build.artifact_set.order_by("filename").values_list(
+                "filename", "url")))
+
+
+class ImportArtifactsTest(TestCase):
+
+    def test_import_artifacts(self):
+        """
+        import_artifacts should create all the artifacts for the build with a
+        single query.
+        """
+        build = BuildFactory.create()
+
+        with self.assertNumQueries(2):
+            import_artifacts(build, [
+                ("testing.img", "http://example.com/testing.img"),
+                ("testing.txt", "http://example.com/testing.txt")])
+
+        self.assertEqual(
+            ["testing.img", "testing.txt"],
+            list(build.artifact_set.order_by("filename").values_list(
+                "filename", flat=True)))
+
+    def test_reimport_artifacts(self):
+        """
+        Reimporting artifacts should only create the new artifacts, and update
+        the URLs that have changed.
+        """
+        build = BuildFactory.create()
+        artifact = ArtifactFactory.create(
+            build=build, filename="testing.img",
+            url="http://example.com/old/testing.img")
+        ArtifactFactory.create(
+            build=build, filename="removed.img",
+            url="http://example.com/removed.img")
+
+        import_artifacts(build, [
+            ("testing.img", "http://example.com/testing.img"),
+            ("testing.txt", "http://example.com/testing.txt"),
+            ("testing.txt", "http://example.com/output/testing.txt")])
+
+        self.assertEqual(
+            [("removed.img", "http://example.com/removed.img"),
+             ("testing.img", "http://example.com/testing.img"),
+             ("testing.txt", "http://example.com/testing.txt")],
+            list(build.artifact_set.order_by("filename").values_list(
+                "filename", "url")))
+        self.assertEqual(
+            artifact.pk, build.artifact_set.get(filename="testing.img").pk)
+
+
+class ImportBuildsTaskTest(TestCase):
+
+    def test_import_builds(self):
+        """
+        import_builds should import each build that hasn't been imported yet,
+        and return the number imported.
+        """
+        build1, build2 = BuildFactory.create_batch(2)
+        imported = BuildFactory.create(imported_at=timezone.now())
+
+        with mock.patch(
+                "jenkins.tasks.import_build_for_job") as mock_import:
+            result = import_builds([build1.pk, imported.pk, build2.pk])
+
+        self.assertEqual(2, result)
+        self.assertEqual(
+            [mock.call(build1.pk), mock.call(build2.pk)],
+            mock_import.call_args_list)
+
+    def test_import_builds_continues_after_errors(self):
+        """
+        A failure to import a build should be logged, and the remaining builds
+        should still be imported.
+        """
+        build1, build2 = BuildFactory.create_batch(2)
+
+        with mock.patch(
+                "jenkins.tasks.import_build_for_job",
+                side_effect=[Exception("Failed"), None]) as mock_import:
+            with mock.patch("jenkins.tasks.logger") as mock_logger:
+                result = import_builds([build1.pk, build2.pk])
+
+        self.assertEqual(1, result)
+        self.assertEqual(2, mock_import.call_count)
+        mock_logger.exception.assert_called_once_with(
+            "Error importing build %d", build1.pk)
 
 
 job_xml = """
@@ -204,7 +416,8 @@ class CreateJobTaskTest(TestCase):
             push_job_to_jenkins(job.pk)
 
         mock_jenkins.assert_called_with(
-            job.server.url, username=u"root", password=u"testing")
+            job.server.url, username=u"root", password=u"testing",
+            requester=mock.ANY, lazy=True)
         mock_jenkins.return_value.has_job.assert_called_with("testing")
         mock_jenkins.return_value.create_job.assert_called_with(
             "testing",
@@ -238,7 +451,8 @@ class CreateJobTaskTest(TestCase):
             push_job_to_jenkins(job.pk)
 
         mock_jenkins.assert_called_with(
-            job.server.url, username=u"root", password=u"testing")
+            job.server.url, username=u"root", password=u"testing",
+            requester=mock.ANY, lazy=True)
 
         mock_jenkins.return_value.has_job.assert_called_with("testing")
         mock_apijob.update_config.assert_called_with(
@@ -253,6 +467,139 @@ class CreateJobTaskTest(TestCase):
              "</hudson.model.ParametersDefinitionProperty></project>" %
                 job.server.pk).strip())
 
+    @override_settings(
+        CELERY_ALWAYS_EAGER=True, NOTIFICATION_HOST="http://example.com")
+    def test_push_job_to_jenkins_records_fingerprint(self):
+        """
+        After pushing the job, the fingerprint of the config should be stored
+        on the job.
+        """
+        jobtype = JobTypeFactory.create(config_xml=job_xml)
+        job = JobFactory.create(jobtype=jobtype, name="testing")
+        with mock.patch(
+                "jenkins.models.Jenkins",
+                spec=jenkinsapi.jenkins.Jenkins) as mock_jenkins:
+            mock_jenkins.return_value.has_job.return_value = False
+            push_job_to_jenkins(job.pk)
+
+        [(_, xml), _] = mock_jenkins.return_value.create_job.call_args
+        job = Job.objects.get(pk=job.pk)
+        self.assertEqual(get_content_hash(xml), job.config_fingerprint)
+
+    @override_settings(
+        CELERY_ALWAYS_EAGER=True, NOTIFICATION_HOST="http://example.com")
+    def test_push_job_to_jenkins_with_unchanged_config(self):
+        """
+        If the config is the same as the config we last pushed, the job
+        shouldn't be pushed again unless we force it.
+        """
+        jobtype = JobTypeFactory.create(config_xml=job_xml)
+        job = JobFactory.create(jobtype=jobtype, name="testing")
+        with mock.patch(
+                "jenkins.models.Jenkins",
+                spec=jenkinsapi.jenkins.Jenkins) as mock_jenkins:
+            mock_jenkins.return_value.has_job.return_value = False
+            push_job_to_jenkins(job.pk)
+            push_job_to_jenkins(job.pk)
+            self.assertEqual(
+                1, mock_jenkins.return_value.create_job.call_count)
+
+            push_job_to_jenkins(job.pk, force=True)
+            self.assertEqual(
+                2, mock_jenkins.return_value.create_job.call_count)
+
+    @override_settings(
+        CELERY_ALWAYS_EAGER=True, NOTIFICATION_HOST="http://example.com")
+    def test_push_job_to_jenkins_with_changed_config(self):
+        """
+        If the jobtype changes, the job should be pushed again.
+        """
+        jobtype = JobTypeFactory.create(config_xml=job_xml)
+        job = JobFactory.create(jobtype=jobtype, name="testing")
+        with mock.patch(
+                "jenkins.models.Jenkins",
+                spec=jenkinsapi.jenkins.Jenkins) as mock_jenkins:
+            mock_jenkins.return_value.has_job.return_value = False
+            push_job_to_jenkins(job.pk)
+            jobtype.config_xml = job_xml.replace("<project>", "<project>New")
+            jobtype.save()
+            push_job_to_jenkins(job.pk)
+
+        self.assertEqual(2, mock_jenkins.return_value.create_job.call_count)
+
+
+class SyncServerJobsTaskTest(TestCase):
+
+    def setUp(self):
+        jobtype = JobTypeFactory.create(config_xml=job_xml)
+        self.job1 = JobFactory.create(jobtype=jobtype, name="job1")
+        self.job2 = JobFactory.create(
+            jobtype=jobtype, name="job2", server=self.job1.server)
+
+    @override_settings(NOTIFICATION_HOST="http://example.com")
+    def test_sync_server_jobs(self):
+        """
+        Jobs that don't exist on the server should be created, and jobs whose
+        config has changed should be updated.
+        """
+        with mock.patch("jenkins.tasks.create_job") as mock_create:
+            with mock.patch("jenkins.tasks.update_job_config") as mock_update:
+                results = sync_server_jobs(
+                    [self.job1.pk, self.job2.pk], ["job2"])
+
+        server_name = self.job1.server.name
+        self.assertEqual(
+            [("job1", server_name, "created"),
+             ("job2", server_name, "updated")], results)
+        [(server, name, xml), _] = mock_create.call_args
+        self.assertEqual("job1", name)
+        mock_update.assert_called_once_with(self.job1.server, "job2", xml)
+        self.assertEqual(
+            get_content_hash(xml),
+            Job.objects.get(pk=self.job2.pk).config_fingerprint)
+
+    @override_settings(NOTIFICATION_HOST="http://example.com")
+    def test_sync_server_jobs_skips_unchanged_jobs(self):
+        """
+        Jobs whose config matches what was last pushed shouldn't be pushed.
+        """
+        with mock.patch("jenkins.tasks.update_job_config") as mock_update:
+            sync_server_jobs([self.job1.pk], ["job1"])
+            results = sync_server_jobs([self.job1.pk], ["job1"])
+
+        self.assertEqual(
+            [("job1", self.job1.server.name, "unchanged")], results)
+        self.assertEqual(1, mock_update.call_count)
+
+    @override_settings(NOTIFICATION_HOST="http://example.com")
+    def test_sync_server_jobs_dry_run(self):
+        """
+        A dry run should report what would be done without pushing.
+        """
+        with mock.patch("jenkins.tasks.create_job") as mock_create:
+            results = sync_server_jobs([self.job1.pk], [], dry_run=True)
+
+        self.assertEqual(
+            [("job1", self.job1.server.name, "created")], results)
+        self.assertFalse(mock_create.called)
+        self.assertEqual(
+            "", Job.objects.get(pk=self.job1.pk).config_fingerprint)
+
+    @override_settings(NOTIFICATION_HOST="http://example.com")
+    def test_sync_server_jobs_with_failure(self):
+        """
+        If a job can't be pushed, it should be reported as failed, and the
+        other jobs should still be pushed.
+        """
+        with mock.patch(
+                "jenkins.tasks.create_job",
+                side_effect=[Exception("Failed"), None]):
+            with mock.patch("jenkins.tasks.logger"):
+                results = sync_server_jobs([self.job1.pk, self.job2.pk], [])
+
+        self.assertEqual(
+            ["failed", "created"], [action for _, _, action in results])
+
 
 class RemoveJobTaskTest(TestCase):
 
@@ -271,5 +618,290 @@ class RemoveJobTaskTest(TestCase):
             delete_job_from_jenkins(job.pk)
 
         mock_jenkins.assert_called_with(
-            job.server.url, username=u"root", password=u"testing")
+            job.server.url, username=u"root", password=u"testing",
+            requester=mock.ANY, lazy=True)
         mock_jenkins.return_value.delete_job.assert_called_with("testing")
+
+
+class ProcessQueuedNotificationsTaskTest(TestCase):
+
+    def setUp(self):
+        self.server = JenkinsServerFactory.create()
+        self.job = JobFactory.create(server=self.server, name="mytestjob")
+
+    def _queue_notification(self, number, phase, name="mytestjob"):
+        notification = {
+            "build": {
+                "number": number,
+                "phase": phase,
+                "status": "SUCCESS",
+                "url": "job/%s/%d/" % (name, number)},
+            "name": name}
+        return QueuedNotification.objects.create(
+            server=self.server, payload=json.dumps(notification))
+
+    def test_process_queued_notifications(self):
+        """
+        Queued notifications are applied in the order they were received, then
+        removed from the queue, and finalized builds are postprocessed.
+        """
+        self._queue_notification(5, "STARTED")
+        self._queue_notification(5, "FINALIZED")
+        self._queue_notification(6, "STARTED")
+
+        with mock.patch(
+                "jenkins.helpers.postprocess_builds") as mock_postprocess:
+            result = process_queued_notifications()
+
+        self.assertEqual(3, result)
+        self.assertEqual(0, QueuedNotification.objects.count())
+        build5 = self.job.build_set.get(number=5)
+        self.assertEqual(Build.FINALIZED, build5.phase)
+        self.assertEqual(
+            Build.STARTED, self.job.build_set.get(number=6).phase)
+        mock_postprocess.assert_called_once_with([build5])
+
+    def test_process_queued_notifications_with_unknown_job(self):
+        """
+        Notifications for unknown jobs are logged and discarded.
+        """
+        self._queue_notification(5, "STARTED", name="unknown")
+
+        with mock.patch("jenkins.tasks.logger") as mock_logger:
+            with mock.patch("jenkins.helpers.postprocess_builds"):
+                process_queued_notifications()
+
+        mock_logger.warning.assert_called_once_with(
+            "Notification for unknown job '%s'", "unknown")
+        self.assertEqual(0, QueuedNotification.objects.count())
+        self.assertEqual(0, Build.objects.count())
+
+    def test_process_queued_notifications_with_invalid_payload(self):
+        """
+        Queued notifications that can't be parsed are logged and discarded,
+        and the rest of the queue is still applied.
+        """
+        QueuedNotification.objects.create(
+            server=self.server, payload="not json")
+        self._queue_notification(5, "STARTED")
+
+        with mock.patch("jenkins.tasks.logger") as mock_logger:
+            with mock.patch("jenkins.helpers.postprocess_builds"):
+                result = process_queued_notifications()
+
+        self.assertEqual(2, result)
+        self.assertTrue(mock_logger.error.called)
+        self.assertEqual(0, QueuedNotification.objects.count())
+        self.assertEqual(
+            Build.STARTED, self.job.build_set.get(number=5).phase)
+
+    def test_process_queued_notifications_with_failing_notification(self):
+        """
+        A notification that fails to apply is rolled back, logged and
+        discarded, without holding up the rest of the queue.
+        """
+        self._queue_notification(5, "STARTED")
+        self._queue_notification(6, "STARTED")
+
+        from jenkins.helpers import update_build_from_notification
+
+        def update_build(job, notification):
+            if notification["build"]["number"] == 5:
+                raise ValueError("Testing")
+            return update_build_from_notification(job, notification)
+
+        with mock.patch("jenkins.tasks.logger") as mock_logger:
+            with mock.patch(
+                    "jenkins.helpers.update_build_from_notification",
+                    side_effect=update_build):
+                with mock.patch("jenkins.helpers.postprocess_builds"):
+                    result = process_queued_notifications()
+
+        self.assertEqual(2, result)
+        self.assertTrue(mock_logger.exception.called)
+        self.assertEqual(0, QueuedNotification.objects.count())
+        self.assertEqual(
+            [6], list(self.job.build_set.values_list("number", flat=True)))
+
+    @override_settings(CELERY_ALWAYS_EAGER=True)
+    def test_process_queued_notifications_in_batches(self):
+        """
+        If a full batch was processed, the task queues itself to process the
+        rest of the notifications.
+        """
+        for number in range(3):
+            self._queue_notification(number, "STARTED")
+
+        with mock.patch("jenkins.helpers.postprocess_builds"):
+            process_queued_notifications.delay(batch_size=2)
+
+        self.assertEqual(0, QueuedNotification.objects.count())
+        self.assertEqual(3, self.job.build_set.count())
+
+
+class ReconcileStaleBuildsTaskTest(TestCase):
+
+    def setUp(self):
+        self.job = JobFactory.create(name="mytestjob")
+
+    def create_build(self, number, age=7200, **kwargs):
+        build = BuildFactory.create(
+            job=self.job, number=number, phase=Build.STARTED, **kwargs)
+        Build.objects.filter(pk=build.pk).update(
+            created_at=timezone.now() - timedelta(seconds=age))
+        return build
+
+    def test_reconcile_stale_builds(self):
+        """
+        Stale builds that Jenkins has finished should be finalized and
+        postprocessed, with a single request for the job.
+        """
+        build1 = self.create_build(1)
+        build2 = self.create_build(2)
+        build3 = self.create_build(3, age=60)
+        states = {
+            1: {"building": False, "result": "FAILURE",
+                "url": "http://localhost/job/mytestjob/1/"},
+            2: {"building": True, "result": None,
+                "url": "http://localhost/job/mytestjob/2/"},
+        }
+
+        with mock.patch(
+                "jenkins.tasks.get_build_states",
+                return_value=states) as mock_states:
+            with mock.patch(
+                    "jenkins.helpers.postprocess_builds") as mock_postprocess:
+                metrics = reconcile_stale_builds(max_age=3600)
+
+        mock_states.assert_called_once_with(
+            self.job.server, "mytestjob", 1, 3)
+        build1 = Build.objects.get(pk=build1.pk)
+        self.assertEqual(Build.FINALIZED, build1.phase)
+        self.assertEqual("FAILURE", build1.status)
+        self.assertEqual(
+            Build.STARTED, Build.objects.get(pk=build2.pk).phase)
+        self.assertEqual(
+            Build.STARTED, Build.objects.get(pk=build3.pk).phase)
+        mock_postprocess.assert_called_once_with([build1])
+        server_metrics = metrics[self.job.server.name]
+        self.assertEqual(2, server_metrics["stale"])
+        self.assertEqual(1, server_metrics["finalized"])
+        self.assertTrue(server_metrics["lag"] >= 7200)
+
+    def test_reconcile_stale_builds_missing_from_server(self):
+        """
+        Stale builds that the server no longer has should be finalized with
+        an UNKNOWN status, so they aren't checked again, but not
+        postprocessed.
+        """
+        build = self.create_build(1, url="http://localhost/job/mytestjob/1/")
+
+        with mock.patch("jenkins.tasks.get_build_states", return_value={}):
+            with mock.patch(
+                    "jenkins.helpers.postprocess_builds") as mock_postprocess:
+                metrics = reconcile_stale_builds()
+
+        build = Build.objects.get(pk=build.pk)
+        self.assertEqual(Build.FINALIZED, build.phase)
+        self.assertEqual("UNKNOWN", build.status)
+        self.assertEqual("http://localhost/job/mytestjob/1/", build.url)
+        mock_postprocess.assert_called_once_with([])
+        self.assertEqual(1, metrics[self.job.server.name]["missing"])
+        self.assertEqual(0, metrics[self.job.server.name]["finalized"])
+
+    @override_settings(BUILD_REQUEST_EXPIRY=3600)
+    def test_reconcile_stale_builds_expires_build_requests(self):
+        """
+        Build requests that Jenkins never started should be expired, fresh
+        requests should be left queued.
+        """
+        stale = BuildRequest.objects.create(
+            job=self.job, parameters={}, parameters_hash="a")
+        BuildRequest.objects.filter(pk=stale.pk).update(
+            requested_at=timezone.now() - timedelta(seconds=3601))
+        fresh = BuildRequest.objects.create(
+            job=self.job, parameters={}, parameters_hash="a")
+
+        with mock.patch("jenkins.helpers.postprocess_builds"):
+            reconcile_stale_builds()
+
+        self.assertEqual(
+            BuildRequest.EXPIRED, BuildRequest.objects.get(pk=stale.pk).status)
+        self.assertEqual(
+            BuildRequest.QUEUED, BuildRequest.objects.get(pk=fresh.pk).status)
+
+    def test_reconcile_stale_builds_with_unreachable_server(self):
+        """
+        Errors talking to a server should be logged, and the builds left for
+        next time.
+        """
+        build = self.create_build(1)
+
+        with mock.patch(
+                "jenkins.tasks.get_build_states",
+                side_effect=ConnectionError("Connection refused")):
+            with mock.patch("jenkins.tasks.logger") as mock_logger:
+                with mock.patch("jenkins.helpers.postprocess_builds"):
+                    metrics = reconcile_stale_builds()
+
+        mock_logger.exception.assert_called_once_with(
+            "Error checking the builds of %s", self.job)
+        self.assertEqual(
+            Build.STARTED, Build.objects.get(pk=build.pk).phase)
+        self.assertEqual(0, metrics[self.job.server.name]["finalized"])
+
+
+class ImportConsoleLogTest(TestCase):
+
+    def test_import_console_log_resumes(self):
+        """
+        If importing the console log is interrupted, importing it again
+        should pick up after the text that was stored.
+        """
+        build = BuildFactory.create()
+
+        def interrupted(server, job_name, number, start=0, chunk_size=0):
+            yield b"First line\n"
+            raise ConnectionError("Connection reset")
+
+        with mock.patch("jenkins.tasks.iter_console_log", interrupted):
+            with self.assertRaises(ConnectionError):
+                import_console_log(build, chunk_size=4)
+
+        with mock.patch("jenkins.tasks.iter_console_log") as mock_iter:
+            mock_iter.return_value = iter([b"Second line\n"])
+            log = import_console_log(build, chunk_size=4)
+
+        self.assertEqual(11, mock_iter.call_args[1]["start"])
+        self.assertEqual(b"First line\nSecond line\n", log.read())
+        self.assertEqual(2, log.line_count)
+
+
+class SampleServerLoadsTaskTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    @override_settings(CELERY_ALWAYS_EAGER=True)
+    def test_sample_server_loads(self):
+        """
+        The load of each server should be sampled and cached for
+        get_least_loaded_job.
+        """
+        jobs = [
+            JobFactory.create(server=server)
+            for server in JenkinsServerFactory.create_batch(2)]
+        loads = {
+            jobs[0].server.pk: {"busy": 2, "queued": 3, "total": 2},
+            jobs[1].server.pk: {"busy": 1, "queued": 0, "total": 2},
+        }
+
+        with mock.patch(
+                "jenkins.helpers.get_server_load",
+                side_effect=lambda server, timeout: loads[server.pk]):
+            sample_server_loads()
+
+        self.assertEqual(jobs[1], get_least_loaded_job(jobs))
@@ -9,7 +9,8 @@ import mock
 from jenkins.utils import (
     get_notifications_url, DefaultSettings, get_job_xml_for_upload,
     get_context_for_template, generate_job_name, parse_parameters_from_job,
-    JenkinsParameter, parameter_to_xml, add_parameter_to_job)
+    JenkinsParameter, parameter_to_xml, add_parameter_to_job, get_template,
+    get_content_hash, can_wait_for_results)
 from .factories import (
     JobFactory, JobTypeFactory, JenkinsServerFactory, JobTypeWithParamsFactory)
 
@@ -26,6 +27,17 @@ class NotificationUrlTest(SimpleTestCase):
             "http://example.com/jenkins/notifications/?server=%d" % server.pk,
             get_notifications_url("http://example.com/", server))
 
+    def test_get_notifications_url_with_token(self):
+        """
+        If the server has a notification token, it should be included in the
+        URL.
+        """
+        server = JenkinsServerFactory.create(notification_token="a secret")
+        self.assertEqual(
+            "http://example.com/jenkins/notifications/?server=%d"
+            "&token=a+secret" % server.pk,
+            get_notifications_url("http://example.com/", server))
+
 
 class DefaultSettingsTest(SimpleTestCase):
 
@@ -149,6 +161,38 @@ class GetTemplatedJobTest(TestCase):
         self.assertTrue(get_job_xml_for_upload(job, server)[0] != "\n")
 
 
+class GetTemplateTest(SimpleTestCase):
+
+    def test_get_template(self):
+        """
+        get_template should compile the config, and return the same compiled
+        template for the same content.
+        """
+        template = get_template("<project>{{ job }}</project>")
+
+        self.assertIs(template, get_template("<project>{{ job }}</project>"))
+        self.assertIsNot(template, get_template("<project></project>"))
+
+    def test_get_template_cache_is_bounded(self):
+        """
+        The cache should be emptied when it gets too big.
+        """
+        with mock.patch("jenkins.utils.TEMPLATE_CACHE_SIZE", 2):
+            template = get_template("<project>1</project>")
+            get_template("<project>2</project>")
+            get_template("<project>3</project>")
+
+            self.assertIsNot(template, get_template("<project>1</project>"))
+
+    def test_get_content_hash(self):
+        """
+        get_content_hash should hash unicode content as UTF-8.
+        """
+        self.assertEqual(
+            get_content_hash(b"caf\xc3\xa9"), get_content_hash(u"caf\xe9"))
+        self.assertEqual(40, len(get_content_hash("")))
+
+
 class GenerateNameJobTest(TestCase):
 
     def test_generate_job_name(self):
@@ -166,6 +210,31 @@ class GenerateNameJobTest(TestCase):
         self.assertEqual(name, expected_job_name)
 
 
+class CanWaitForResultsTest(SimpleTestCase):
+
+    @override_settings(CELERY_ALWAYS_EAGER=False, CELERY_RESULT_BACKEND=None)
+    def test_without_result_backend(self):
+        """
+        Results can't be fetched without a result backend.
+        """
+        self.assertFalse(can_wait_for_results())
+
+    @override_settings(
+        CELERY_ALWAYS_EAGER=False, CELERY_RESULT_BACKEND="redis://")
+    def test_with_result_backend(self):
+        """
+        Results can be fetched from a result backend.
+        """
+        self.assertTrue(can_wait_for_results())
+
+    @override_settings(CELERY_ALWAYS_EAGER=True, CELERY_RESULT_BACKEND=None)
+    def test_eager(self):
+        """
+        Eager tasks return their results directly.
+        """
+        self.assertTrue(can_wait_for_results())
+
+
 class ParseParametersFromJobTest(TestCase):
 
     def test_parse_parameters_from_job(self):
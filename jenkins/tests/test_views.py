@@ -2,14 +2,15 @@ import json
 
 from django.test import TestCase
 from django.test.client import RequestFactory
+from django.test.utils import override_settings
 from django.core.urlresolvers import reverse
 from django.contrib.auth.models import User
 
 from django_webtest import WebTest
 import mock
 
-from jenkins.views import NotificationHandlerView
-from jenkins.models import Build
+from jenkins.views import NotificationHandlerView, BatchNotificationHandlerView
+from jenkins.models import Build, ConsoleLog, QueuedNotification
 from .factories import (
     JobFactory, JenkinsServerFactory, BuildFactory, JobTypeFactory)
 
@@ -43,6 +44,31 @@ class NotificationHandlerTest(TestCase):
             mock_logging.warn.assert_called_once_with(
                 "Could not find server with Pk: 5")
 
+    def test_handle_notification_with_token(self):
+        """
+        If the server has a notification token, notifications without it
+        should be refused.
+        """
+        self.server.notification_token = "secret"
+        self.server.save()
+        notification = {
+            "name": "mytestjob",
+            "build": {"phase": Build.STARTED, "number": 10}
+        }
+
+        responses = []
+        for token in ["", "&token=wrong", "&token=secret"]:
+            request = self.factory.post(
+                "/jenkins/notifications?server=%d%s" % (
+                    self.server.pk, token),
+                content_type="application/json",
+                data=json.dumps(notification))
+            with mock.patch("jenkins.views.logging"):
+                responses.append(self.view(request).status_code)
+
+        self.assertEqual([403, 403, 200], responses)
+        self.assertEqual(1, self.job.build_set.count())
+
     def test_handle_notification_with_unknown_job(self):
         """
         If we can't find the job referred to in the notification, we should get
@@ -237,6 +263,295 @@ class NotificationHandlerTest(TestCase):
         self.assertEqual("20140312.2", build.build_id)
         mock_postprocess_build.assert_called_once_with(build)
 
+    def test_handle_replayed_started_notification(self):
+        """
+        If Jenkins resends a STARTED notification, we shouldn't get a second
+        Build.
+        """
+        started = {
+            "build": {
+                "number": 11,
+                "phase": "STARTED",
+                "url": "job/mytestjob/11/"},
+            "name": "mytestjob",
+            "url": "job/mytestjob/"}
+        self._get_response_with_data(started)
+        response = self._get_response_with_data(started)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, Build.objects.count())
+
+    def test_handle_replayed_finalized_notification(self):
+        """
+        If we get both FINISHED and FINALIZED notifications, or a notification
+        is resent, the build should only be postprocessed once.
+        """
+        finished = {
+            "build": {
+                "number": 20,
+                "phase": "FINISHED",
+                "status": "SUCCESS",
+                "url": "job/mytestjob/20/"},
+            "name": "mytestjob",
+            "url": "job/mytestjob/"}
+        finalized = dict(
+            finished, build=dict(finished["build"], phase="FINALIZED"))
+
+        with mock.patch("jenkins.views.postprocess_build") as mock_postprocess:
+            self._get_response_with_data(finished)
+            self._get_response_with_data(finalized)
+            self._get_response_with_data(finalized)
+
+        build = Build.objects.get(job=self.job, number=20)
+        mock_postprocess.assert_called_once_with(build)
+
+    def test_handle_started_notification_after_finalized(self):
+        """
+        A STARTED notification that arrives late shouldn't move a finalized
+        build back to STARTED.
+        """
+        self.job.build_set.create(
+            number=11, phase=Build.FINALIZED, status="SUCCESS")
+        started = {
+            "build": {
+                "number": 11,
+                "phase": "STARTED",
+                "url": "job/mytestjob/11/"},
+            "name": "mytestjob",
+            "url": "job/mytestjob/"}
+        self._get_response_with_data(started)
+
+        build = Build.objects.get(job=self.job, number=11)
+        self.assertEqual(Build.FINALIZED, build.phase)
+        self.assertEqual("SUCCESS", build.status)
+
+    @override_settings(QUEUE_NOTIFICATIONS=True)
+    def test_handle_notification_when_queueing(self):
+        """
+        If notifications are queued, the payload should be stored for celery
+        beat to process, without touching any builds or the broker.
+        """
+        finished = {
+            "build": {
+                "number": 20,
+                "phase": "FINALIZED",
+                "status": "SUCCESS",
+                "url": "job/mytestjob/20/"},
+            "name": "mytestjob",
+            "url": "job/mytestjob/"}
+
+        with mock.patch(
+                "jenkins.tasks.process_queued_notifications") as mock_task:
+            response = self._get_response_with_data(finished)
+
+        self.assertEqual(202, response.status_code)
+        self.assertEqual(0, Build.objects.count())
+        [queued] = QueuedNotification.objects.all()
+        self.assertEqual(self.server, queued.server)
+        self.assertEqual(finished, json.loads(queued.payload))
+        self.assertFalse(mock_task.delay.called)
+
+    @override_settings(QUEUE_NOTIFICATIONS=True)
+    def test_handle_invalid_notification_when_queueing(self):
+        """
+        Notifications without the build details are rejected before they are
+        queued.
+        """
+        response = self._get_response_with_data({"name": "mytestjob"})
+
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(0, QueuedNotification.objects.count())
+
+    @override_settings(QUEUE_NOTIFICATIONS=True)
+    def test_handle_finalized_notification_without_status_when_queueing(self):
+        """
+        FINALIZED notifications without the status and url of the build are
+        rejected before they are queued.
+        """
+        finished = {
+            "build": {"number": 20, "phase": "FINALIZED"},
+            "name": "mytestjob"}
+
+        response = self._get_response_with_data(finished)
+
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(0, QueuedNotification.objects.count())
+
+
+class BatchNotificationHandlerTest(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.view = BatchNotificationHandlerView.as_view()
+        self.server = JenkinsServerFactory.create()
+        self.job = JobFactory(server=self.server, name="mytestjob")
+
+    def _get_response_with_data(self, data, server_pk=None):
+        url = "/jenkins/notifications/batch/"
+        if server_pk is not None:
+            url += "?server=%d" % server_pk
+        request = self.factory.post(
+            url, content_type="application/json", data=json.dumps(data))
+        return self.view(request)
+
+    def _make_notification(self, number, phase, name="mytestjob", **kwargs):
+        notification = {
+            "build": {
+                "number": number,
+                "phase": phase,
+                "status": "SUCCESS",
+                "url": "job/%s/%d/" % (name, number)},
+            "name": name,
+            "url": "job/%s/" % name}
+        notification.update(kwargs)
+        return notification
+
+    def test_handle_batch_of_notifications(self):
+        """
+        All the notifications in the batch should be applied, and the finalized
+        builds should be postprocessed together.
+        """
+        self.job.build_set.create(number=10, phase=Build.STARTED)
+        notifications = [
+            self._make_notification(10, "FINALIZED"),
+            self._make_notification(11, "STARTED"),
+            self._make_notification(12, "FINISHED")]
+
+        with mock.patch(
+                "jenkins.views.postprocess_builds") as mock_postprocess:
+            response = self._get_response_with_data(
+                notifications, self.server.pk)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            {"processed": 3, "rejected": 0}, json.loads(response.content))
+        self.assertEqual(
+            [12, 11, 10],
+            list(self.job.build_set.values_list("number", flat=True)))
+        self.assertEqual(
+            Build.STARTED, self.job.build_set.get(number=11).phase)
+        build10 = self.job.build_set.get(number=10)
+        build12 = self.job.build_set.get(number=12)
+        self.assertEqual(Build.FINALIZED, build10.phase)
+        self.assertEqual(Build.FINALIZED, build12.phase)
+        mock_postprocess.assert_called_once_with([build10, build12])
+
+    def test_handle_batch_with_servers_in_notifications(self):
+        """
+        Notifications can identify the server they came from, which overrides
+        the server in the query string.
+        """
+        other_server = JenkinsServerFactory.create()
+        other_job = JobFactory(server=other_server, name="mytestjob")
+        notifications = [
+            self._make_notification(1, "STARTED", server=other_server.pk),
+            self._make_notification(2, "STARTED")]
+
+        with mock.patch("jenkins.views.postprocess_builds"):
+            self._get_response_with_data(notifications, self.server.pk)
+
+        self.assertEqual(
+            [1], list(other_job.build_set.values_list("number", flat=True)))
+        self.assertEqual(
+            [2], list(self.job.build_set.values_list("number", flat=True)))
+
+    def test_handle_batch_with_unknown_server_and_job(self):
+        """
+        Notifications for unknown servers or jobs are logged and skipped, but
+        don't prevent the rest of the batch being applied.
+        """
+        notifications = [
+            self._make_notification(1, "STARTED", server=9999),
+            self._make_notification(2, "STARTED", name="unknown job"),
+            self._make_notification(3, "STARTED")]
+
+        with mock.patch("jenkins.views.logging") as mock_logging:
+            with mock.patch("jenkins.views.postprocess_builds"):
+                response = self._get_response_with_data(
+                    notifications, self.server.pk)
+
+        self.assertEqual(
+            {"processed": 1, "rejected": 2}, json.loads(response.content))
+        mock_logging.warn.assert_has_calls([
+            mock.call("Could not find server with Pk: 9999"),
+            mock.call("Notification for unknown job 'unknown job'")])
+        self.assertEqual(
+            [3], list(self.job.build_set.values_list("number", flat=True)))
+
+    def test_handle_batch_with_invalid_token(self):
+        """
+        Notifications for servers that don't accept the token in the query
+        string should be rejected.
+        """
+        other_server = JenkinsServerFactory.create(notification_token="other")
+        JobFactory(server=other_server, name="mytestjob")
+        self.server.notification_token = "secret"
+        self.server.save()
+        notifications = [
+            self._make_notification(1, "STARTED", server=other_server.pk),
+            self._make_notification(2, "STARTED")]
+        request = self.factory.post(
+            "/jenkins/notifications/batch/?server=%d&token=secret" % (
+                self.server.pk),
+            content_type="application/json", data=json.dumps(notifications))
+
+        with mock.patch("jenkins.views.logging"):
+            with mock.patch("jenkins.views.postprocess_builds"):
+                response = self.view(request)
+
+        self.assertEqual(
+            {"processed": 1, "rejected": 1}, json.loads(response.content))
+        self.assertEqual(
+            [2], list(Build.objects.values_list("number", flat=True)))
+
+    def test_handle_batch_that_is_not_a_list(self):
+        """
+        The body of the request must be a JSON array of notifications.
+        """
+        response = self._get_response_with_data(
+            self._make_notification(1, "STARTED"), self.server.pk)
+
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(0, Build.objects.count())
+
+    def test_handle_batch_with_malformed_json(self):
+        """
+        A body that isn't JSON is a bad request.
+        """
+        request = self.factory.post(
+            "/jenkins/notifications/batch/?server=%d" % self.server.pk,
+            content_type="application/json", data="[{\"name\": ")
+
+        response = self.view(request)
+
+        self.assertEqual(400, response.status_code)
+
+    def test_handle_batch_with_invalid_notifications(self):
+        """
+        Notifications that aren't objects, or that are missing details, are
+        logged and rejected without preventing the rest of the batch being
+        applied.
+        """
+        notifications = [
+            "not a notification",
+            {"build": {"number": 1, "phase": "STARTED"}},
+            self._make_notification(2, "STARTED", name=""),
+            {"name": "mytestjob",
+             "build": {"number": 3, "phase": "FINALIZED"}},
+            self._make_notification(4, "STARTED")]
+
+        with mock.patch("jenkins.views.logging") as mock_logging:
+            with mock.patch("jenkins.views.postprocess_builds"):
+                response = self._get_response_with_data(
+                    notifications, self.server.pk)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            {"processed": 1, "rejected": 4}, json.loads(response.content))
+        self.assertEqual(4, mock_logging.warn.call_count)
+        self.assertEqual(
+            [4], list(self.job.build_set.values_list("number", flat=True)))
+
 
 class JenkinsServerIndexTest(WebTest):
 
@@ -360,3 +675,109 @@ class BuildDetailTest(WebTest):
         self.assertEqual(200, response.status_code)
         self.assertEqual(
             build, response.context["build"])
+
+    def test_build_detail_without_console_log(self):
+        """
+        The build view shouldn't render the console log stored on the build,
+        older logs are moved into ConsoleLogs by a migration.
+        """
+        build = BuildFactory.create(console_log="Line of output\n" * 10000)
+        build_url = reverse(
+            "build_detail", kwargs={"pk": build.pk})
+        response = self.app.get(build_url, user="testing")
+
+        self.assertIsNone(response.context["console"])
+        self.assertNotIn("Line of output", response.content)
+
+    def test_build_detail_with_console_log(self):
+        """
+        The build view should only include the tail of the console log,
+        starting at the beginning of a line.
+        """
+        build = BuildFactory.create()
+        log = ConsoleLog.objects.create(build=build)
+        log.append("Line of output\n" * 10000)
+        log.save()
+        build_url = reverse(
+            "build_detail", kwargs={"pk": build.pk})
+
+        with mock.patch("jenkins.views.CONSOLE_WINDOW_SIZE", 100):
+            response = self.app.get(build_url, user="testing")
+
+        console = response.context["console"]
+        self.assertEqual(150000, console["size"])
+        self.assertEqual(149910, console["start"])
+        self.assertEqual("Line of output\n" * 6, console["text"])
+        self.assertEqual(
+            console["text"], response.html.find("pre", id="console").text)
+
+
+class BuildConsoleTest(WebTest):
+
+    def setUp(self):
+        self.user = User.objects.create_user("testing")
+        self.build = BuildFactory.create()
+        log = ConsoleLog.objects.create(build=self.build)
+        log.append("First line\nSecond ")
+        log.append("line\nThird line\n")
+        log.save()
+        self.url = reverse("build_console", kwargs={"pk": self.build.pk})
+
+    def test_page_requires_authenticated_user(self):
+        """
+        The console should only be available to logged in users.
+        """
+        response = self.app.get(self.url)
+        self.assertEqual(302, response.status_code)
+
+    def test_console_byte_range(self):
+        """
+        The console view should return the requested range of bytes.
+        """
+        response = self.app.get(
+            self.url, {"start": 11, "end": 22}, user="testing")
+
+        self.assertEqual(
+            {"start": 11, "end": 22, "size": 34, "line_count": 3,
+             "text": "Second line"},
+            response.json)
+
+    def test_console_line_range(self):
+        """
+        The console view should translate line numbers to byte offsets.
+        """
+        response = self.app.get(
+            self.url, {"start_line": 1, "end_line": 2}, user="testing")
+
+        self.assertEqual(11, response.json["start"])
+        self.assertEqual("Second line\n", response.json["text"])
+
+    def test_console_tail(self):
+        """
+        The tail of the console should start at the beginning of a line.
+        """
+        response = self.app.get(self.url, {"tail": 15}, user="testing")
+
+        self.assertEqual(23, response.json["start"])
+        self.assertEqual("Third line\n", response.json["text"])
+
+    def test_console_head(self):
+        """
+        By default the console view should return the start of the log.
+        """
+        response = self.app.get(self.url, user="testing")
+
+        self.assertEqual(0, response.json["start"])
+        self.assertEqual(
+            "First line\nSecond line\nThird line\n", response.json["text"])
+
+    def test_console_without_console_log(self):
+        """
+        Builds without a stored console log should return a 404.
+        """
+        build = BuildFactory.create()
+        url = reverse("build_console", kwargs={"pk": build.pk})
+
+        response = self.app.get(url, user="testing", status=404)
+
+        self.assertEqual(404, response.status_code)
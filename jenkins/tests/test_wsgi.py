@@ -0,0 +1,145 @@
+from cStringIO import StringIO
+import json
+
+from django.test import TestCase
+
+import mock
+
+from jenkins.models import Build
+from jenkins.wsgi import NotificationWSGIHandler, NotificationDispatcher
+from .factories import JobFactory
+
+
+def get_environ(path, query_string="", body=""):
+    return {
+        "REQUEST_METHOD": "POST",
+        "PATH_INFO": path,
+        "QUERY_STRING": query_string,
+        "CONTENT_TYPE": "application/json",
+        "CONTENT_LENGTH": str(len(body)),
+        "SERVER_NAME": "testserver",
+        "SERVER_PORT": "80",
+        "wsgi.input": StringIO(body),
+        "wsgi.url_scheme": "http",
+    }
+
+
+class NotificationDispatcherTest(TestCase):
+
+    def setUp(self):
+        self.application = mock.Mock()
+        self.notification_application = mock.Mock()
+        self.dispatcher = NotificationDispatcher(
+            self.application, self.notification_application)
+
+    def test_notifications_go_to_notification_application(self):
+        """
+        Requests for the notification URLs with a token should skip the
+        application.
+        """
+        for path in ["/jenkins/notifications/",
+                     "/jenkins/notifications/batch/"]:
+            self.dispatcher(
+                get_environ(path, "server=1&token=secret"),
+                mock.sentinel.start_response)
+
+        self.assertEqual(2, self.notification_application.call_count)
+        self.assertFalse(self.application.called)
+
+    def test_notifications_without_token_go_to_application(self):
+        """
+        Notifications without a token should go through the application and
+        its middleware.
+        """
+        for query_string in ["server=1", "server=1&token="]:
+            self.dispatcher(
+                get_environ("/jenkins/notifications/", query_string),
+                mock.sentinel.start_response)
+
+        self.assertEqual(2, self.application.call_count)
+        self.assertFalse(self.notification_application.called)
+
+    def test_other_requests_go_to_application(self):
+        """
+        All other requests should go to the application.
+        """
+        environ = get_environ("/jenkins/servers/")
+        self.dispatcher(environ, mock.sentinel.start_response)
+
+        self.application.assert_called_once_with(
+            environ, mock.sentinel.start_response)
+        self.assertFalse(self.notification_application.called)
+
+
+class NotificationWSGIHandlerTest(TestCase):
+
+    def test_handle_notification(self):
+        """
+        Notifications should be handled without any of the middleware.
+        """
+        job = JobFactory.create(
+            name="mytestjob", server__notification_token="secret")
+        notification = {
+            "name": "mytestjob",
+            "build": {"phase": Build.STARTED, "number": 10}}
+        start_response = mock.Mock()
+
+        with mock.patch(
+                "django.contrib.sessions.middleware.SessionMiddleware."
+                "process_request") as mock_session:
+            NotificationWSGIHandler()(
+                get_environ(
+                    "/jenkins/notifications/",
+                    "server=%d&token=secret" % job.server.pk,
+                    json.dumps(notification)),
+                start_response)
+
+        [status, headers], _ = start_response.call_args
+        self.assertEqual("200 OK", status)
+        self.assertFalse(mock_session.called)
+        self.assertEqual(
+            [10], list(job.build_set.values_list("number", flat=True)))
+
+    def test_handle_notification_for_server_without_token(self):
+        """
+        Notifications for servers without a token should be refused without
+        the middleware.
+        """
+        job = JobFactory.create(name="mytestjob")
+        notification = {
+            "name": "mytestjob",
+            "build": {"phase": Build.STARTED, "number": 10}}
+        start_response = mock.Mock()
+
+        NotificationWSGIHandler()(
+            get_environ(
+                "/jenkins/notifications/",
+                "server=%d&token=guess" % job.server.pk,
+                json.dumps(notification)),
+            start_response)
+
+        [status, headers], _ = start_response.call_args
+        self.assertEqual("403 FORBIDDEN", status)
+        self.assertEqual(0, job.build_set.count())
+
+    def test_handle_batch_for_server_without_token(self):
+        """
+        Batched notifications for servers without a token should be rejected
+        without the middleware.
+        """
+        job = JobFactory.create(name="mytestjob")
+        notification = {
+            "name": "mytestjob",
+            "build": {"phase": Build.STARTED, "number": 10}}
+        start_response = mock.Mock()
+
+        response = NotificationWSGIHandler()(
+            get_environ(
+                "/jenkins/notifications/batch/",
+                "server=%d&token=guess" % job.server.pk,
+                json.dumps([notification])),
+            start_response)
+
+        self.assertEqual(
+            {"processed": 0, "rejected": 1}, json.loads("".join(response)))
+        self.assertEqual(0, job.build_set.count())
@@ -1,3 +1,6 @@
+import hashlib
+import threading
+from urllib import urlencode
 from urlparse import urljoin
 import xml.etree.ElementTree as ET
 
@@ -10,13 +13,22 @@ from django.utils.text import slugify
 
 PARAMETERS = ".//properties/hudson.model.ParametersDefinitionProperty/parameterDefinitions/"
 
+# The most compiled job templates that get_template will keep.
+TEMPLATE_CACHE_SIZE = 128
+
+_templates = {}
+_templates_lock = threading.Lock()
+
 
 def get_notifications_url(base, server):
     """
     Returns the full URL for notifications given a base.
     """
     url = urljoin(base, reverse("jenkins_notifications"))
-    return url + "?server=%d" % server.pk
+    url += "?server=%d" % server.pk
+    if server.notification_token:
+        url += "&" + urlencode({"token": server.notification_token})
+    return url
 
 
 def get_context_for_template(job, server):
@@ -33,11 +45,37 @@ def get_context_for_template(job, server):
     return Context(context_vars)
 
 
+def get_content_hash(content):
+    """
+    Returns a hex digest that identifies the content.
+    """
+    if isinstance(content, unicode):
+        content = content.encode("utf-8")
+    return hashlib.sha1(content).hexdigest()
+
+
+def get_template(config_xml):
+    """
+    Returns the compiled Template for the config_xml, compiling it only if
+    we haven't seen the same content before.
+    """
+    key = get_content_hash(config_xml)
+    with _templates_lock:
+        template = _templates.get(key)
+    if template is None:
+        template = Template(config_xml)
+        with _templates_lock:
+            if len(_templates) >= TEMPLATE_CACHE_SIZE:
+                _templates.clear()
+            _templates[key] = template
+    return template
+
+
 def get_job_xml_for_upload(job, server):
     """
     Return config_xml run through the template mechanism.
     """
-    template = Template(job.jobtype.config_xml)
+    template = get_template(job.jobtype.config_xml)
     context = get_context_for_template(job, server)
     # We need to strip leading/trailing whitespace in order to avoid having the
     # <?xml> PI not in the first line of the document.
@@ -56,6 +94,15 @@ def generate_job_name(jobtype):
     return "%s_%s" % (slugify(jobtype.name), timezone.now().strftime("%s"))
 
 
+def can_wait_for_results():
+    """
+    Returns True if the results of queued tasks can be fetched, which needs a
+    CELERY_RESULT_BACKEND unless the tasks run eagerly.
+    """
+    return bool(getattr(settings, "CELERY_ALWAYS_EAGER", False) or
+                getattr(settings, "CELERY_RESULT_BACKEND", None))
+
+
 class DefaultSettings(object):
     """
     Allows easy configuration of default values for a Django settings.
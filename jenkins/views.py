@@ -1,13 +1,20 @@
 import json
 import logging
 
-from django.http import HttpResponse
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse, Http404
 from django.shortcuts import get_object_or_404
 from django.views.generic import View, ListView, DetailView, TemplateView
 from braces.views import LoginRequiredMixin, CsrfExemptMixin
 
-from jenkins.models import JenkinsServer, Build, Job, JobType
-from jenkins.helpers import postprocess_build
+from jenkins.models import (
+    JenkinsServer, Build, ConsoleLog, JobType, QueuedNotification)
+from jenkins.helpers import (
+    postprocess_build, postprocess_builds, update_build_from_notification,
+    get_jobs_for_notifications, is_valid_notification)
+from jenkins.lookups import lookups
+from jenkins.wsgi import is_token_required
 
 
 class NotificationHandlerView(CsrfExemptMixin, View):
@@ -20,10 +27,13 @@ class NotificationHandlerView(CsrfExemptMixin, View):
         """
         server_pk = request.GET.get("server")
         try:
-            return JenkinsServer.objects.get(pk=server_pk)
-        except JenkinsServer.DoesNotExist:
+            server = lookups.get_server(int(server_pk))
+        except (TypeError, ValueError):
+            server = None
+        if server is None:
             logging.warn(
                 "Could not find server with Pk: %s" % server_pk)
+        return server
 
     def post(self, request, *args, **kwargs):
         """
@@ -32,46 +42,117 @@ class NotificationHandlerView(CsrfExemptMixin, View):
         server = self.get_server(request)
         if not server:
             return HttpResponse(status=412)
+        if not server.check_notification_token(
+                request.GET.get("token"), required=is_token_required(request)):
+            logging.warn("Invalid notification token for %s" % server)
+            return HttpResponse(status=403)
         notification = json.loads(request.body)
 
-        try:
-            job = server.job_set.get(name=notification["name"])
-        except Job.DoesNotExist:
+        if getattr(settings, "QUEUE_NOTIFICATIONS", False):
+            return self.queue_notification(server, notification, request.body)
+
+        job = lookups.get_job(server.pk, notification["name"])
+        if job is None:
             logging.warn(
                 "Notification for unknown job '%s'" % notification["name"])
             return HttpResponse(status=412)
 
-        build_id = ""
-        build_number = notification["build"]["number"]
-
-        # Translate the build phase name, as we may be running with an older
-        # version of the Notification plugin
-        build_phase = Build.translate_build_phase(notification["build"]["phase"])
-
-        if "parameters" in notification["build"]:
-            build_id = notification["build"]["parameters"].get("BUILD_ID")
-
-        if Build.STARTED == build_phase:
-            job.build_set.create(
-                number=build_number, build_id=build_id, phase=build_phase)
-        elif Build.FINALIZED == build_phase:
-            build_status = notification["build"]["status"]
-            build_url = notification["build"]["url"]
-            try:
-                existing_build = job.build_set.get(number=build_number)
-            except Build.DoesNotExist:
-                existing_build = job.build_set.create(
-                    number=build_number, build_id=build_id, phase=build_phase,
-                    status=build_status, url=build_url)
-            else:
-                existing_build.status = build_status
-                existing_build.phase = build_phase
-                existing_build.url = build_url
-                existing_build.save()
-            postprocess_build(existing_build)
+        build = update_build_from_notification(job, notification)
+        if build is not None:
+            postprocess_build(build)
 
         return HttpResponse(status=200)
 
+    def queue_notification(self, server, notification, payload):
+        """
+        Stores the raw notification for the process_queued_notifications
+        task to apply, without touching any builds or the broker; celery beat
+        runs the task to drain the queue.
+        """
+        if not is_valid_notification(notification):
+            logging.warn("Invalid notification from %s" % server)
+            return HttpResponse(status=400)
+        QueuedNotification.objects.create(server=server, payload=payload)
+        return HttpResponse(status=202)
+
+
+class BatchNotificationHandlerView(CsrfExemptMixin, View):
+    """
+    Handles a JSON array of Jenkins notifications in a single request.
+
+    Each notification can carry the pk of its JenkinsServer in a "server" key,
+    otherwise the server from the query string is used. Notifications for
+    servers that don't accept the token in the query string are rejected.
+    """
+
+    http_method_names = ["post"]
+
+    def get_server_pk(self, request, notification):
+        """
+        Returns the server pk for a notification in the batch, or None.
+        """
+        server_pk = notification.get("server", request.GET.get("server"))
+        try:
+            return int(server_pk)
+        except (TypeError, ValueError):
+            return
+
+    def post(self, request, *args, **kwargs):
+        """
+        Apply all the notifications in one transaction, and then queue the
+        postprocessing of any finalized builds.
+
+        Notifications without the details needed to update a build are logged
+        and rejected.
+        """
+        try:
+            notifications = json.loads(request.body)
+        except ValueError:
+            return HttpResponse(status=400)
+        if not isinstance(notifications, list):
+            return HttpResponse(status=400)
+
+        rejected = 0
+        valid_notifications = []
+        for notification in notifications:
+            if is_valid_notification(notification):
+                valid_notifications.append(notification)
+            else:
+                logging.warn("Invalid notification in batch: %r" % (
+                    notification,))
+                rejected += 1
+
+        server_names = [
+            (self.get_server_pk(request, notification), notification["name"])
+            for notification in valid_notifications]
+        known_servers, jobs = get_jobs_for_notifications(
+            server_names, token=request.GET.get("token", ""),
+            token_required=is_token_required(request))
+
+        finalized_builds = []
+        with transaction.atomic():
+            for key, notification in zip(server_names, valid_notifications):
+                if key[0] not in known_servers:
+                    logging.warn(
+                        "Could not find server with Pk: %s" % key[0])
+                    rejected += 1
+                    continue
+                job = jobs.get(key)
+                if job is None:
+                    logging.warn(
+                        "Notification for unknown job '%s'" % key[1])
+                    rejected += 1
+                    continue
+                build = update_build_from_notification(job, notification)
+                if build is not None:
+                    finalized_builds.append(build)
+
+        postprocess_builds(finalized_builds)
+        result = {"processed": len(notifications) - rejected,
+                  "rejected": rejected}
+        return HttpResponse(
+            json.dumps(result), content_type="application/json", status=200)
+
 
 class JenkinsServerListView(LoginRequiredMixin, ListView):
 
@@ -114,21 +195,109 @@ class JobTypeDetailView(LoginRequiredMixin, DetailView):
     context_object_name = "jobtype"
 
 
+# The number of bytes of console shown at a time.
+CONSOLE_WINDOW_SIZE = 64 * 1024
+MAX_CONSOLE_WINDOW_SIZE = 1024 * 1024
+
+
+def get_console_window(log, start=None, end=None, tail=None):
+    """
+    Returns a dictionary with the text of the console log between the byte
+    offsets start and end, or the last tail bytes of it.
+
+    Tails start at the beginning of a line, and windows are limited to
+    MAX_CONSOLE_WINDOW_SIZE bytes.
+    """
+    if tail is not None:
+        start = max(log.size - min(tail, MAX_CONSOLE_WINDOW_SIZE), 0)
+        end = log.size
+    else:
+        start = max(start or 0, 0)
+        if end is None:
+            end = start + CONSOLE_WINDOW_SIZE
+        end = min(end, start + MAX_CONSOLE_WINDOW_SIZE, log.size)
+    data = log.read(start, end)
+    if tail is not None and start > 0:
+        newline = data.find(b"\n")
+        if newline != -1 and newline + 1 < len(data):
+            start += newline + 1
+            data = data[newline + 1:]
+    return {
+        "start": start,
+        "end": max(start, end),
+        "size": log.size,
+        "line_count": log.line_count,
+        "text": data.decode("utf-8", "replace"),
+    }
+
+
 class BuildDetailView(LoginRequiredMixin, DetailView):
 
     model = Build
+    queryset = Build.objects.with_details()
     context_object_name = "build"
 
     def get_context_data(self, **kwargs):
         """
-        Supplement the server with the jobs for this server.
+        Supplement the build with the tail of the console log, earlier output
+        is fetched from the BuildConsoleView as needed.
         """
         context = super(
             BuildDetailView, self).get_context_data(**kwargs)
+        try:
+            context["console"] = get_console_window(
+                self.object.console, tail=CONSOLE_WINDOW_SIZE)
+        except ConsoleLog.DoesNotExist:
+            context["console"] = None
+        context["console_window_size"] = CONSOLE_WINDOW_SIZE
         return context
 
 
+class BuildConsoleView(LoginRequiredMixin, View):
+    """
+    Returns a window of the console log for a build as JSON.
+
+    The window is selected with one of:
+      ?start=<byte>&end=<byte>
+      ?start_line=<line>&end_line=<line>
+      ?tail=<bytes>
+    with the start of the log being returned by default.
+    """
+
+    http_method_names = ["get"]
+
+    def get_int(self, name):
+        value = self.request.GET.get(name)
+        if value is None:
+            return
+        try:
+            return int(value)
+        except ValueError:
+            raise Http404
+
+    def get(self, request, *args, **kwargs):
+        build = get_object_or_404(Build, pk=kwargs["pk"])
+        try:
+            log = build.console
+        except ConsoleLog.DoesNotExist:
+            raise Http404
+
+        start_line = self.get_int("start_line")
+        if start_line is not None:
+            start = log.get_line_offset(start_line)
+            end_line = self.get_int("end_line")
+            end = None if end_line is None else log.get_line_offset(end_line)
+            window = get_console_window(log, start, end)
+        else:
+            window = get_console_window(
+                log, self.get_int("start"), self.get_int("end"),
+                self.get_int("tail"))
+        return HttpResponse(
+            json.dumps(window), content_type="application/json")
+
+
 __all__ = [
-    "NotificationHandlerView", "JenkinsServerListView",
+    "NotificationHandlerView", "BatchNotificationHandlerView",
+    "JenkinsServerListView",
     "JenkinsServerDetailView", "JenkinsServerJobBuildsIndexView",
-    "JobTypeDetailView", "BuildDetailView"]
+    "JobTypeDetailView", "BuildDetailView", "BuildConsoleView"]
@@ -0,0 +1,70 @@
+from urlparse import parse_qs
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.urlresolvers import reverse, get_script_prefix
+
+
+# Set in the environ of requests handled without the middleware, which only
+# servers with a notification token may send.
+TOKEN_REQUIRED = "capomastro.notification_token_required"
+
+
+def is_token_required(request):
+    """
+    Returns True if the request must carry the server's notification token.
+    """
+    return request.META.get(TOKEN_REQUIRED, False)
+
+
+class NotificationWSGIHandler(WSGIHandler):
+    """
+    A WSGIHandler that runs none of the MIDDLEWARE_CLASSES.
+
+    The notification views are CSRF exempt, check the server's token
+    themselves, and use no sessions, users or messages. Notifications for
+    servers without a token are refused.
+    """
+
+    def __call__(self, environ, start_response):
+        environ[TOKEN_REQUIRED] = True
+        return super(NotificationWSGIHandler, self).__call__(
+            environ, start_response)
+
+    def load_middleware(self):
+        self._view_middleware = []
+        self._template_response_middleware = []
+        self._response_middleware = []
+        self._exception_middleware = []
+        # Set last, the handler uses this to tell if the middleware is loaded.
+        self._request_middleware = []
+
+
+class NotificationDispatcher(object):
+    """
+    A WSGI application that sends requests for the Jenkins notification URLs
+    that carry a token to a NotificationWSGIHandler, and everything else to
+    application.
+    """
+
+    def __init__(self, application, notification_application=None):
+        self.application = application
+        self.notification_application = (
+            notification_application or NotificationWSGIHandler())
+        self._path = None
+
+    def get_notifications_path(self):
+        """
+        Returns the path the notification URLs start with, relative to the
+        script prefix.
+        """
+        if self._path is None:
+            self._path = reverse("jenkins_notifications")[
+                len(get_script_prefix()) - 1:]
+        return self._path
+
+    def __call__(self, environ, start_response):
+        if (environ.get("PATH_INFO", "").startswith(
+                self.get_notifications_path()) and
+                parse_qs(environ.get("QUERY_STRING", "")).get("token")):
+            return self.notification_application(environ, start_response)
+        return self.application(environ, start_response)
@@ -48,6 +48,11 @@ class DependencyCreateForm(forms.ModelForm):
         help_text="Select a job type to use.")
     server = forms.ModelChoiceField(
         queryset=JenkinsServer.objects, required=True)
+    replica_servers = forms.ModelMultipleChoiceField(
+        queryset=JenkinsServer.objects, required=False,
+        widget=forms.CheckboxSelectMultiple,
+        help_text="Also create the job on these servers, and build on "
+                  "whichever is least busy.")
 
     class Meta:
         model = Dependency
@@ -60,6 +65,12 @@ class DependencyCreateForm(forms.ModelForm):
         push_job_to_jenkins.delay(job.pk)
         dependency.job = job
         dependency.save()
+        for server in self.cleaned_data["replica_servers"]:
+            if server == self.cleaned_data["server"]:
+                continue
+            replica = create_job(self.cleaned_data["jobtype"], server)
+            push_job_to_jenkins.delay(replica.pk)
+            dependency.replicas.add(replica)
         return dependency
 
 
@@ -1,3 +1,4 @@
+from jenkins.helpers import get_least_loaded_job
 from jenkins.tasks import build_job
 from projects.models import ProjectDependency
 
@@ -6,6 +7,9 @@ def build_dependency(dependency, build_id=None, user=None):
     """
     Queues a build of the job associated with the depenency along with
     any parameters that might be needed.
+
+    If the job is replicated on other servers, the build goes to the least
+    busy of them.
     """
     build_parameters = dependency.get_build_parameters()
     kwargs = {}
@@ -15,8 +19,8 @@ def build_dependency(dependency, build_id=None, user=None):
         kwargs["build_id"] = build_id
     if user:
         kwargs["user"] = user.username
-    build_job.delay(
-        dependency.job.pk, **kwargs)
+    job = get_least_loaded_job(dependency.get_jobs())
+    build_job.delay(job.pk, **kwargs)
 
 
 def build_project(project, user=None, dependencies=None, **kwargs):
@@ -17,11 +17,27 @@ def validate_parameters(value):
             "Invalid parameters entered.  Must be separated by newline.")
 
 
+class DependencyManager(models.Manager):
+
+    def for_job(self, job):
+        """
+        Returns the dependencies that are built by the job, either as their
+        job or one of its replicas.
+        """
+        return self.filter(
+            models.Q(job=job) | models.Q(replicas=job)).distinct()
+
+
 @python_2_unicode_compatible
 class Dependency(models.Model):
 
     name = models.CharField(max_length=255, unique=True)
     job = models.ForeignKey(Job, null=True)
+    # Copies of the job on other servers, any of which can build the
+    # dependency.
+    replicas = models.ManyToManyField(
+        Job, blank=True, editable=False,
+        related_name="replicated_dependency_set")
     description = models.TextField(null=True, blank=True)
     parameters = models.TextField(
         null=True, blank=True, validators=[validate_parameters])
@@ -29,17 +45,32 @@ class Dependency(models.Model):
     class Meta:
         verbose_name_plural = "dependencies"
 
+    objects = DependencyManager()
+
     def __str__(self):
         return self.name
 
+    def get_jobs(self):
+        """
+        Returns the job and its replicas.
+        """
+        if self.job is None:
+            return []
+        return [self.job] + list(
+            self.replicas.exclude(pk=self.job_id).select_related("server"))
+
     def get_current_build(self):
         """
         Return the most recent build
         """
-        if self.job is not None:
-            finished_builds = self.job.build_set.filter(phase=Build.FINALIZED)
+        builds = []
+        for job in self.get_jobs():
+            finished_builds = job.build_set.filter(phase=Build.FINALIZED)
             if finished_builds.count() > 0:
-                return finished_builds.order_by("-number")[0]
+                builds.append(finished_builds.order_by("-number")[0])
+        # Build numbers are only comparable between builds of the same job.
+        if builds:
+            return max(builds, key=lambda build: build.created_at)
 
     def get_build_parameters(self):
         """
@@ -59,11 +90,11 @@ class Dependency(models.Model):
         Returns True if we believe this dependency is currently being built
         on a server.
 
-        TODO: What happens if we never get the "FINALIZED" / "COMPLETED"
-        notifications? Status gets left as "UNKNOWN"
+        If the "FINALIZED" notification is lost, the build stays STARTED
+        until reconcile_stale_builds checks it with Jenkins.
         """
         return Build.objects.filter(
-            job=self.job, phase=Build.STARTED).exists()
+            job__in=self.get_jobs(), phase=Build.STARTED).exists()
 
 
 @python_2_unicode_compatible
@@ -6,7 +6,7 @@ from celery.utils.log import get_task_logger
 from celery import shared_task
 
 from projects.helpers import build_project
-from projects.models import ProjectBuildDependency
+from projects.models import ProjectBuildDependency, Dependency
 from jenkins.models import Build
 
 logger = get_task_logger(__name__)
@@ -22,7 +22,7 @@ def get_projectbuild_dependency_for_build(build):
     """
     if build.build_id:
         return ProjectBuildDependency.objects.filter(
-            dependency__job=build.job,
+            dependency__in=Dependency.objects.for_job(build.job),
             projectbuild__build_key=build.build_id).first()
 
 
@@ -43,12 +43,11 @@ def update_autotracked_dependencies(build):
     Find projects that use the dependency associated with this build, and if
     they're auto-tracked, update the "current_build" to be this new build.
     """
-    if build.job.dependency_set.exists():
-        for dependency in build.job.dependency_set.all():
-            for project_dependency in dependency.projectdependency_set.filter(
-                    auto_track=True):
-                project_dependency.current_build = build
-                project_dependency.save()
+    for dependency in Dependency.objects.for_job(build.job):
+        for project_dependency in dependency.projectdependency_set.filter(
+                auto_track=True):
+            project_dependency.current_build = build
+            project_dependency.save()
 
 
 def update_projectbuilds(build):
@@ -91,7 +90,7 @@ def create_projectbuilds_for_autotracking(build):
     build_dependency = get_projectbuild_dependency_for_build(build)
     # At this point, we need to identify Projects which have this
     # dependency and create ProjectBuilds for them.
-    for dependency in build.job.dependency_set.all():
+    for dependency in Dependency.objects.for_job(build.job):
         logging.debug("Processing dependency %s", dependency)
         for project_dependency in dependency.projectdependency_set.filter(
                 auto_track=True):
@@ -7,7 +7,7 @@ from projects.models import (
 from projects.helpers import (
     build_project, build_dependency)
 from .factories import ProjectFactory, DependencyFactory
-from jenkins.tests.factories import BuildFactory
+from jenkins.tests.factories import BuildFactory, JobFactory
 
 
 class BuildProjectTest(TestCase):
@@ -101,6 +101,24 @@ class BuildDependencyTest(TestCase):
 
         mock_build_job.delay.assert_called_once_with(dependency.job.pk)
 
+    def test_build_dependency_with_replicas(self):
+        """
+        build_dependency schedules the build on the least busy of the servers
+        the job is replicated on.
+        """
+        dependency = DependencyFactory.create()
+        replica = JobFactory.create(jobtype=dependency.job.jobtype)
+        dependency.replicas.add(replica)
+
+        with mock.patch("projects.helpers.build_job") as mock_build_job:
+            with mock.patch(
+                    "projects.helpers.get_least_loaded_job",
+                    return_value=replica) as mock_least_loaded:
+                build_dependency(dependency)
+
+        mock_least_loaded.assert_called_once_with([dependency.job, replica])
+        mock_build_job.delay.assert_called_once_with(replica.pk)
+
     def test_build_dependency_with_parameters(self):
         """
         build_dependency schedules the build of a dependency along with any
@@ -32,6 +32,36 @@ class DependencyTest(TestCase):
         dependency = DependencyFactory.create(job=build1.job)
         self.assertEqual(build2, dependency.get_current_build())
 
+    def test_get_current_build_with_replicas(self):
+        """
+        The most recent build from any of the replicas of the job should be
+        returned.
+        """
+        dependency = DependencyFactory.create()
+        replica = JobFactory.create()
+        dependency.replicas.add(replica)
+        BuildFactory.create(
+            job=dependency.job, number=10, phase=Build.FINALIZED)
+        build = BuildFactory.create(
+            job=replica, number=2, phase=Build.FINALIZED)
+
+        self.assertEqual(build, dependency.get_current_build())
+
+    def test_for_job(self):
+        """
+        Dependency.objects.for_job should find the dependencies built by the
+        job, or one of their replicas.
+        """
+        dependency1 = DependencyFactory.create()
+        dependency2 = DependencyFactory.create()
+        DependencyFactory.create()
+        dependency2.replicas.add(dependency1.job)
+
+        self.assertEqual(
+            [dependency1, dependency2],
+            list(Dependency.objects.for_job(
+                dependency1.job).order_by("pk")))
+
     def test_get_current_build_with_no_builds(self):
         """
         If there are no current builds for a given dependency, then we should
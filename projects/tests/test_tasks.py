@@ -8,7 +8,7 @@ from projects.models import (
     ProjectDependency, ProjectBuildDependency, ProjectBuild)
 from projects.tests.factories import DependencyFactory, ProjectFactory
 from projects.tasks import process_build_dependencies
-from jenkins.tests.factories import BuildFactory
+from jenkins.tests.factories import BuildFactory, JobFactory
 
 
 class ProcessBuildDependenciesTest(TestCase):
@@ -52,6 +52,24 @@ class ProcessBuildDependenciesTest(TestCase):
         self.assertEqual(build2, project_dependency.current_build)
         self.assertEqual(build2.pk, result)
 
+    def test_auto_track_build_from_replica(self):
+        """
+        Builds of the replicas of the job of a dependency should be tracked
+        too.
+        """
+        dependency = DependencyFactory.create()
+        replica = JobFactory.create()
+        dependency.replicas.add(replica)
+        project_dependency = ProjectDependency.objects.create(
+            project=self.project, dependency=dependency)
+
+        build = BuildFactory.create(job=replica)
+        process_build_dependencies(build.pk)
+
+        project_dependency = ProjectDependency.objects.get(
+            pk=project_dependency.pk)
+        self.assertEqual(build, project_dependency.current_build)
+
     def test_new_build_with_no_auto_track_build(self):
         """
         If we create a new build for a dependency of a Project, and the
@@ -1,9 +1,35 @@
+from datetime import timedelta
+
 from django.test import TestCase
+from django.utils import timezone
 
 from .factories import ProjectFactory, DependencyFactory
-from jenkins.tests.factories import BuildFactory
+from jenkins.models import Build
+from jenkins.tests.factories import BuildFactory, JobFactory
 from projects.models import ProjectDependency
-from projects.utils import get_build_table_for_project
+from projects.utils import (
+    get_build_table_for_project, get_recent_builds_for_dependency)
+
+
+class GetRecentBuildsForDependencyTest(TestCase):
+
+    def test_get_recent_builds_for_dependency_with_replicas(self):
+        """
+        Builds of the job and its replicas should be ordered by when they were
+        created, as their build numbers aren't comparable.
+        """
+        dependency = DependencyFactory.create()
+        replica = JobFactory.create(jobtype=dependency.job.jobtype)
+        dependency.replicas.add(replica)
+        build1 = BuildFactory.create(job=replica, number=50)
+        build2 = BuildFactory.create(job=dependency.job, number=2)
+        now = timezone.now()
+        Build.objects.filter(pk=build1.pk).update(
+            created_at=now - timedelta(hours=1))
+        Build.objects.filter(pk=build2.pk).update(created_at=now)
+
+        self.assertEqual(
+            [build2, build1], get_recent_builds_for_dependency(dependency))
 
 
 class GetBuildTableForProjectTest(TestCase):
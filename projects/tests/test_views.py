@@ -303,6 +303,30 @@ class DependencyCreateTest(WebTest):
             "MYVALUE=this is a test\nNEWVALUE=testing",
             new_dependency.parameters)
 
+    def test_create_dependency_with_replicas(self):
+        """
+        We can replicate the job of a dependency on other servers.
+        """
+        replica_server = JenkinsServerFactory.create()
+        project_url = reverse("dependency_create")
+        response = self.app.get(project_url, user="testing")
+
+        form = response.forms["dependency"]
+        form["jobtype"].select(self.jobtype.pk)
+        form["server"].select(self.server.pk)
+        form["name"].value = "My Dependency"
+        form.get("replica_servers", index=1).checked = True
+
+        with mock.patch("projects.forms.push_job_to_jenkins") as job_mock:
+            response = form.submit().follow()
+
+        new_dependency = Dependency.objects.get(name="My Dependency")
+        replica = Job.objects.get(jobtype=self.jobtype, server=replica_server)
+        self.assertEqual([replica], list(new_dependency.replicas.all()))
+        self.assertEqual(
+            [mock.call(new_dependency.job.pk), mock.call(replica.pk)],
+            job_mock.delay.call_args_list)
+
     def test_create_dependency_with_invalid_parameters(self):
         """
         If we attempt to create a dependency with invalid parameters, we should
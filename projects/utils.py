@@ -5,9 +5,13 @@ from projects.models import ProjectDependency
 def get_recent_builds_for_dependency(dependency):
     """
     Get the most recent 5 builds for a given dependency.
+
+    Build numbers are only comparable between builds of the same job, so the
+    builds of the replicas are ordered by when they were created.
     """
     return list(
-        Build.objects.filter(job=dependency.job).order_by("-number")[:5])
+        Build.objects.filter(
+            job__in=dependency.get_jobs()).order_by("-created_at")[:5])
 
 
 def get_build_for_row(builds, row):
@@ -10,7 +10,6 @@ from braces.views import (
 
 from jenkins.models import Build
 from jenkins.tasks  import delete_job_from_jenkins
-from jenkins.utils import parse_parameters_from_job
 from projects.models import (
     Project, Dependency, ProjectDependency, ProjectBuild,
     ProjectBuildDependency)
@@ -201,7 +200,7 @@ class DependencyDetailView(LoginRequiredMixin, DetailView):
         context = super(
             DependencyDetailView, self).get_context_data(**kwargs)
         context["builds"] = Build.objects.filter(
-            job=context["dependency"].job)
+            job__in=context["dependency"].get_jobs()).order_by("-created_at")
         context["projects"] = Project.objects.filter(
             dependencies=context["dependency"])
         if context["dependency"].is_building:
@@ -233,7 +232,9 @@ class ProjectDependenciesView(LoginRequiredMixin, DetailView):
         """
         Return the builds for a project dependency.
         """
-        return Build.objects.filter(job=projectdependency.dependency.job)
+        return Build.objects.filter(
+            job__in=projectdependency.dependency.get_jobs()).order_by(
+                "-created_at")
 
     def get_context_data(self, **kwargs):
         """
@@ -265,8 +266,7 @@ class DependencyUpdateView(
         """
         context = super(
             DependencyUpdateView, self).get_context_data(**kwargs)
-        params = [x for x in
-                  parse_parameters_from_job(self.object.job.jobtype.config_xml)
+        params = [x for x in self.object.job.jobtype.get_parameters()
                   if x["name"] != "BUILD_ID"]
         context["parameters"] = params
         return context
@@ -279,12 +279,14 @@ class DependencyDeleteView(
     model = Dependency
 
     def delete(self, request, *args, **kwargs):
+        jobs = self.get_object().get_jobs()
         response = super(DependencyDeleteView, self).delete(
             request, *args, **kwargs)
         messages.add_message(
         self.request, messages.INFO,
             "Dependency '%s' deleted." % self.object.name)
-        delete_job_from_jenkins.delay(self.object.job.pk)
+        for job in jobs:
+            delete_job_from_jenkins.delay(job.pk)
         return response
 
     def get_success_url(self):